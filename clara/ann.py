@@ -0,0 +1,148 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+
+ANN_INDEX_FILE_NAME = "ivf.npz"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class IVFIndex:
+    """Inverted file index for approximate cosine search.
+
+    Rows are clustered by k-means on their directions, and a query is only
+    compared with the rows of the `probes` clusters closest to it. Rows added
+    after training are assigned to the closest cluster, and deleted rows stay
+    in their cluster (the vector store masks them) until it's compacted.
+    """
+
+    def __init__(
+        self,
+        lists: Optional[int] = None,
+        probes: int = 8,
+        min_rows: int = 50000,
+        iterations: int = 10,
+        retrain_growth: float = 2.0,
+        seed: int = 0,
+    ):
+        # `None` for the square root of the rows
+        self.lists = lists
+        self.probes = probes
+        # Below this, exact search is fast enough
+        self.min_rows = min_rows
+        self.iterations = iterations
+        # Clusters are trained again once the rows grow by this factor
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self.centroids: Optional[np.ndarray] = None
+        # Cluster of each row
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._order = None
+        self._offsets = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self, rows: int) -> bool:
+        if rows < self.min_rows:
+            return False
+        return not self.is_trained or rows >= self.retrain_growth * self.trained_rows
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        return np.concatenate(
+            [
+                np.argmax(vectors[i : i + batch_size] @ self.centroids.T, axis=1)
+                for i in range(0, len(vectors), batch_size)
+            ]
+            or [np.zeros(0)]
+        ).astype(np.int32)
+
+    def train(self, vectors: np.ndarray, live: np.ndarray):
+        """Cluster the `live` rows of `vectors`, and assign all of them."""
+        random = np.random.default_rng(self.seed)
+        live_rows = np.flatnonzero(live)
+        lists = self.lists or max(1, int(np.sqrt(len(live_rows))))
+        lists = min(lists, len(live_rows))
+        # Enough rows per cluster to place it, not all of them
+        sample = np.sort(
+            random.choice(live_rows, min(len(live_rows), 64 * lists), replace=False)
+        )
+        sample = _normalize(np.asarray(vectors[sample], dtype=np.float32))
+
+        centroids = sample[random.choice(len(sample), lists, replace=False)]
+        for _ in range(self.iterations):
+            self.centroids = centroids
+            assignments = self._assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.flatnonzero(np.bincount(assignments, minlength=lists) == 0)
+            sums[empty] = sample[random.choice(len(sample), len(empty))]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids
+        self.assignments = self._assign(vectors)
+        self.trained_rows = len(live_rows)
+        self._order = None
+
+    def add(self, vectors: np.ndarray):
+        if self.is_trained:
+            self.assignments = np.concatenate([self.assignments, self._assign(vectors)])
+            self._order = None
+
+    def compact(self, rows: np.ndarray):
+        """Keep the assignments of `rows`, renumbered from 0."""
+        if self.is_trained:
+            self.assignments = self.assignments[rows]
+            self._order = None
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        """Rows in the clusters closest to the query, in ascending order."""
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable")
+            self._offsets = np.searchsorted(
+                self.assignments[self._order], np.arange(len(self.centroids) + 1)
+            )
+        scores = self.centroids @ query
+        probes = min(self.probes, len(scores))
+        lists = np.argpartition(-scores, probes - 1)[:probes]
+        return np.sort(
+            np.concatenate(
+                [self._order[self._offsets[i] : self._offsets[i + 1]] for i in lists]
+            )
+        )
+
+    def save(self, path: str, generation: int):
+        # Written aside and renamed, so it's never read half written
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            assignments=self.assignments,
+            trained_rows=self.trained_rows,
+            generation=generation,
+        )
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, generation: int) -> bool:
+        """Load the index saved for the given generation of the vectors."""
+        self.reset()
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if int(data["generation"]) != generation:
+                return False
+            self.centroids = data["centroids"]
+            self.assignments = data["assignments"]
+            self.trained_rows = int(data["trained_rows"])
+        return True
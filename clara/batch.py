@@ -0,0 +1,175 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from langchain.callbacks.base import CallbackManager
+from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from langchain.chains import LLMChain
+from langchain.schema import BaseRetriever, LLMResult
+
+from .chat import ChatChain, UsageHandler, get_model
+from .config import config
+from .embeddings import RateLimiter
+from .prompts import CONDENSE_QUESTION_PROMPT, ANSWER_QUESTION_PROMPT
+from .query_cache import QueryCache
+from .retrievers import CachedRetriever
+
+
+def read_questions(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Questions of a JSONL file, each an object with a `question` (its other
+    fields, like an `id`, are copied to the result) or just a string."""
+    questions = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise Exception(f"Invalid JSON in line {number} of the questions: {e}")
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict) or not isinstance(item.get("question"), str):
+            raise Exception(f"Line {number} of the questions has no `question` string.")
+        questions.append(item)
+    return questions
+
+
+class RateLimitHandler(StreamingStdOutCallbackHandler):
+    """Hold each request to the LLM until it's under the requests and tokens
+    per minute limits (of its prompt), and debit its completion tokens once
+    it's answered."""
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        self.limiter = limiter
+        self.count_tokens = count_tokens
+
+    @property
+    def always_verbose(self) -> bool:
+        return True
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    ):
+        tokens = (
+            sum(map(self.count_tokens, prompts)) if self.count_tokens is not None else 0
+        )
+        self.limiter.wait(tokens)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        pass
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        usage = (response.llm_output or {}).get("token_usage")
+        if usage:
+            tokens = usage.get("completion_tokens", 0)
+        elif self.count_tokens is not None:
+            tokens = sum(
+                self.count_tokens(generation.text)
+                for generations in response.generations
+                for generation in generations
+            )
+        else:
+            tokens = 0
+        self.limiter.debit(tokens)
+
+
+class BatchChat:
+    """Answer independent questions about the same index, several at a time."""
+
+    def __init__(
+        self,
+        chain: ChatChain,
+        usage_handler: UsageHandler,
+        concurrency: int = 8,
+        full_sources: bool = False,
+    ):
+        self.chain = chain
+        self.usage_handler = usage_handler
+        self.concurrency = concurrency
+        self.full_sources = full_sources
+
+    @classmethod
+    def from_config(
+        cls,
+        retriever: BaseRetriever,
+        cache: Optional[QueryCache] = None,
+        concurrency: Optional[int] = None,
+        full_sources: bool = False,
+    ) -> "BatchChat":
+        batch_config = config["batch"]
+        usage_handler = UsageHandler()
+        rate_limit_handler = RateLimitHandler(
+            RateLimiter(
+                batch_config["requests_per_minute"], batch_config["tokens_per_minute"]
+            )
+        )
+        # Not streamed, so the usage is reported
+        model = get_model(
+            callback_manager=CallbackManager([rate_limit_handler, usage_handler])
+        )
+        usage_handler.count_tokens = model.get_num_tokens
+        rate_limit_handler.count_tokens = model.get_num_tokens
+
+        if cache is not None:
+            retriever = CachedRetriever(retriever, cache)
+        chain = ChatChain(
+            condense_chain=LLMChain(llm=model, prompt=CONDENSE_QUESTION_PROMPT),
+            answer_chain=LLMChain(llm=model, prompt=ANSWER_QUESTION_PROMPT),
+            retriever=retriever,
+            cache=cache,
+        )
+        return cls(
+            chain,
+            usage_handler,
+            concurrency=concurrency or batch_config["concurrency"],
+            full_sources=full_sources,
+        )
+
+    def answer(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """The result of a question, with its error if it failed."""
+        start = time.perf_counter()
+        with self.usage_handler.track() as usage:
+            try:
+                outputs = self.chain({"question": item["question"], "chat_history": []})
+            except Exception as e:
+                return {
+                    **item,
+                    "error": str(e),
+                    "type": type(e).__name__,
+                    "latency": time.perf_counter() - start,
+                    "usage": dict(usage),
+                }
+
+        if self.full_sources:
+            sources = [
+                {"page_content": document.page_content, "metadata": document.metadata}
+                for document in outputs["source_documents"]
+            ]
+        else:
+            sources = [
+                document.metadata["source"] for document in outputs["source_documents"]
+            ]
+        return {
+            **item,
+            "answer": outputs["answer"],
+            "sources": sources,
+            "latency": time.perf_counter() - start,
+            "timings": outputs["timings"],
+            "usage": dict(usage),
+        }
+
+    def answer_all(self, items: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield the results of the questions as they're answered."""
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = [executor.submit(self.answer, item) for item in items]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # The pending questions aren't needed if the caller stops
+            executor.shutdown(cancel_futures=True)
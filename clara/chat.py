@@ -1,36 +1,149 @@
-from typing import List, Dict
-from dataclasses import dataclass
+import re
+import time
+import threading
+import contextlib
+import collections
+from typing import Any, Callable, Iterator, List, Dict, Optional, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 
+from langchain.callbacks.base import CallbackManager
+from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.chat_models import ChatOpenAI
 
 # from langchain.llms import OpenAI
 from langchain.chains import LLMChain
 from langchain.chains.base import Chain
-from langchain.memory import ConversationTokenBufferMemory
-from langchain.schema import BaseRetriever, Document, get_buffer_string
+from langchain.schema import BaseRetriever, Document, LLMResult, get_buffer_string
 
 from .config import config
-from .consts import CONDENSE_QUESTION_PROMPT, ANSWER_QUESTION_PROMPT, DEBUG
+from .consts import DEBUG
+from .context import format_context, pack_context
+from .memory import SummaryMemory
+from .prompts import (
+    CONDENSE_QUESTION_PROMPT,
+    ANSWER_QUESTION_PROMPT,
+    SUMMARIZE_HISTORY_PROMPT,
+)
 from .utils import log
+from .tracing import tracer
+from .query_cache import QueryCache, hash_key
+from .retrievers import CachedRetriever
 
 
-def get_model():
+def get_model(**kwargs):
     return ChatOpenAI(
-        model=config["llm"]["name"], temperature=config["llm"]["temperature"]
+        model=config["llm"]["name"],
+        temperature=config["llm"]["temperature"],
+        **kwargs,
     )
 
 
+class TokenStreamHandler(StreamingStdOutCallbackHandler):
+    """Send the tokens streamed by the LLM to the callback of the query."""
+
+    def __init__(self):
+        self.on_token: Optional[Callable[[str], None]] = None
+        self.first_token_time: Optional[float] = None
+
+    @property
+    def always_verbose(self) -> bool:
+        return True
+
+    def reset(self, on_token: Optional[Callable[[str], None]] = None):
+        self.on_token = on_token
+        self.first_token_time = None
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        if self.on_token is not None:
+            self.on_token(token)
+
+
+class UsageHandler(StreamingStdOutCallbackHandler):
+    """Count the requests to the LLM and their tokens in the tracer.
+
+    Streamed completions don't report their usage, so their prompts are
+    counted with `count_tokens` and their completions by streamed tokens.
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None):
+        self.count_tokens = count_tokens
+        self._request = threading.local()
+
+    @contextlib.contextmanager
+    def track(self) -> Iterator[Dict[str, int]]:
+        """Add up the usage of the requests made by this thread in the block."""
+        usage = collections.Counter()
+        self._request.usage = usage
+        try:
+            yield usage
+        finally:
+            self._request.usage = None
+
+    @property
+    def always_verbose(self) -> bool:
+        return True
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    ):
+        self._request.prompts = prompts
+        self._request.streamed_tokens = 0
+        tracer.count("llm.requests")
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        self._request.streamed_tokens += 1
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        tracked = getattr(self._request, "usage", None)
+        if not tracer.active and tracked is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage")
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        else:
+            prompt_tokens = (
+                sum(map(self.count_tokens, self._request.prompts))
+                if self.count_tokens is not None
+                else 0
+            )
+            completion_tokens = self._request.streamed_tokens
+        tracer.count("llm.prompt_tokens", prompt_tokens)
+        tracer.count("llm.completion_tokens", completion_tokens)
+        if tracked is not None:
+            tracked.update(
+                requests=1,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+            )
+
+
+def question_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the words of two questions."""
+    words_a = set(re.findall(r"\w+", a.lower()))
+    words_b = set(re.findall(r"\w+", b.lower()))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
 @dataclass
 class QueryResult:
     question: str
     answer: str
     sources: List[Document]
+    # Seconds spent in each stage
+    timings: Dict[str, float] = field(default_factory=dict)
 
 
 class ChatChain(Chain):
     condense_chain: LLMChain
     answer_chain: LLMChain
     retriever: BaseRetriever
+    cache: Optional[QueryCache] = None
 
     @property
     def input_keys(self) -> List[str]:
@@ -38,52 +151,172 @@ class ChatChain(Chain):
 
     @property
     def output_keys(self) -> List[str]:
-        return ["answer", "question", "source_documents"]
+        return ["answer", "question", "source_documents", "timings"]
 
-    def _call(self, inputs: Dict[str, str]) -> Dict[str, str]:
-        chat_history = get_buffer_string(
-            inputs["chat_history"], human_prefix="Human", ai_prefix="Assistant"
-        )
-        condensate_output = self.condense_chain.run(
-            {
-                "chat_history": chat_history,
-                "question": inputs["question"],
-            }
-        )
-        log("Condensated answer:", condensate_output)
-        documents = self.retriever.get_relevant_documents(condensate_output)
-        context = "---\n".join(
-            [
-                f"{document.page_content}\nSOURCE: {document.metadata['source']}\n"
-                for document in documents
-            ]
+    def _cached(self, level: str, key: Any, compute: Callable[[], Any]) -> Any:
+        if self.cache is None:
+            return compute()
+
+        value = self.cache.get(level, key)
+        if value is None:
+            value = compute()
+            self.cache.put(level, key, value)
+        else:
+            log(f"Cached {level}:", value)
+        return value
+
+    @staticmethod
+    def _timed(timings: Dict[str, float], stage: str, function, *args) -> Any:
+        with tracer.span(f"chat.{stage}") as span:
+            try:
+                return function(*args)
+            finally:
+                timings[stage] = time.perf_counter() - span.start
+
+    def _condense_and_retrieve(
+        self, chat_history: str, question: str, model: List[Any]
+    ) -> Tuple[str, List[Document], Dict[str, float]]:
+        """Condense the question with the chat history and retrieve documents.
+
+        Documents are retrieved for the raw question while it is condensed,
+        and kept if the condensed question is similar enough.
+        """
+        timings = {}
+        key = [model, chat_history, question]
+        condensed = self.cache.get("condense", key) if self.cache is not None else None
+        if condensed is not None:
+            documents = self._timed(
+                timings, "retrieval", self.retriever.get_relevant_documents, condensed
+            )
+            return condensed, documents, timings
+
+        def condense() -> str:
+            output = self.condense_chain.run(
+                {"chat_history": chat_history, "question": question}
+            )
+            if self.cache is not None:
+                self.cache.put("condense", key, output)
+            return output
+
+        if not config["llm"]["condense"]["speculative_retrieval"]:
+            condensed = self._timed(timings, "condense", condense)
+            documents = self._timed(
+                timings, "retrieval", self.retriever.get_relevant_documents, condensed
+            )
+            return condensed, documents, timings
+
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=1)
+        speculative = executor.submit(
+            self._timed,
+            timings,
+            "speculative_retrieval",
+            self.retriever.get_relevant_documents,
+            question,
         )
-        answer_output = self.answer_chain.run(
-            {
-                "context": context,
-                # "question": condensate_output,
-                "question": inputs["question"],
-            }
+        # Don't wait for a discarded retrieval
+        executor.shutdown(wait=False)
+        condensed = self._timed(timings, "condense", condense)
+
+        similarity = question_similarity(question, condensed)
+        log(f"Condensed question similarity: {similarity:.2f}")
+        if similarity >= config["llm"]["condense"]["min_similarity"]:
+            documents = speculative.result()
+            timings["saved"] = (
+                timings["condense"]
+                + timings["speculative_retrieval"]
+                - (time.perf_counter() - start)
+            )
+        else:
+            documents = self._timed(
+                timings, "retrieval", self.retriever.get_relevant_documents, condensed
+            )
+
+        return condensed, documents, timings
+
+    def _call(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with tracer.span("chat"):
+            return self._answer(inputs)
+
+    def _answer(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        question = inputs["question"]
+        model = [config["llm"]["name"], config["llm"]["temperature"]]
+
+        chat_history = inputs["chat_history"]
+        if chat_history:
+            # Messages, or already formatted by the memory
+            if not isinstance(chat_history, str):
+                chat_history = get_buffer_string(
+                    chat_history, human_prefix="Human", ai_prefix="Assistant"
+                )
+            condensate_output, documents, timings = self._condense_and_retrieve(
+                chat_history, question, model
+            )
+            log("Condensated answer:", condensate_output)
+        else:
+            # Nothing to condense in the first question
+            timings = {}
+            documents = self._timed(
+                timings, "retrieval", self.retriever.get_relevant_documents, question
+            )
+
+        with tracer.span("chat.context", documents=len(documents)) as span:
+            documents = pack_context(documents, config["llm"]["context_tokens"])
+            context = format_context(documents)
+            span.attributes["packed"] = len(documents)
+            span.attributes["characters"] = len(context)
+        answer_output = self._timed(
+            timings,
+            "answer",
+            self._cached,
+            "answer",
+            [model, question, hash_key(context)],
+            lambda: self.answer_chain.run(
+                {
+                    "context": context,
+                    # "question": condensate_output,
+                    "question": question,
+                }
+            ),
         )
+        timings["total"] = time.perf_counter() - start
         return {
             "answer": answer_output,
-            "question": inputs["question"],
+            "question": question,
             "source_documents": documents,
+            "timings": timings,
         }
 
 
 class Chat:
-    def __init__(self, retriever: BaseRetriever):
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        cache: Optional[QueryCache] = None,
+        history_path: Optional[str] = None,
+    ):
+        """With a `history_path`, the chat history is kept there to be resumed."""
+        self.cache = cache
+        self.history_path = history_path
+        if cache is not None:
+            retriever = CachedRetriever(retriever, cache)
         self.retriever = retriever
         self._create_chat()
 
     def _create_chat(self):
-        model = get_model()
+        usage_handler = UsageHandler()
+        model = get_model(callback_manager=CallbackManager([usage_handler]))
+        usage_handler.count_tokens = model.get_num_tokens
 
-        self.chat_history = ConversationTokenBufferMemory(
-            llm=model,
-            max_token_limit=config["llm"]["chat_history"]["token_limit"],
-            return_messages=True,
+        history_config = config["llm"]["chat_history"]
+        self.chat_history = SummaryMemory(
+            summary_chain=LLMChain(llm=model, prompt=SUMMARIZE_HISTORY_PROMPT),
+            count_tokens=model.get_num_tokens,
+            token_limit=history_config["token_limit"],
+            summarize_to=history_config["summarize_to"],
+            path=self.history_path,
+            model=config["llm"]["name"],
         )
 
         condense_chain = LLMChain(
@@ -91,8 +324,12 @@ class Chat:
             prompt=CONDENSE_QUESTION_PROMPT,
             verbose=DEBUG,
         )
+        self.stream_handler = TokenStreamHandler()
         answer_chain = LLMChain(
-            llm=model,
+            llm=get_model(
+                streaming=True,
+                callback_manager=CallbackManager([self.stream_handler, usage_handler]),
+            ),
             prompt=ANSWER_QUESTION_PROMPT,
             verbose=DEBUG,
         )
@@ -101,21 +338,39 @@ class Chat:
             condense_chain=condense_chain,
             answer_chain=answer_chain,
             retriever=self.retriever,
+            cache=self.cache,
         )
 
-    def query(self, query: str) -> QueryResult:
-        response = self.chat(
-            {
-                "question": query,
-                "chat_history": self.chat_history.load_memory_variables({})["history"],
-            }
-            # {"question": query, "chat_history": ""}
-        )
-        self.chat_history.save_context(
-            {"input": response["question"]}, {"output": response["answer"]}
+    def query(
+        self, query: str, on_token: Optional[Callable[[str], None]] = None
+    ) -> QueryResult:
+        """Answer a question, calling `on_token` with each token of the answer
+        as it's generated (not called for cached answers)."""
+        start = time.perf_counter()
+        chat_history = self.chat_history.history
+        self.stream_handler.reset(on_token)
+        try:
+            response = self.chat(
+                {"question": query, "chat_history": chat_history}
+                # {"question": query, "chat_history": ""}
+            )
+        finally:
+            self.stream_handler.on_token = None
+        self.chat_history.save_context(response["question"], response["answer"])
+        if self.stream_handler.first_token_time is not None:
+            response["timings"]["first_token"] = (
+                self.stream_handler.first_token_time - start
+            )
+        log(
+            "Timings:",
+            ", ".join(
+                f"{stage}: {seconds:.2f}s"
+                for stage, seconds in response["timings"].items()
+            ),
         )
         return QueryResult(
             question=response["question"],
             answer=response["answer"],
             sources=response["source_documents"],
+            timings=response["timings"],
         )
@@ -1,27 +1,35 @@
 import os
+import json
+import shutil
 import pathlib
 import logging
+import functools
+import contextlib
+from typing import Callable, Union
 
 import fire
 from rich.prompt import Confirm
-from rich.markdown import Markdown
-from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
-import click
-from openai.error import InvalidRequestError
 
-from .consts import HELP_MESSAGE, CONFIG_PATH
+from .consts import HELP_MESSAGE, CONFIG_PATH, SERVER_SOCKET_PATH
 from .console import console
-from .index import RepositoryIndex
-from .chat import Chat
-
+from .paths import get_persist_path
+from .server import is_server_running, query_server, run_server
 
 # Disable warnings
 logging.getLogger().setLevel(logging.ERROR)
 
 
-def setup(path: str, memory_storage: bool) -> RepositoryIndex:
-    index = RepositoryIndex(path, in_memory=memory_storage)
+def load_index(
+    path: str, memory_storage: bool, jobs: int = None, workspace: str = None
+):
+    if workspace is not None:
+        return load_workspace(workspace, jobs)
+
+    # langchain, chromadb, openai and the parsers take most of the start up
+    # time, so they're only imported by the commands that need them
+    from .index import RepositoryIndex
+
+    index = RepositoryIndex(path, in_memory=memory_storage, jobs=jobs)
 
     with console.status(
         f"Ingesting code repository from path: [blue underline]{path} …",
@@ -35,33 +43,138 @@ def setup(path: str, memory_storage: bool) -> RepositoryIndex:
     ):
         index.persist()
 
-    chat = Chat(retriever=index.get_retriever())
+    return index
+
+
+def load_workspace(workspace: str, jobs: int = None):
+    from .workspace import get_workspace
+
+    index = get_workspace(workspace, jobs)
+    with console.status(
+        f"Ingesting workspace [blue underline]{workspace} …", spinner="weather"
+    ) as status:
+        index.ingest(
+            on_repository=lambda path: status.update(
+                f"Ingesting code repository from path: [blue underline]{path} …"
+            )
+        )
+    return index
+
+
+def setup(
+    path: str,
+    memory_storage: bool,
+    jobs: int = None,
+    workspace: str = None,
+    resume: bool = False,
+):
+    from .chat import Chat
+    from .memory import MEMORY_FILE_NAME
+
+    index = load_index(path, memory_storage, jobs, workspace)
+    history_path = None
+    if resume:
+        # Next to the prompt history of the chat
+        history_path = os.path.join(index.persist_path, MEMORY_FILE_NAME)
+    chat = Chat(
+        retriever=index.get_retriever(),
+        cache=index.get_query_cache(),
+        history_path=history_path,
+    )
 
     return index, chat
 
 
+def print_answer(query: Callable, question: str, markdown_render: bool = True):
+    """Query the chat, rendering the answer while it's streamed."""
+    from rich.markdown import Markdown
+    from rich.live import Live
+    from rich.spinner import Spinner
+    from rich.text import Text
+
+    render = Markdown if markdown_render else Text
+    tokens = []
+
+    with Live(
+        Spinner("weather", "Querying…"),
+        console=console,
+        vertical_overflow="visible",
+    ) as live:
+
+        def on_token(token: str):
+            tokens.append(token)
+            live.update(render("".join(tokens)))
+
+        result = query(question, on_token=on_token)
+        live.update(render(result.answer))
+
+    return result
+
+
+def print_profile(tracer):
+    from rich.table import Table
+
+    table = Table("Stage", "Calls", "Total (s)", "Mean (ms)", "Max (ms)")
+    for stage in tracer.summary():
+        table.add_row(
+            "  " * stage["name"].count(".") + stage["name"],
+            str(stage["calls"]),
+            f"{stage['total']:.3f}",
+            f"{1000 * stage['total'] / stage['calls']:.1f}",
+            f"{1000 * stage['max']:.1f}",
+        )
+    console.print(table)
+
+    if tracer.counters:
+        table = Table("Counter", "Value")
+        for name, value in sorted(tracer.counters.items()):
+            table.add_row(name, f"{value:g}")
+        console.print(table)
+
+
+@contextlib.contextmanager
+def profiling(profile: Union[bool, str]):
+    """With `--profile`, time the stages of the command and print them at the
+    end, saving the trace too with `--profile=PATH`."""
+    if not profile:
+        yield
+        return
+
+    from .tracing import tracer
+
+    tracer.start()
+    try:
+        yield
+    finally:
+        tracer.stop()
+        console.print()
+        print_profile(tracer)
+        if isinstance(profile, str):
+            tracer.save(profile)
+            console.print(f"Trace saved to [blue underline]{profile}")
+
+
 class Clara:
     """CLARA: Code Language Assistant & Repository Analyzer"""
 
     def config(self, path: str = "."):
         """Show config for a given path."""
-        index = RepositoryIndex(path)
         console.print(f"Configuration path (global) = [blue underline]{CONFIG_PATH}")
         console.print(
             "Data persistence path (for this project) = "
-            f"[blue underline]{index.persist_path}"
+            f"[blue underline]{get_persist_path(path)}"
         )
 
     def clean(self, path: str = "."):
         """Delete vector DB for a given path."""
-        index = RepositoryIndex(path)
+        persist_path = get_persist_path(path)
         if Confirm.ask(
             "Are you sure you want to remove "
-            f"[blue underline]{index.persist_path}[/blue underline]? "
+            f"[blue underline]{persist_path}[/blue underline]? "
             "This will remove the vector DB and the chat history for this code.",
             default=False,
         ):
-            index.clean()
+            shutil.rmtree(persist_path)
 
     def ask(
         self,
@@ -71,17 +184,53 @@ class Clara:
         markdown_render: bool = True,
         sources: bool = True,
         full_sources: bool = False,
+        jobs: int = None,
+        workspace: str = None,
+        profile: Union[bool, str] = False,
     ):
-        """Ask a question about the code from the command-line."""
-        index, chat = setup(path, memory_storage)
+        """Ask a question about the code from the command-line.
+
+        Answered by `clara serve` if it's running (unless profiling)."""
+        with profiling(profile):
+            self._ask(
+                question,
+                path,
+                memory_storage,
+                markdown_render,
+                sources,
+                full_sources,
+                jobs,
+                workspace,
+                profile,
+            )
+
+    def _ask(
+        self,
+        question,
+        path: str,
+        memory_storage: bool,
+        markdown_render: bool,
+        sources: bool,
+        full_sources: bool,
+        jobs: int,
+        workspace: str,
+        profile: Union[bool, str],
+    ):
+        from openai.error import InvalidRequestError
+
+        if (
+            not memory_storage
+            and workspace is None
+            and not profile
+            and is_server_running()
+        ):
+            query = functools.partial(query_server, path)
+        else:
+            index, chat = setup(path, memory_storage, jobs, workspace)
+            query = chat.query
 
         try:
-            with console.status("Querying…", spinner="weather"):
-                result = chat.query(question)
-            if markdown_render:
-                console.print(Markdown(result.answer))
-            else:
-                console.print(result.answer)
+            result = print_answer(query, question, markdown_render)
             console.print()
             console.print("[yellow]SOURCES[/yellow]")
             if sources:
@@ -100,13 +249,87 @@ class Clara:
         finally:
             pass
 
-    def chat(self, path: str = ".", memory_storage: bool = False):
+    def ask_batch(
+        self,
+        questions: str,
+        output: str,
+        path: str = ".",
+        memory_storage: bool = False,
+        full_sources: bool = False,
+        concurrency: int = None,
+        jobs: int = None,
+        workspace: str = None,
+        profile: Union[bool, str] = False,
+    ):
+        """Answer the questions of a JSONL file, several at a time.
+
+        Each answer is written to the `output` JSONL file as it's ready."""
+        with profiling(profile):
+            from .batch import BatchChat, read_questions
+
+            with open(questions) as f:
+                items = read_questions(f)
+            index = load_index(path, memory_storage, jobs, workspace)
+            batch_chat = BatchChat.from_config(
+                index.get_retriever(),
+                index.get_query_cache(),
+                concurrency=concurrency,
+                full_sources=full_sources,
+            )
+
+            errors = 0
+            tokens = 0
+            with open(output, "w") as f, console.status(
+                f"Answering {len(items)} questions…", spinner="weather"
+            ) as status:
+                for answered, result in enumerate(
+                    batch_chat.answer_all(items), start=1
+                ):
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    f.flush()
+                    if "error" in result:
+                        errors += 1
+                        console.log(
+                            ":warning: Error answering "
+                            f"{result['question']!r}: {result['error']}"
+                        )
+                    tokens += sum(
+                        result["usage"].get(key, 0)
+                        for key in ("prompt_tokens", "completion_tokens")
+                    )
+                    status.update(f"Answered {answered}/{len(items)} questions…")
+
+            console.print(
+                f"Answered {len(items) - errors} questions ({errors} errors, "
+                f"{tokens} tokens) in [blue underline]{output}"
+            )
+
+    def chat(
+        self,
+        path: str = ".",
+        memory_storage: bool = False,
+        jobs: int = None,
+        workspace: str = None,
+        profile: Union[bool, str] = False,
+    ):
         """Chat about the code."""
-        index, chat = setup(path, memory_storage)
+        with profiling(profile):
+            self._chat(path, memory_storage, jobs, workspace)
+
+    def _chat(self, path: str, memory_storage: bool, jobs: int, workspace: str):
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.history import FileHistory
+        import click
+        from openai.error import InvalidRequestError
+
+        index, chat = setup(path, memory_storage, jobs, workspace, resume=True)
 
         console.rule("[bold blue]CHAT")
         console.print("Hi, I'm Clara!", ":scroll::mag::robot:")
-        console.print("How can I help you?")
+        if chat.chat_history.is_empty():
+            console.print("How can I help you?")
+        else:
+            console.print("Let's continue where we left off. /reset to start over.")
         console.print()
 
         last_sources = []
@@ -138,6 +361,10 @@ class Clara:
                         continue
                     elif query in ("/exit", "/quit"):
                         break
+                    elif query == "/reset":
+                        chat.chat_history.clear()
+                        console.print("The chat history was cleared.")
+                        continue
                     elif query == "/edit":
                         query = click.edit()
                         query = query.strip()
@@ -151,10 +378,8 @@ class Clara:
                         continue
 
                 try:
-                    with console.status("Querying…", spinner="weather"):
-                        result = chat.query(query)
                     console.print()
-                    console.print(Markdown(result.answer))
+                    result = print_answer(chat.query, query)
                     console.print()
                     console.print("[yellow]SOURCES[/yellow]")
                     for source in result.sources:
@@ -175,6 +400,21 @@ class Clara:
             console.print()
             console.print("Bye!", ":wave:")
 
+    def index(
+        self,
+        path: str = ".",
+        jobs: int = None,
+        workspace: str = None,
+        profile: Union[bool, str] = False,
+    ):
+        """Index the code, without asking anything."""
+        with profiling(profile):
+            load_index(path, memory_storage=False, jobs=jobs, workspace=workspace)
+
+    def serve(self, socket_path: str = SERVER_SOCKET_PATH):
+        """Keep indexes loaded, to answer `clara ask` without starting up."""
+        run_server(socket_path)
+
 
 def main():
     fire.Fire(Clara())
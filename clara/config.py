@@ -11,14 +11,136 @@ defaults = {
         "temperature": 0,
         "chat_history": {
             "token_limit": 3500,
+            # Older messages are summarized when over the limit, down to
+            # this many tokens (with the summary)
+            "summarize_to": 2000,
+        },
+        # Of the retrieved chunks in the prompt of the answer, the rest are
+        # left out (overlapping chunks are merged first)
+        "context_tokens": 2500,
+        "condense": {
+            # Retrieve documents for the question while it's condensed
+            "speculative_retrieval": True,
+            # Keep them if the words of both questions are this similar
+            "min_similarity": 0.6,
         },
     },
     "index": {
         # "search_type": "similarity",
         "search_type": "mmr",
         "k": 6,
-        "chunk_size": 3000,
-        "chunk_overlap": 200,
+        # Only for mmr: candidates fetched, and weight of their relevance to
+        # the question over their diversity (0 to 1)
+        "mmr": {
+            "fetch_k": 20,
+            "lambda_mult": 0.5,
+        },
+        # In tokens, so that the `k` chunks fit in `llm.context_tokens`
+        "chunk_size": 400,
+        # Only between chunks cut inside a statement or paragraph
+        "chunk_overlap": 50,
+        # Processes loading and parsing files, `null` to use every CPU
+        "jobs": None,
+        # Chunks embedded and stored together
+        "upsert_batch_size": 500,
+        # Batches stored between checkpoints of the vector DB
+        "checkpoint_interval": 20,
+        "embeddings": {
+            # openai, or sentence-transformers to compute them locally
+            "provider": "openai",
+            # For sentence-transformers, the name or the local path of a model
+            "model": "text-embedding-ada-002",
+            # `null` for the default OpenAI endpoint
+            "api_base": None,
+            # Limits of each request
+            "batch_tokens": 50000,
+            "batch_size": 1000,
+            # Requests in flight at the same time
+            "concurrency": 4,
+            "requests_per_minute": 3000,
+            "tokens_per_minute": 1000000,
+            "max_retries": 6,
+            # Only for local models
+            "local": {
+                "batch_size": 64,
+                # Batches encoded at the same time, `null` for one per CPU
+                "threads": None,
+                "device": "cpu",
+                # e.g. onnx, `null` for the default of sentence-transformers
+                "backend": None,
+            },
+        },
+        # chroma, or numpy to keep the vectors in a memory-mapped matrix
+        "vectorstore": "chroma",
+        # Approximate search (IVF), only for the numpy vector store
+        "ann": {
+            "enabled": False,
+            # Indexed once there are this many chunks
+            "min_rows": 50000,
+            # Clusters, `null` for the square root of the chunks
+            "lists": None,
+            # Clusters searched per question: more for recall, less for speed
+            "probes": 8,
+            # Of the k-means clustering
+            "iterations": 10,
+            # Clustered again when the chunks grow by this factor
+            "retrain_growth": 2.0,
+        },
+        # Only for the numpy vector store
+        "quantization": {
+            # float32, float16, or int8 (with a scale per vector)
+            "type": "float32",
+            # Keep the float32 vectors too, to re-score the best candidates
+            "rescore": False,
+            # Candidates re-scored, per chunk retrieved
+            "rescore_factor": 4,
+        },
+        "embeddings_cache": {
+            "enabled": True,
+            # In MB
+            "max_size": 1024,
+        },
+        # Fuse the results of a BM25 index of the identifiers in the code
+        "hybrid": {
+            "enabled": True,
+            # Chunks retrieved by the lexical index before fusing
+            "fetch_k": 20,
+            # Reciprocal rank fusion constant
+            "rrf_k": 60,
+        },
+    },
+    # Of `--workspace`
+    "workspace": {
+        # Vector DBs kept open, estimated by the size of their files, in MB
+        "memory_budget": 4096,
+        # Repositories searched at the same time
+        "concurrency": 8,
+    },
+    # Of `clara serve`
+    "server": {
+        # Seconds between updates of the indexes with the changed files, done
+        # in the background while answering from the loaded one
+        "refresh_interval": 30,
+    },
+    # Of `clara ask-batch`
+    "batch": {
+        # Questions answered at the same time
+        "concurrency": 8,
+        # Limits of the requests to the LLM
+        "requests_per_minute": 3500,
+        "tokens_per_minute": 90000,
+    },
+    "tracing": {
+        # `module:attribute` of classes receiving every span and counter, e.g.
+        # to forward them to your own telemetry (see `clara.tracing`)
+        "hooks": [],
+    },
+    # Condensed questions, retrieved chunks and answers, per repository
+    "query_cache": {
+        "enabled": True,
+        # In seconds
+        "ttl": 7 * 24 * 60 * 60,
+        "max_entries": 10000,
     },
 }
 
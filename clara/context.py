@@ -0,0 +1,131 @@
+from typing import List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from .splitter import TOKENS_KEY
+
+
+# An overlap shorter than this (without spaces) may be shared by chance, like
+# a closing brace
+MIN_OVERLAP_CHARACTERS = 20
+
+
+def estimate_tokens(text: str) -> int:
+    # Code has around 3 characters per token, an overestimate for prose
+    return len(text) // 3 + 1
+
+
+def get_tokens(document: Document) -> int:
+    """Tokens counted when the chunk was indexed, or estimated."""
+    tokens = document.metadata.get(TOKENS_KEY)
+    return tokens if tokens is not None else estimate_tokens(document.page_content)
+
+
+def _join(first: str, second: str) -> Optional[Tuple[str, int]]:
+    """Join two texts whose lines overlap (the end of `first` with the start
+    of `second`), returning the joined text and the characters of `second`
+    added to it."""
+    first_lines = first.split("\n")
+    second_lines = second.split("\n")
+    for start in range(max(0, len(first_lines) - len(second_lines)), len(first_lines)):
+        size = len(first_lines) - start
+        if first_lines[start:] != second_lines[:size]:
+            continue
+        if len("".join(first_lines[start:]).replace(" ", "")) < MIN_OVERLAP_CHARACTERS:
+            return None
+        rest = "\n".join(second_lines[size:])
+        return f"{first}\n{rest}", len(rest)
+    return None
+
+
+def combine(a: Document, b: Document) -> Optional[Document]:
+    """A document with the text of both, if they're from the same source and
+    one contains or overlaps the other."""
+    if a.metadata.get("source") != b.metadata.get("source"):
+        return None
+    if b.page_content in a.page_content:
+        return a
+    if a.page_content in b.page_content:
+        return b
+
+    joined = _join(a.page_content, b.page_content)
+    added, tokens = b, get_tokens(a)
+    if joined is None:
+        joined = _join(b.page_content, a.page_content)
+        added, tokens = a, get_tokens(b)
+    if joined is None:
+        return None
+
+    text, characters = joined
+    # Proportional to the characters added
+    tokens += round(get_tokens(added) * characters / max(1, len(added.page_content)))
+    return Document(page_content=text, metadata={**a.metadata, TOKENS_KEY: tokens})
+
+
+def merge_documents(documents: List[Document]) -> List[Document]:
+    """Drop the chunks contained in others and join the overlapping ones of
+    the same source, in the order of the most relevant of each."""
+    merged: List[Tuple[int, Document]] = []
+    for rank, document in enumerate(documents):
+        # A joined chunk may overlap another one too
+        combined = True
+        while combined:
+            combined = False
+            for i, (other_rank, other) in enumerate(merged):
+                joined = combine(other, document)
+                if joined is not None:
+                    del merged[i]
+                    rank, document = min(rank, other_rank), joined
+                    combined = True
+                    break
+        merged.append((rank, document))
+    return [document for _, document in sorted(merged, key=lambda item: item[0])]
+
+
+def format_document(document: Document) -> str:
+    return f"{document.page_content}\nSOURCE: {document.metadata['source']}\n"
+
+
+def _truncate(document: Document, token_budget: int) -> Document:
+    tokens = get_tokens(document)
+    text = document.page_content[
+        : len(document.page_content) * token_budget // max(1, tokens)
+    ]
+    # Whole lines, unless the first one is too long
+    if "\n" in text:
+        text = text[: text.rindex("\n")]
+    return Document(
+        page_content=text,
+        metadata={**document.metadata, TOKENS_KEY: min(tokens, token_budget)},
+    )
+
+
+def _get_overhead(document: Document) -> int:
+    # Of the source and the separator
+    return estimate_tokens(f"\nSOURCE: {document.metadata['source']}\n---\n")
+
+
+def pack_context(documents: List[Document], token_budget: int) -> List[Document]:
+    """The documents to answer with, merged and within `token_budget` tokens
+    once formatted.
+
+    The most relevant documents that fit are kept. If not even the first one
+    fits, it's cut.
+    """
+    merged = merge_documents(documents)
+    packed = []
+    tokens = 0
+    for document in merged:
+        document_tokens = get_tokens(document) + _get_overhead(document)
+        if tokens + document_tokens <= token_budget:
+            packed.append(document)
+            tokens += document_tokens
+
+    if not packed and merged:
+        first = merged[0]
+        packed.append(_truncate(first, max(1, token_budget - _get_overhead(first))))
+    return packed
+
+
+def format_context(documents: List[Document]) -> str:
+    return "---\n".join(format_document(document) for document in documents)
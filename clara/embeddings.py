@@ -0,0 +1,544 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import pathlib
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+import openai
+import openai.error
+from langchain.embeddings.base import Embeddings
+
+from .config import config
+from .consts import EMBEDDINGS_CACHE_PATH
+from .utils import log
+from .tracing import tracer
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of embeddings keyed by (model, SHA-256 of the text).
+
+    It is shared by every repository, so identical chunks are embedded only
+    once. The least recently used entries are evicted when the stored vectors
+    exceed `max_size` bytes.
+    """
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        pathlib.Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used "
+            "ON embeddings (last_used)"
+        )
+        self._connection.commit()
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        hashes = list(set(hashes))
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            # Keep queries under SQLite's limit of host parameters
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    "SELECT hash, vector FROM embeddings "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for text_hash, vector in rows:
+                    found[text_hash] = array("f", vector).tolist()
+                self._connection.execute(
+                    "UPDATE embeddings SET last_used = ? "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [now, model, *batch],
+                )
+            self._connection.commit()
+
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, List[float]]]):
+        now = time.time()
+        rows = []
+        for text_hash, vector in items:
+            blob = array("f", vector).tobytes()
+            rows.append((model, text_hash, blob, len(blob), now))
+
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(model, hash, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._connection.commit()
+            self._evict()
+
+    def _evict(self):
+        (total_size,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()
+        if total_size <= self.max_size:
+            return
+
+        excess = total_size - self.max_size
+        rows = self._connection.execute(
+            "SELECT rowid, size FROM embeddings ORDER BY last_used, rowid"
+        )
+        evicted = []
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((rowid,))
+            excess -= size
+        self._connection.executemany("DELETE FROM embeddings WHERE rowid = ?", evicted)
+        self._connection.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            (total_size,) = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+        return total_size
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self.size(),
+        }
+
+
+def batch_by_tokens(
+    token_counts: List[int], max_tokens: int, max_size: int
+) -> List[List[int]]:
+    """Pack consecutive texts into batches of at most `max_tokens` tokens and
+    `max_size` texts, returning the indices of the texts of each batch."""
+    batches = []
+    batch = []
+    batch_tokens = 0
+
+    for i, tokens in enumerate(token_counts):
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_size):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute.
+
+    Both buckets refill continuously; `pause` stops every request for a while,
+    when the API says the limits were hit anyway.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = requests_per_minute
+        self.tokens = tokens_per_minute
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self.updated_at) / 60
+        self.updated_at = now
+        self.requests = min(
+            self.requests_per_minute,
+            self.requests + elapsed_minutes * self.requests_per_minute,
+        )
+        self.tokens = min(
+            self.tokens_per_minute,
+            self.tokens + elapsed_minutes * self.tokens_per_minute,
+        )
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _take(self, tokens: int) -> float:
+        """Take a request and `tokens` from the buckets, returning 0, or the
+        seconds to wait if they aren't available yet."""
+        # A request bigger than the limit can't wait for a fuller bucket
+        tokens = min(tokens, self.tokens_per_minute)
+
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+
+            self._refill()
+            if self.requests >= 1 and self.tokens >= tokens:
+                self.requests -= 1
+                self.tokens -= tokens
+                return 0
+
+            wait = max(
+                (1 - self.requests) / self.requests_per_minute,
+                (tokens - self.tokens) / self.tokens_per_minute,
+            )
+            return wait * 60
+
+    def debit(self, tokens: int):
+        """Take `tokens` used after a request was made, like those of its
+        completion, even if that leaves the bucket in debt."""
+        with self._lock:
+            self._refill()
+            self.tokens -= tokens
+
+    async def acquire(self, tokens: int):
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def wait(self, tokens: int):
+        """Like `acquire`, for requests made from threads."""
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class BatchedOpenAIEmbeddings(Embeddings):
+    """OpenAI embeddings sent in token-sized batches, several at a time.
+
+    Requests are throttled to stay under the requests and tokens per minute
+    limits, and retried with exponential backoff on rate limit and server
+    errors.
+    """
+
+    RETRY_ERRORS = (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.APIError,
+        openai.error.APIConnectionError,
+        openai.error.Timeout,
+    )
+
+    def __init__(
+        self,
+        model: str = "text-embedding-ada-002",
+        batch_tokens: int = 50000,
+        batch_size: int = 1000,
+        concurrency: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1000000,
+        max_retries: int = 6,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        self.model = model
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.api_base = api_base
+        self.api_key = api_key
+        self._count_tokens = count_tokens
+        self.stats = {"requests": 0, "retries": 0, "tokens": 0}
+        # Shared by every call, so the limits hold across batches
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    def count_tokens(self, text: str) -> int:
+        if self._count_tokens is None:
+            import tiktoken
+
+            encoding = tiktoken.encoding_for_model(self.model)
+            self._count_tokens = lambda text: len(
+                encoding.encode(text, disallowed_special=())
+            )
+        return self._count_tokens(text)
+
+    async def _request(
+        self,
+        texts: List[str],
+        tokens: int,
+        limiter: RateLimiter,
+        semaphore: asyncio.Semaphore,
+    ) -> List[List[float]]:
+        attempt = 0
+
+        while True:
+            await limiter.acquire(tokens)
+            try:
+                async with semaphore:
+                    response = await openai.Embedding.acreate(
+                        input=texts,
+                        model=self.model,
+                        api_base=self.api_base,
+                        api_key=self.api_key,
+                    )
+            except self.RETRY_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                tracer.count("embeddings.retries")
+
+                retry_after = None
+                if e.headers:
+                    retry_after = e.headers.get("retry-after")
+                delay = (
+                    float(retry_after)
+                    if retry_after
+                    else min(60, 2**attempt) * (0.5 + random.random() / 2)
+                )
+                log(f"Embeddings request failed ({e}), retrying in {delay:.1f}s")
+                if isinstance(e, openai.error.RateLimitError):
+                    limiter.pause(delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self.stats["requests"] += 1
+            self.stats["tokens"] += tokens
+            tracer.count("embeddings.requests")
+            tracer.count("embeddings.tokens", tokens)
+            data = sorted(response["data"], key=lambda item: item["index"])
+            return [item["embedding"] for item in data]
+
+    async def aembed_documents(
+        self, texts: List[str], token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
+        if token_counts is None:
+            token_counts = [self.count_tokens(text) for text in texts]
+
+        batches = batch_by_tokens(token_counts, self.batch_tokens, self.batch_size)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with aiohttp.ClientSession() as session:
+            openai.aiosession.set(session)
+            try:
+                results = await asyncio.gather(
+                    *[
+                        self._request(
+                            [texts[i] for i in batch],
+                            sum(token_counts[i] for i in batch),
+                            self.limiter,
+                            semaphore,
+                        )
+                        for batch in batches
+                    ]
+                )
+            finally:
+                openai.aiosession.set(None)
+
+        return [vector for result in results for vector in result]
+
+    def embed_documents(
+        self, texts: List[str], token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
+        if not texts:
+            return []
+        return asyncio.run(self.aembed_documents(texts, token_counts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """Embeddings computed locally with a sentence-transformers model.
+
+    `model` is the name or the local path of the model, so it can run without
+    network access. Batches are encoded by several threads at a time. The
+    model is only loaded when something is first embedded.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        batch_size: int = 64,
+        threads: Optional[int] = None,
+        device: str = "cpu",
+        backend: Optional[str] = None,
+    ):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "Could not import sentence_transformers, required by the "
+                "`sentence-transformers` embeddings provider. "
+                "Install it with `pip install clara-ai[local]`."
+            )
+
+        kwargs = {"device": device}
+        if backend is not None:
+            # e.g. "onnx" (sentence-transformers >= 3.2)
+            kwargs["backend"] = backend
+        self.model = model
+        self.batch_size = batch_size
+        self.threads = threads or os.cpu_count() or 1
+        self._model_class = SentenceTransformer
+        self._model_kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._model_class(self.model, **self._model_kwargs)
+            return self._client
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self.client.encode(
+            texts,
+            batch_size=len(texts),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        ).tolist()
+
+    def embed_documents(
+        self, texts: List[str], token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) <= 1 or self.threads == 1:
+            return [vector for batch in batches for vector in self._encode(batch)]
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            return [
+                vector
+                for vectors in executor.map(self._encode, batches)
+                for vector in vectors
+            ]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an embedding function, only calling it for texts not in the cache."""
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(
+        self, texts: List[str], token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
+        hashes = [hash_text(text) for text in texts]
+        vectors = self.cache.get_many(self.model, hashes)
+
+        missing = {}
+        missing_token_counts = []
+        for i, (text_hash, text) in enumerate(zip(hashes, texts)):
+            if text_hash not in vectors and text_hash not in missing:
+                missing[text_hash] = text
+                if token_counts is not None:
+                    missing_token_counts.append(token_counts[i])
+        tracer.count("embeddings.cache_hits", len(texts) - len(missing))
+        tracer.count("embeddings.cache_misses", len(missing))
+
+        if missing:
+            kwargs = {}
+            if token_counts is not None:
+                kwargs["token_counts"] = missing_token_counts
+            embedded = self.embeddings.embed_documents(list(missing.values()), **kwargs)
+            new_vectors = list(zip(missing.keys(), embedded))
+            self.cache.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Query embeddings may be computed differently than document ones
+        model = f"{self.model}:query"
+        text_hash = hash_text(text)
+        vectors = self.cache.get_many(model, [text_hash])
+        if text_hash in vectors:
+            return vectors[text_hash]
+
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(model, [(text_hash, vector)])
+        return vector
+
+
+def get_embeddings_model() -> str:
+    """Identifier of the configured embeddings, e.g. to key cached vectors."""
+    embeddings_config = config["index"]["embeddings"]
+    if embeddings_config["provider"] == "openai":
+        return embeddings_config["model"]
+    return f"{embeddings_config['provider']}:{embeddings_config['model']}"
+
+
+def get_embeddings() -> Embeddings:
+    embeddings_config = config["index"]["embeddings"]
+    provider = embeddings_config["provider"]
+    if provider == "openai":
+        embeddings = BatchedOpenAIEmbeddings(
+            model=embeddings_config["model"],
+            batch_tokens=embeddings_config["batch_tokens"],
+            batch_size=embeddings_config["batch_size"],
+            concurrency=embeddings_config["concurrency"],
+            requests_per_minute=embeddings_config["requests_per_minute"],
+            tokens_per_minute=embeddings_config["tokens_per_minute"],
+            max_retries=embeddings_config["max_retries"],
+            api_base=embeddings_config["api_base"],
+        )
+    elif provider == "sentence-transformers":
+        local_config = embeddings_config["local"]
+        embeddings = SentenceTransformerEmbeddings(
+            model=embeddings_config["model"],
+            batch_size=local_config["batch_size"],
+            threads=local_config["threads"],
+            device=local_config["device"],
+            backend=local_config["backend"],
+        )
+    else:
+        raise ValueError(f"Unknown embeddings provider: {provider}")
+
+    cache_config = config["index"]["embeddings_cache"]
+    if not cache_config["enabled"]:
+        return embeddings
+
+    cache = EmbeddingCache(
+        EMBEDDINGS_CACHE_PATH, max_size=cache_config["max_size"] * 1024 * 1024
+    )
+    return CachedEmbeddings(embeddings, model=get_embeddings_model(), cache=cache)
@@ -1,19 +1,21 @@
+import io
 import os
 import pathlib
-import hashlib
+import uuid
 import shutil
-from typing import List, Optional
+import collections
+import multiprocessing
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from abc import ABC, abstractmethod
-import glob
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
 import ast
 
-from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.indexes.vectorstore import VectorStoreIndexWrapper
-from langchain.vectorstores import Chroma
 from langchain.document_loaders import TextLoader
 from langchain.docstore.document import Document
 from langchain.document_loaders.base import BaseLoader
-from langchain.text_splitter import CharacterTextSplitter
+from langchain.embeddings.base import Embeddings
 from langchain.schema import BaseRetriever
 import tokenize
 
@@ -22,10 +24,20 @@ import nbformat
 
 from .consts import (
     WILDCARDS,
-    BASE_PERSIST_PATH,
 )
 from .config import config
 from .console import console
+from .utils import prefetch
+from .tracing import Span, Tracer, tracer
+from .walker import walk_repository
+from .paths import get_persist_path
+from .manifest import Manifest
+from .embeddings import CachedEmbeddings, get_embeddings, get_embeddings_model
+from .splitter import CodeTextSplitter, BOUNDARIES_KEY, TOKENS_KEY
+from .lexical import LexicalIndex, LEXICAL_INDEX_FILE_NAME
+from .retrievers import HybridRetriever
+from .vectorstore import get_vectorstore
+from .query_cache import QueryCache, QUERY_CACHE_FILE_NAME, hash_key
 
 
 class LanguageParsing(ABC):
@@ -44,46 +56,141 @@ class LanguageParsing(ABC):
         raise NotImplementedError  # pragma: no cover
 
 
-class PythonParsing(LanguageParsing):
+@dataclass
+class ParsedCode:
+    functions_classes: List[str]
+    simplified_code: str
+    # Lines (0-based) where each text can be split, with their nesting depth
+    functions_classes_boundaries: List[Dict[int, int]]
+    simplified_code_boundaries: Dict[int, int]
+
+
+class SourceCodeParsing(LanguageParsing):
+    """Parse the code once, keeping the syntax tree, and produce both the
+    functions and classes and the simplified code in a single traversal."""
+
+    comment_prefix = "#"
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.source_lines = self.code.splitlines()
+        self._tree = None
+        self._is_valid = None
+        self._parsed_code = None
+
+    @abstractmethod
+    def _parse(self):
+        """Return the syntax tree, raising `SyntaxError` if it isn't valid."""
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def _get_statements(self, tree) -> Iterator[Tuple[Any, int, int, bool]]:
+        """Yield each top-level statement, with its (0-based) first and
+        (exclusive) last line, and whether it is a function or class."""
+        raise NotImplementedError  # pragma: no cover
+
+    @abstractmethod
+    def _get_boundaries(self, node, depth: int = 1) -> Iterator[Tuple[int, int]]:
+        """Yield the (0-based) first line and depth of the statements nested
+        in a node."""
+        raise NotImplementedError  # pragma: no cover
+
+    @property
+    def tree(self):
+        if self._is_valid is None:
+            try:
+                self._tree = self._parse()
+                self._is_valid = True
+            except SyntaxError:
+                self._is_valid = False
+        return self._tree
 
     def is_valid(self) -> bool:
-        try:
-            ast.parse(self.code)
-            return True
-        except SyntaxError:
-            return False
+        self.tree
+        return self._is_valid
 
-    def _extract_code(self, node) -> str:
-        start = node.lineno - 1
-        end = node.end_lineno
-        return "\n".join(self.source_lines[start:end])
+    def parse(self) -> ParsedCode:
+        if self._parsed_code is not None:
+            return self._parsed_code
 
-    def extract_functions_classes(self) -> List[str]:
-        tree = ast.parse(self.code)
         functions_classes = []
+        functions_classes_boundaries = []
+        simplified_lines = []
+        simplified_boundaries = {}
+        line_num = 0
+
+        for node, start, end, is_definition in self._get_statements(self.tree):
+            if is_definition:
+                functions_classes.append("\n".join(self.source_lines[start:end]))
+                functions_classes_boundaries.append(
+                    {
+                        line - start: depth
+                        for line, depth in self._get_boundaries(node)
+                        if start < line < end
+                    }
+                )
+            if start < line_num:
+                # Another statement in the same line, already simplified
+                continue
 
-        for node in ast.iter_child_nodes(tree):
-            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
-                functions_classes.append(self._extract_code(node))
+            # Comments and blank lines before the statement go with it
+            simplified_boundaries[len(simplified_lines)] = 0
+            simplified_lines.extend(self.source_lines[line_num:start])
 
-        return functions_classes
+            if is_definition:
+                simplified_lines.append(
+                    f"{self.comment_prefix} Code for: {self.source_lines[start]}"
+                )
+            else:
+                offset = len(simplified_lines) - start
+                for line, depth in self._get_boundaries(node):
+                    if start < line < end:
+                        simplified_boundaries.setdefault(line + offset, depth)
+                simplified_lines.extend(self.source_lines[start:end])
+            line_num = end
+
+        if line_num < len(self.source_lines):
+            simplified_boundaries[len(simplified_lines)] = 0
+            simplified_lines.extend(self.source_lines[line_num:])
+        simplified_boundaries.pop(0, None)
+
+        self._parsed_code = ParsedCode(
+            functions_classes=functions_classes,
+            simplified_code="\n".join(simplified_lines),
+            functions_classes_boundaries=functions_classes_boundaries,
+            simplified_code_boundaries=simplified_boundaries,
+        )
+        return self._parsed_code
+
+    def extract_functions_classes(self) -> List[str]:
+        return self.parse().functions_classes
 
     def simplify_code(self) -> str:
-        tree = ast.parse(self.code)
-        simplified_lines = self.source_lines[:]
+        return self.parse().simplified_code
 
-        for node in ast.iter_child_nodes(tree):
-            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
-                start = node.lineno - 1
-                simplified_lines[start] = f"# Code for: {simplified_lines[start]}"
 
-                for line_num in range(start + 1, node.end_lineno):
-                    simplified_lines[line_num] = None
+class PythonParsing(SourceCodeParsing):
+    def _parse(self):
+        return ast.parse(self.code)
 
-        return "\n".join(line for line in simplified_lines if line is not None)
+    def _get_statements(self, tree) -> Iterator[Tuple[Any, int, int, bool]]:
+        for node in ast.iter_child_nodes(tree):
+            is_definition = isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            )
+            yield node, node.lineno - 1, node.end_lineno, is_definition
+
+    def _get_boundaries(self, node, depth: int = 1) -> Iterator[Tuple[int, int]]:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.stmt, ast.excepthandler)):
+                # Decorators go with the decorated function or class
+                decorators = getattr(child, "decorator_list", [])
+                yield min(
+                    [child.lineno] + [decorator.lineno for decorator in decorators]
+                ) - 1, depth
+                yield from self._get_boundaries(child, depth + 1)
+            elif isinstance(child, getattr(ast, "match_case", ())):
+                yield from self._get_boundaries(child, depth)
 
 
 class NotebookParsing(PythonParsing):
@@ -93,6 +200,10 @@ class NotebookParsing(PythonParsing):
             nbformat.reads(self.code, as_version=4)
         )
 
+    def is_valid(self) -> bool:
+        # Already validated when read
+        return True
+
     def extract_functions_classes(self) -> List[str]:
         return []
 
@@ -112,52 +223,37 @@ class NotebookParsing(PythonParsing):
         return "\n\n".join(markdown_output)
 
 
-class JavascriptParsing(LanguageParsing):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.source_lines = self.code.splitlines()
+class JavascriptParsing(SourceCodeParsing):
+    comment_prefix = "//"
 
-    def is_valid(self) -> bool:
+    def _parse(self):
         try:
-            esprima.parseScript(self.code)
-            return True
-        except esprima.Error:
-            return False
-
-    def _extract_code(self, node) -> str:
-        start = node.loc.start.line - 1
-        end = node.loc.end.line
-        return "\n".join(self.source_lines[start:end])
-
-    def extract_functions_classes(self) -> List[str]:
-        tree = esprima.parseScript(self.code, loc=True)
-        functions_classes = []
+            return esprima.parseScript(self.code, loc=True)
+        except esprima.Error as e:
+            raise SyntaxError(str(e)) from e
 
+    def _get_statements(self, tree) -> Iterator[Tuple[Any, int, int, bool]]:
         for node in tree.body:
-            if isinstance(
+            is_definition = isinstance(
                 node,
                 (esprima.nodes.FunctionDeclaration, esprima.nodes.ClassDeclaration),
-            ):
-                functions_classes.append(self._extract_code(node))
-
-        return functions_classes
-
-    def simplify_code(self) -> str:
-        tree = esprima.parseScript(self.code, loc=True)
-        simplified_lines = self.source_lines[:]
-
-        for node in tree.body:
-            if isinstance(
-                node,
-                (esprima.nodes.FunctionDeclaration, esprima.nodes.ClassDeclaration),
-            ):
-                start = node.loc.start.line - 1
-                simplified_lines[start] = f"// Code for: {simplified_lines[start]}"
-
-                for line_num in range(start + 1, node.loc.end.line):
-                    simplified_lines[line_num] = None
-
-        return "\n".join(line for line in simplified_lines if line is not None)
+            )
+            yield node, node.loc.start.line - 1, node.loc.end.line, is_definition
+
+    def _get_boundaries(self, node, depth: int = 1) -> Iterator[Tuple[int, int]]:
+        for value in vars(node).values():
+            children = value if isinstance(value, list) else [value]
+            for child in children:
+                if not isinstance(child, esprima.nodes.Node):
+                    continue
+                if child.type != "BlockStatement" and (
+                    child.type.endswith(("Statement", "Declaration"))
+                    or child.type == "MethodDefinition"
+                ):
+                    yield child.loc.start.line - 1, depth
+                    yield from self._get_boundaries(child, depth + 1)
+                else:
+                    yield from self._get_boundaries(child, depth)
 
 
 LANGUAGE_PARSERS = {
@@ -184,12 +280,19 @@ class CodeLoader(BaseLoader):
 
     def __init__(self, file_path: str, encoding: Optional[str] = None):
         """Initialize with file path."""
-        if encoding is None:
-            with open(file_path, "rb") as f:
-                encoding, _ = tokenize.detect_encoding(f.readline)
         self.file_path = file_path
         self.encoding = encoding
 
+    def _read(self) -> str:
+        # Read only once, detecting the encoding from the bytes already read
+        with open(self.file_path, "rb") as f:
+            data = f.read()
+        encoding = self.encoding
+        if encoding is None:
+            encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+        # Same as reading in text mode, with universal newlines
+        return data.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+
     @staticmethod
     def get_extension(file_path: str) -> str:
         _, file_extension = os.path.splitext(file_path)
@@ -204,8 +307,7 @@ class CodeLoader(BaseLoader):
 
     def load(self) -> List[Document]:
         """Load from file path."""
-        with open(self.file_path, encoding=self.encoding) as f:
-            code = f.read()
+        code = self._read()
         documents = []
         extension = self._get_extension()
         Parser = LANGUAGE_PARSERS[extension]["parser"]
@@ -214,109 +316,472 @@ class CodeLoader(BaseLoader):
         parser = Parser(code)
         if not parser.is_valid():
             return [Document(page_content=code, metadata={"source": self.file_path})]
-        for functions_classes in parser.extract_functions_classes():
+        if isinstance(parser, SourceCodeParsing):
+            parsed_code = parser.parse()
+            functions_classes_boundaries = parsed_code.functions_classes_boundaries
+            simplified_code_boundaries = parsed_code.simplified_code_boundaries
+        else:
+            functions_classes_boundaries = None
+            simplified_code_boundaries = None
+
+        for i, functions_classes in enumerate(parser.extract_functions_classes()):
+            metadata = {
+                "source": self.file_path,
+                "file_type": file_type,
+                "content_type": "functions_classes",
+                "language": language,
+            }
+            if functions_classes_boundaries is not None:
+                metadata[BOUNDARIES_KEY] = functions_classes_boundaries[i]
             documents.append(
-                Document(
-                    page_content=functions_classes,
-                    metadata={
-                        "source": self.file_path,
-                        "file_type": file_type,
-                        "content_type": "functions_classes",
-                        "language": language,
-                    },
-                )
+                Document(page_content=functions_classes, metadata=metadata)
             )
+
+        metadata = {
+            "source": self.file_path,
+            "file_type": file_type,
+            "content_type": "simplified_code",
+            "language": language,
+        }
+        if simplified_code_boundaries is not None:
+            metadata[BOUNDARIES_KEY] = simplified_code_boundaries
         documents.append(
-            Document(
-                page_content=parser.simplify_code(),
-                metadata={
-                    "source": self.file_path,
-                    "file_type": file_type,
-                    "content_type": "simplified_code",
-                    "language": language,
-                },
-            )
+            Document(page_content=parser.simplify_code(), metadata=metadata)
         )
         return documents
 
 
+@dataclass
+class LoadedFile:
+    file_path: str
+    documents: List[Document]
+    error: Optional[str] = None
+    # Of loading and splitting it, maybe in a worker process
+    spans: List[Span] = field(default_factory=list)
+
+
+_text_splitter = None
+
+
+def get_text_splitter() -> CodeTextSplitter:
+    # One per process, creating the tiktoken encoder is not free
+    global _text_splitter
+
+    if _text_splitter is None:
+        _text_splitter = CodeTextSplitter.from_tiktoken_encoder(
+            chunk_size=config["index"]["chunk_size"],
+            chunk_overlap=config["index"]["chunk_overlap"],
+            # Same tokens as the OpenAI embeddings, so the counts can be reused
+            model_name=(
+                config["index"]["embeddings"]["model"]
+                if config["index"]["embeddings"]["provider"] == "openai"
+                else "text-embedding-ada-002"
+            ),
+        )
+    return _text_splitter
+
+
+def _init_worker(text_splitter: CodeTextSplitter):
+    # Workers don't inherit the state of the parent process (and its patches
+    # in the tests), they get the splitter from it
+    global _text_splitter
+
+    _text_splitter = text_splitter
+
+
+def get_mp_context() -> multiprocessing.context.BaseContext:
+    """Start method of the processes loading files. Forking a process with
+    threads (like the prefetching one, or the server) may deadlock."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # Imported once by the server, instead of by every worker
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def load_file(file_path: str) -> LoadedFile:
+    """Load, parse and split a file, catching errors so they are per file."""
+    file_tracer = Tracer(recording=True)
+    try:
+        if CodeLoader.has_loader(file_path):
+            loader = CodeLoader(file_path)
+        else:
+            loader = TextLoader(file_path)
+        with file_tracer.span("ingest.load", file=file_path):
+            loaded = loader.load()
+        with file_tracer.span("ingest.split", file=file_path) as span:
+            documents = get_text_splitter().split_documents(loaded)
+            span.attributes["chunks"] = len(documents)
+        return LoadedFile(
+            file_path=file_path, documents=documents, spans=file_tracer.spans
+        )
+    except Exception as e:
+        return LoadedFile(
+            file_path=file_path,
+            documents=[],
+            error=f"{type(e).__name__}: {e}",
+            spans=file_tracer.spans,
+        )
+
+
 class RepositoryIndex:
-    def __init__(self, path: str, in_memory: bool = False):
+    def __init__(
+        self,
+        path: str,
+        in_memory: bool = False,
+        jobs: Optional[int] = None,
+        embeddings: Optional[Embeddings] = None,
+    ):
         self.path = os.path.abspath(path)
         self.index = None
         self.in_memory = in_memory
+        self.jobs = jobs or config["index"]["jobs"] or os.cpu_count() or 1
+        # Built once and reused by every ingest and load, as a local model
+        # is slow to load
+        self.embeddings = embeddings
         self.persist_path = self.get_persist_path()
+        self.manifest = None
+        self.lexical_index = None
 
     def get_persist_path(self) -> str:
-        hashed_path = hashlib.sha256(str(self.path).encode("utf-8")).hexdigest()
-        short_hash = hashed_path[:8]
-        base_name = os.path.basename(self.path)
-        return os.path.join(BASE_PERSIST_PATH, f"{base_name}_{short_hash}")
-
-    def _get_texts(self):
-        def get_files_by_wildcards(path: str, wildcards: List[str]) -> List[str]:
-            matched_files = []
+        return get_persist_path(self.path)
 
-            for wc in wildcards:
-                pattern = os.path.join(path, "**", wc)
-                matched_files.extend(glob.glob(pattern, recursive=True))
-
-            return matched_files
+    def _get_embeddings(self) -> Embeddings:
+        if self.embeddings is None:
+            self.embeddings = get_embeddings()
+        return self.embeddings
 
+    def _get_files(self) -> Iterator[str]:
         if not os.path.exists(self.path):
             raise Exception(f"Path does not exists: {self.path}")
 
-        documents = []
-        for file_path in get_files_by_wildcards(self.path, WILDCARDS):
-            # Skip if the path is a directory
-            if not os.path.isfile(file_path):
+        return walk_repository(self.path, WILDCARDS)
+
+    def _load_files(self, file_paths: Iterable[str]) -> Iterator[LoadedFile]:
+        if self.jobs == 1:
+            yield from map(load_file, file_paths)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.jobs,
+            mp_context=get_mp_context(),
+            initializer=_init_worker,
+            initargs=(get_text_splitter(),),
+        ) as executor:
+            # A bounded window of pending files, yielded in order
+            pending = collections.deque()
+            for file_path in file_paths:
+                pending.append(executor.submit(load_file, file_path))
+                if len(pending) >= self.jobs * 4:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _get_batches(
+        self, file_paths: Iterable[str]
+    ) -> Iterator[Tuple[List[str], List[str], List[Document]]]:
+        """Group the chunks of the loaded files in batches to upsert.
+
+        Batches hold whole files, and are closed once they have at least
+        `index.upsert_batch_size` chunks. Each batch is the loaded files,
+        the files that failed to load and the chunks.
+        """
+        batch_size = config["index"]["upsert_batch_size"]
+        batch_files = []
+        failed_files = []
+        batch_documents = []
+
+        for loaded_file in prefetch(self._load_files(file_paths), self.jobs * 4):
+            for span in loaded_file.spans:
+                tracer.record(span)
+            if loaded_file.error is not None:
+                tracer.count("ingest.errors")
+                console.log(
+                    ":warning: Error loading "
+                    f"[blue underline]{loaded_file.file_path}[/blue underline]: "
+                    f"{loaded_file.error}"
+                )
+                failed_files.append(loaded_file.file_path)
                 continue
+            console.log(f"Loaded [blue underline]{loaded_file.file_path}")
+            tracer.count("ingest.files")
+            batch_files.append(loaded_file.file_path)
+            batch_documents.extend(loaded_file.documents)
+
+            if len(batch_documents) >= batch_size:
+                yield batch_files, failed_files, batch_documents
+                batch_files = []
+                failed_files = []
+                batch_documents = []
+
+        if batch_files or failed_files:
+            yield batch_files, failed_files, batch_documents
+
+    def _get_texts(self, file_paths: Iterable[str]) -> List[Document]:
+        return [
+            document
+            for _, _, documents in self._get_batches(file_paths)
+            for document in documents
+        ]
+
+    def _upsert(self, vectorstore, embeddings, documents: List[Document]):
+        if not documents:
+            return
+        ids = [str(uuid.uuid1()) for _ in documents]
+        texts = [document.page_content for document in documents]
+        token_counts = [document.metadata[TOKENS_KEY] for document in documents]
+        tracer.count("ingest.chunks", len(documents))
+        tracer.count("ingest.tokens", sum(token_counts))
+        with tracer.span("ingest.embed", chunks=len(documents)):
+            vectors = embeddings.embed_documents(texts, token_counts=token_counts)
+        self._check_embeddings(vectorstore, embeddings_dimension=len(vectors[0]))
+        with tracer.span("ingest.upsert", chunks=len(documents)):
+            vectorstore.add_vectors(
+                ids, vectors, texts, [document.metadata for document in documents]
+            )
+            self.lexical_index.add(
+                ids, [document.metadata["source"] for document in documents], texts
+            )
 
-            console.log(f"Loading [blue underline]{file_path}", "…")
-            if CodeLoader.has_loader(file_path):
-                loader = CodeLoader(file_path)
-            else:
-                loader = TextLoader(file_path)
-            documents.extend(loader.load_and_split())
+    def _check_embeddings(self, vectorstore, **expected: Any):
+        """Record the embeddings the vector DB is built with in its metadata,
+        refusing to use it with different ones."""
+        stored_metadata = vectorstore.get_metadata()
+        metadata = dict(stored_metadata)
+        for key, value in expected.items():
+            stored = metadata.setdefault(key, value)
+            if stored != value:
+                raise Exception(
+                    f"The index was built with {key} = {stored}, but "
+                    f"{value} is configured. Run `clara clean` to remove it."
+                )
+        if metadata != stored_metadata:
+            vectorstore.set_metadata(metadata)
 
-        text_splitter = CharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=config["index"]["chunk_size"],
-            chunk_overlap=config["index"]["chunk_overlap"],
-            disallowed_special=(),
+    def _rebuild_lexical_index(self, vectorstore):
+        ids, texts, metadatas = vectorstore.get_all()
+        self.lexical_index.add(
+            ids, [metadata["source"] for metadata in metadatas], texts
         )
-        return text_splitter.split_documents(documents)
-
-    def ingest(self):
-        if not self.in_memory:
-            if os.path.exists(self.persist_path):
-                vectorstore = Chroma(
-                    persist_directory=self.persist_path,
-                    embedding_function=OpenAIEmbeddings(disallowed_special=()),
-                )
-                self.index = VectorStoreIndexWrapper(vectorstore=vectorstore)
-                return
+        self.lexical_index.commit()
+
+    def _walk(self) -> List[str]:
+        with tracer.span("ingest.walk") as span:
+            file_paths = list(self._get_files())
+            span.attributes["files"] = len(file_paths)
+        return file_paths
+
+    def _update_ann_index(self, vectorstore):
+        with tracer.span("ingest.ann_index"):
+            vectorstore.update_ann_index()
+
+    def ingest(self) -> bool:
+        """Index the files of the repository, returning whether the index
+        changed.
+
+        Can be called again to update the index with the changes in the files.
+        """
+        with tracer.span("ingest", path=self.path):
+            return self._ingest()
+
+    def _ingest(self) -> bool:
+        embeddings = self._get_embeddings()
+
+        if self.in_memory:
+            self.lexical_index = LexicalIndex()
+            vectorstore = get_vectorstore(embeddings)
+            for _, _, documents in self._get_batches(self._walk()):
+                self._upsert(vectorstore, embeddings, documents)
+            self.index = VectorStoreIndexWrapper(vectorstore=vectorstore)
+            self._log_embeddings_stats(embeddings)
+            return True
 
+        if self.index is None:
             pathlib.Path(self.persist_path).mkdir(parents=True, exist_ok=True)
+            vectorstore = get_vectorstore(embeddings, self.persist_path)
+            self.index = VectorStoreIndexWrapper(vectorstore=vectorstore)
+            self.lexical_index = LexicalIndex(
+                os.path.join(self.persist_path, LEXICAL_INDEX_FILE_NAME)
+            )
+        vectorstore = self.index.vectorstore
+        self.manifest = Manifest.load(self.persist_path)
+        vectorstore_type = config["index"]["vectorstore"]
+        if (
+            not self.manifest.exists()
+            or self.manifest.vectorstore not in (None, vectorstore_type)
+            or (self.manifest.files and not vectorstore.count())
+        ):
+            # Vector DBs created before the manifest existed can't be diffed,
+            # and after changing `index.vectorstore` the manifest is of the
+            # other one (older manifests don't record it, but then this one
+            # is empty)
+            self.manifest = Manifest(self.manifest.path)
+            vectorstore.clear()
+            self.lexical_index.delete_all()
+        elif self.lexical_index.size() == 0 and self.manifest.complete:
+            # Vector DBs created before the lexical index existed
+            console.log("Building lexical index")
+            self._rebuild_lexical_index(vectorstore)
+        self._check_embeddings(vectorstore, embeddings_model=get_embeddings_model())
+        self.manifest.vectorstore = vectorstore_type
+
+        resuming = not self.manifest.complete
+        file_paths = self._walk()
+        diff = self.manifest.update(file_paths)
+        console.log(
+            f"Files added: {len(diff.added)}, changed: {len(diff.changed)}, "
+            f"removed: {len(diff.removed)}, unchanged: {len(diff.unchanged)}"
+        )
+        if diff.is_empty() and not resuming:
+            if diff.refreshed:
+                # Not persisted by the caller, but the touched files shouldn't
+                # be hashed again on every run
+                self.manifest.save()
+            self._update_ann_index(vectorstore)
+            self._log_embeddings_stats(embeddings)
+            return False
 
-        texts = self._get_texts()
-        self.index = VectorStoreIndexWrapper(
-            vectorstore=Chroma.from_documents(
-                texts,
-                OpenAIEmbeddings(disallowed_special=()),
-                persist_directory=self.persist_path if not self.in_memory else None,
+        to_delete = diff.to_delete
+        if resuming:
+            # The last ingestion was interrupted, the vectors of the files it
+            # didn't commit may be partially stored
+            console.log("Resuming interrupted ingestion")
+            stored_sources = vectorstore.get_sources()
+            to_delete = sorted(stored_sources - set(diff.unchanged))
+            self.lexical_index.delete(set(to_delete) | set(diff.to_index))
+
+        # Flag the ingestion as in progress before touching the vector DB
+        self.manifest.complete = False
+        self.manifest.save()
+
+        vectorstore.delete_sources(to_delete)
+        self.lexical_index.delete(to_delete)
+
+        checkpoint_interval = config["index"]["checkpoint_interval"]
+        for batch_number, (batch_files, failed_files, documents) in enumerate(
+            self._get_batches(diff.to_index), start=1
+        ):
+            self._upsert(vectorstore, embeddings, documents)
+            self.manifest.commit(batch_files, failed=failed_files)
+            if batch_number % checkpoint_interval == 0:
+                console.log(f"Checkpoint, {len(self.manifest.files)} files stored")
+                self._checkpoint()
+
+        self._update_ann_index(vectorstore)
+        self._log_embeddings_stats(embeddings)
+        return True
+
+    def is_up_to_date(self) -> bool:
+        """Whether the stored index has the files as they are, checked without
+        opening it (only the files whose size or mtime changed are read)."""
+        if self.in_memory:
+            return False
+        manifest = Manifest.load(self.persist_path)
+        if (
+            not manifest.exists()
+            or not manifest.complete
+            or manifest.vectorstore != config["index"]["vectorstore"]
+            or not os.path.exists(
+                os.path.join(self.persist_path, LEXICAL_INDEX_FILE_NAME)
             )
+        ):
+            return False
+        diff = manifest.update(self._walk())
+        if not diff.is_empty():
+            return False
+        if diff.refreshed:
+            manifest.save()
+        return True
+
+    def load(self):
+        """Open the stored index, without updating it."""
+        if self.index is not None:
+            return
+        manifest = Manifest.load(self.persist_path)
+        if not manifest.exists():
+            raise Exception(
+                f"{self.path} is not indexed, run `clara index {self.path}` first."
+            )
+        if manifest.vectorstore not in (None, config["index"]["vectorstore"]):
+            raise Exception(
+                f"{self.path} is indexed in {manifest.vectorstore}, run "
+                f"`clara index {self.path}` to index it again."
+            )
+        vectorstore = get_vectorstore(self._get_embeddings(), self.persist_path)
+        self._check_embeddings(vectorstore, embeddings_model=get_embeddings_model())
+        self.index = VectorStoreIndexWrapper(vectorstore=vectorstore)
+        self.lexical_index = LexicalIndex(
+            os.path.join(self.persist_path, LEXICAL_INDEX_FILE_NAME)
         )
+        self.manifest = manifest
+
+    def close(self):
+        """Release the stored index, to be opened again by `load`."""
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        self.index = None
+        self.lexical_index = None
+        self.manifest = None
+
+    def _log_embeddings_stats(self, embeddings):
+        if isinstance(embeddings, CachedEmbeddings):
+            stats = embeddings.cache.stats()
+            console.log(
+                f"Embeddings cache hits: {stats['hits']}, "
+                f"misses: {stats['misses']}, "
+                f"size: {stats['size'] / 1024 / 1024:.1f} MB"
+            )
+
+    def _checkpoint(self, complete: bool = False):
+        with tracer.span("ingest.persist"):
+            self.index.vectorstore.persist()
+            self.lexical_index.commit()
+            # Only after the vectors are on disk, so an interrupted run is
+            # resumed on the next start
+            if complete:
+                self.manifest.complete = True
+            self.manifest.save()
 
     def persist(self):
         if not self.in_memory:
-            self.index.vectorstore.persist()
+            self._checkpoint(complete=True)
+
+    def get_query_cache(self) -> Optional[QueryCache]:
+        if self.in_memory or not config["query_cache"]["enabled"]:
+            return None
+
+        # Cached results are dropped when the files or the settings change
+        version = hash_key(
+            {"files": self.manifest.fingerprint(), "index": config["index"]}
+        )
+        return QueryCache(
+            os.path.join(self.persist_path, QUERY_CACHE_FILE_NAME),
+            version,
+            ttl=config["query_cache"]["ttl"],
+            max_entries=config["query_cache"]["max_entries"],
+        )
 
     def clean(self):
         if not self.in_memory:
             shutil.rmtree(self.persist_path)
 
     def get_retriever(self) -> BaseRetriever:
-        return self.index.vectorstore.as_retriever(
+        search_kwargs = {"k": config["index"]["k"]}
+        if config["index"]["search_type"] == "mmr":
+            search_kwargs.update(config["index"]["mmr"])
+        retriever = self.index.vectorstore.as_retriever(
             search_type=config["index"]["search_type"],
-            search_kwargs={"k": config["index"]["k"]},
+            search_kwargs=search_kwargs,
+        )
+        if not config["index"]["hybrid"]["enabled"]:
+            return retriever
+
+        return HybridRetriever(
+            retriever,
+            self.lexical_index,
+            self.index.vectorstore.get_documents,
+            k=config["index"]["k"],
+            fetch_k=config["index"]["hybrid"]["fetch_k"],
+            rrf_k=config["index"]["hybrid"]["rrf_k"],
         )
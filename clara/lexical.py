@@ -0,0 +1,142 @@
+import re
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Set, Tuple
+
+LEXICAL_INDEX_FILE_NAME = "lexical.sqlite"
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Parts of snake_case, camelCase and PascalCase identifiers
+SUBWORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z]|[0-9]|\b|_)|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+BACKTICKS_RE = re.compile(r"`([^`]+)`")
+
+STOPWORDS = frozenset(
+    (
+        "a an and are as at be by can code do does for from how i in is it me "
+        "of on or show that the this to use used uses using what when where "
+        "which who why with work works"
+    ).split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Identifiers in the text, lowercased, followed by their parts."""
+    terms = []
+    for identifier in IDENTIFIER_RE.findall(text):
+        terms.append(identifier.lower())
+        subwords = SUBWORD_RE.findall(identifier)
+        if len(subwords) > 1:
+            terms.extend(subword.lower() for subword in subwords)
+    return terms
+
+
+def is_symbol(identifier: str) -> bool:
+    """Whether an identifier looks like code, rather than an English word."""
+    return "_" in identifier.strip("_") or bool(re.search(r"[a-z][A-Z]", identifier))
+
+
+def get_symbols(query: str) -> Set[str]:
+    symbols = {
+        identifier.lower()
+        for identifier in IDENTIFIER_RE.findall(query)
+        if is_symbol(identifier)
+    }
+    for quoted in BACKTICKS_RE.findall(query):
+        symbols.update(
+            identifier.lower() for identifier in IDENTIFIER_RE.findall(quoted)
+        )
+    return symbols
+
+
+def _match_expression(terms: Iterable[str]) -> str:
+    return " OR ".join(f'"{term}"' for term in sorted(set(terms)))
+
+
+class LexicalIndex:
+    """Inverted index of the identifiers in each chunk, ranked with BM25.
+
+    Backed by SQLite FTS5, it's updated incrementally along with the vector
+    store, and answers lookups of symbols without computing any embedding.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "rowid INTEGER PRIMARY KEY, id TEXT NOT NULL, source TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS terms "
+            "USING fts5(text, tokenize=\"unicode61 tokenchars '_'\");"
+        )
+        self._connection.commit()
+
+    def add(self, ids: List[str], sources: List[str], texts: List[str]):
+        with self._lock:
+            for chunk_id, source, text in zip(ids, sources, texts):
+                cursor = self._connection.execute(
+                    "INSERT INTO chunks (id, source) VALUES (?, ?)", (chunk_id, source)
+                )
+                self._connection.execute(
+                    "INSERT INTO terms (rowid, text) VALUES (?, ?)",
+                    (cursor.lastrowid, " ".join(tokenize(text))),
+                )
+
+    def delete(self, sources: Iterable[str]):
+        with self._lock:
+            for source in sources:
+                self._connection.execute(
+                    "DELETE FROM terms WHERE rowid IN "
+                    "(SELECT rowid FROM chunks WHERE source = ?)",
+                    (source,),
+                )
+                self._connection.execute(
+                    "DELETE FROM chunks WHERE source = ?", (source,)
+                )
+
+    def delete_all(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM terms")
+            self._connection.execute("DELETE FROM chunks")
+
+    def commit(self):
+        with self._lock:
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def search(self, terms: Iterable[str], k: int) -> List[Tuple[str, float]]:
+        """Return the ids of the `k` best chunks for the terms, and their
+        BM25 scores (higher is better)."""
+        terms = [term for term in terms if term not in STOPWORDS]
+        if not terms:
+            return []
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT chunks.id, bm25(terms) AS score FROM terms "
+                "JOIN chunks ON chunks.rowid = terms.rowid "
+                "WHERE terms MATCH ? ORDER BY score LIMIT ?",
+                (_match_expression(terms), k),
+            ).fetchall()
+
+        # FTS5 scores are negated, so the best ones are the lowest
+        return [(chunk_id, -score) for chunk_id, score in rows]
+
+    def search_query(self, query: str, k: int) -> List[Tuple[str, float]]:
+        return self.search(tokenize(query), k)
+
+    def search_symbols(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Search only for the code symbols in the query (e.g. `snake_case`,
+        `camelCase` or quoted with backticks)."""
+        return self.search(get_symbols(query), k)
+
+    def size(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM chunks"
+            ).fetchone()
+        return count
@@ -0,0 +1,187 @@
+import os
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional
+from dataclasses import dataclass, field, asdict
+
+
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+@dataclass
+class FileEntry:
+    size: int
+    mtime: float
+    sha256: str
+    # Couldn't be loaded, retried once it changes
+    failed: bool = False
+
+
+@dataclass
+class ManifestDiff:
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # Unchanged files whose size or mtime were updated
+    refreshed: List[str] = field(default_factory=list)
+
+    @property
+    def to_index(self) -> List[str]:
+        return self.added + self.changed
+
+    @property
+    def to_delete(self) -> List[str]:
+        return self.changed + self.removed
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+class Manifest:
+    """Size, mtime and content hash of every file in the index.
+
+    Stored next to the vector DB, it lets ingestion only re-parse and re-embed
+    the files that were added or changed since the last run.
+
+    Files to index are staged by `update` and only recorded once `commit`ed,
+    after their vectors are stored. `complete` is false while an ingestion is
+    in progress, so an interrupted one can be detected and resumed.
+    `vectorstore` is the kind of vector DB the files are stored in.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        files: Dict[str, FileEntry] = None,
+        complete: bool = True,
+        vectorstore: Optional[str] = None,
+    ):
+        self.path = path
+        self.files = files or {}
+        self.staged = {}
+        self.complete = complete
+        self.vectorstore = vectorstore
+
+    @classmethod
+    def load(cls, persist_path: str) -> "Manifest":
+        path = os.path.join(persist_path, MANIFEST_FILE_NAME)
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+
+        return cls(
+            path,
+            {
+                file_path: FileEntry(**entry)
+                for file_path, entry in data["files"].items()
+            },
+            complete=data.get("complete", True),
+            vectorstore=data.get("vectorstore"),
+        )
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "complete": self.complete,
+                    "vectorstore": self.vectorstore,
+                    "files": {
+                        file_path: asdict(entry)
+                        for file_path, entry in sorted(self.files.items())
+                    },
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+    def update(self, file_paths: Iterable[str]) -> ManifestDiff:
+        """Refresh the manifest with the current files and return the changes.
+
+        Files whose size and mtime did not change are trusted without being
+        read. Otherwise the content hash decides, so touching a file does not
+        trigger a re-index.
+
+        Removed, added and changed files are dropped from the manifest, the
+        last two staged until they are committed.
+        """
+        diff = ManifestDiff()
+        files = {}
+        staged = {}
+
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            previous = self.files.get(file_path)
+            if (
+                previous is not None
+                and previous.size == stat.st_size
+                and previous.mtime == stat.st_mtime
+            ):
+                files[file_path] = previous
+                diff.unchanged.append(file_path)
+                continue
+
+            try:
+                sha256 = hash_file(file_path)
+            except OSError:
+                continue
+            entry = FileEntry(size=stat.st_size, mtime=stat.st_mtime, sha256=sha256)
+
+            if previous is None:
+                staged[file_path] = entry
+                diff.added.append(file_path)
+            elif previous.sha256 != sha256:
+                staged[file_path] = entry
+                diff.changed.append(file_path)
+            else:
+                entry.failed = previous.failed
+                files[file_path] = entry
+                diff.unchanged.append(file_path)
+                diff.refreshed.append(file_path)
+
+        diff.removed = sorted(set(self.files) - set(files) - set(staged))
+        self.files = files
+        self.staged = staged
+
+        return diff
+
+    def fingerprint(self) -> str:
+        """Hash of the paths and contents of the committed files."""
+        sha = hashlib.sha256()
+        for file_path, entry in sorted(self.files.items()):
+            sha.update(
+                f"{file_path}\0{entry.sha256}\n".encode("utf-8", "surrogatepass")
+            )
+        return sha.hexdigest()
+
+    def commit(self, file_paths: Iterable[str], failed: Iterable[str] = ()):
+        """Record the staged files, `failed` the ones that couldn't be loaded,
+        so they aren't retried until they change."""
+        for file_path in file_paths:
+            self.files[file_path] = self.staged.pop(file_path)
+        for file_path in failed:
+            entry = self.staged.pop(file_path)
+            entry.failed = True
+            self.files[file_path] = entry
@@ -0,0 +1,156 @@
+import os
+import json
+from dataclasses import dataclass, asdict
+from typing import Callable, List, Optional
+
+from langchain.chains import LLMChain
+
+from .tracing import tracer
+
+
+MEMORY_FILE_NAME = "memory.json"
+MEMORY_VERSION = 1
+
+PREFIXES = {"human": "Human", "ai": "Assistant"}
+
+
+@dataclass
+class Message:
+    # human or ai
+    role: str
+    content: str
+    tokens: int
+
+    @property
+    def line(self) -> str:
+        return f"{PREFIXES[self.role]}: {self.content}"
+
+
+class SummaryMemory:
+    """Latest messages of the chat, within `token_limit` tokens with a summary
+    of the older ones.
+
+    The tokens of each message are counted once, when it's added. When the
+    history goes over the limit, its oldest messages are folded into the
+    summary until it's within `summarize_to` tokens, so the summary is only
+    updated every few turns, and from its previous version and the new
+    messages.
+
+    With a `path` it's saved after every turn, and loaded by a chat resumed
+    later.
+    """
+
+    def __init__(
+        self,
+        summary_chain: LLMChain,
+        count_tokens: Callable[[str], int],
+        token_limit: int,
+        summarize_to: Optional[int] = None,
+        path: Optional[str] = None,
+        model: Optional[str] = None,
+    ):
+        self.summary_chain = summary_chain
+        self.count_tokens = count_tokens
+        self.token_limit = token_limit
+        self.summarize_to = min(summarize_to or token_limit, token_limit)
+        self.path = path
+        # Of the token counts
+        self.model = model
+        self.summary = ""
+        self.summary_tokens = 0
+        self.messages: List[Message] = []
+        self.tokens = 0
+        if path is not None:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != MEMORY_VERSION:
+            return
+
+        self.summary = data["summary"]
+        self.messages = [Message(**message) for message in data["messages"]]
+        if data.get("model") == self.model:
+            self.summary_tokens = data["summary_tokens"]
+        else:
+            # Counted with another tokenizer
+            self.summary_tokens = self.count_tokens(self.summary)
+            for message in self.messages:
+                message.tokens = self.count_tokens(message.line)
+        self.tokens = self.summary_tokens + sum(
+            message.tokens for message in self.messages
+        )
+
+    def save(self):
+        if self.path is None:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": MEMORY_VERSION,
+                    "model": self.model,
+                    "summary": self.summary,
+                    "summary_tokens": self.summary_tokens,
+                    "messages": [asdict(message) for message in self.messages],
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+    def is_empty(self) -> bool:
+        return not (self.summary or self.messages)
+
+    @property
+    def history(self) -> str:
+        """The summary and the latest messages, for the condense prompt."""
+        lines = [message.line for message in self.messages]
+        if self.summary:
+            lines.insert(0, f"Summary of the earlier conversation: {self.summary}")
+        return "\n".join(lines)
+
+    def _add(self, role: str, content: str):
+        message = Message(role, content, 0)
+        message.tokens = self.count_tokens(message.line)
+        self.messages.append(message)
+        self.tokens += message.tokens
+
+    def _summarize(self):
+        pruned = []
+        while self.messages and self.tokens > self.summarize_to:
+            message = self.messages.pop(0)
+            self.tokens -= message.tokens
+            pruned.append(message)
+        if not pruned:
+            return
+
+        with tracer.span("chat.summarize", messages=len(pruned)):
+            summary = self.summary_chain.run(
+                {
+                    "summary": self.summary,
+                    "new_lines": "\n".join(message.line for message in pruned),
+                }
+            ).strip()
+        self.tokens -= self.summary_tokens
+        self.summary = summary
+        self.summary_tokens = self.count_tokens(summary)
+        self.tokens += self.summary_tokens
+
+    def save_context(self, question: str, answer: str):
+        self._add("human", question)
+        self._add("ai", answer)
+        if self.tokens > self.token_limit:
+            self._summarize()
+        self.save()
+
+    def clear(self):
+        self.summary = ""
+        self.summary_tokens = 0
+        self.messages = []
+        self.tokens = 0
+        self.save()
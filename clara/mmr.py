@@ -0,0 +1,70 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def batch_maximal_marginal_relevance(
+    query_embeddings: Sequence[Sequence[float]],
+    embedding_lists: Sequence[Sequence[Sequence[float]]],
+    lambda_mult: float = 0.5,
+    k: int = 4,
+) -> List[List[int]]:
+    """Select up to `k` of the candidates of each query, by maximal marginal
+    relevance.
+
+    Same selection as `langchain.vectorstores.utils.maximal_marginal_relevance`,
+    but the similarities between the candidates are computed once, for every
+    query, with a single matrix product, and only the greatest similarity of
+    each candidate with the ones already selected is updated at each step.
+    """
+    queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+    if not len(queries):
+        return []
+    lengths = np.array([len(embeddings) for embeddings in embedding_lists])
+    candidates = np.zeros(
+        (len(queries), lengths.max(initial=0), queries.shape[1]), dtype=np.float32
+    )
+    for i, embeddings in enumerate(embedding_lists):
+        if len(embeddings):
+            candidates[i, : len(embeddings)] = embeddings
+    candidates = _normalize(candidates)
+
+    relevance = np.einsum("qnd,qd->qn", candidates, queries)
+    similarity = candidates @ candidates.transpose(0, 2, 1)
+    # Candidates padding the shorter lists are never selected
+    excluded = np.arange(candidates.shape[1]) >= lengths[:, None]
+    # Starts at 0, like in langchain, so dissimilar candidates aren't favoured
+    redundancy = np.zeros_like(relevance)
+
+    counts = np.minimum(k, lengths)
+    selected = np.zeros((len(queries), counts.max(initial=0)), dtype=int)
+    for step in range(selected.shape[1]):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[excluded] = -np.inf
+        best = scores.argmax(axis=1)
+
+        active = np.nonzero(step < counts)[0]
+        selected[active, step] = best[active]
+        excluded[active, best[active]] = True
+        redundancy[active] = np.maximum(
+            redundancy[active], similarity[active, best[active]]
+        )
+
+    return [selected[i, :count].tolist() for i, count in enumerate(counts)]
+
+
+def maximal_marginal_relevance(
+    query_embedding: Sequence[float],
+    embedding_list: Sequence[Sequence[float]],
+    lambda_mult: float = 0.5,
+    k: int = 4,
+) -> List[int]:
+    return batch_maximal_marginal_relevance(
+        [query_embedding], [embedding_list], lambda_mult=lambda_mult, k=k
+    )[0]
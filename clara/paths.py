@@ -0,0 +1,13 @@
+import os
+import hashlib
+
+from .consts import BASE_PERSIST_PATH
+
+
+def get_persist_path(path: str) -> str:
+    """Directory with the vector DB and the rest of the data of a repository."""
+    path = os.path.abspath(path)
+    hashed_path = hashlib.sha256(str(path).encode("utf-8")).hexdigest()
+    short_hash = hashed_path[:8]
+    base_name = os.path.basename(path)
+    return os.path.join(BASE_PERSIST_PATH, f"{base_name}_{short_hash}")
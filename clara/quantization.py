@@ -0,0 +1,50 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Type of the stored vectors, and suffix of their files
+QUANTIZATIONS = {
+    "float32": (np.float32, "f32"),
+    "float16": (np.float16, "f16"),
+    "int8": (np.int8, "i8"),
+}
+
+
+def quantize(
+    vectors: np.ndarray, quantization: str
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Compact representation of the vectors, and for int8 the scale of each
+    one (its greatest absolute value is stored as 127)."""
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return vectors.astype(QUANTIZATIONS[quantization][0]), None
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    vectors = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales)[:, None]
+    return vectors
+
+
+def dot(
+    queries: np.ndarray,
+    codes: np.ndarray,
+    scales: Optional[np.ndarray],
+    block_size: int = 1024,
+) -> np.ndarray:
+    """Dot products of the queries with the quantized vectors, converting them
+    to float32 by blocks so that BLAS is used without a float32 copy."""
+    if codes.dtype == np.float32:
+        return queries @ codes.T
+    products = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), block_size):
+        block = np.asarray(codes[start : start + block_size], dtype=np.float32)
+        products[:, start : start + block_size] = queries @ block.T
+    if scales is not None:
+        products *= np.asarray(scales)
+    return products
@@ -0,0 +1,102 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Optional
+
+
+QUERY_CACHE_FILE_NAME = "query_cache.sqlite"
+
+
+def hash_key(key: Any) -> str:
+    data = json.dumps(key, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class QueryCache:
+    """On-disk cache of the steps of answering a question, per repository.
+
+    Values are stored as JSON by level (e.g. "retrieval" or "answer") and
+    key. Entries expire after `ttl` seconds and the least recently used are
+    evicted beyond `max_entries`. Every entry is dropped when `version`
+    changes, i.e. when the index is updated.
+    """
+
+    def __init__(self, path: str, version: str, ttl: float, max_entries: int):
+        self.path = path
+        self.version = version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "level TEXT NOT NULL, "
+            "hash TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "PRIMARY KEY (level, hash));"
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);"
+        )
+
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()
+        if row is None or row[0] != version:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                (version,),
+            )
+        self._connection.execute(
+            "DELETE FROM entries WHERE created < ?", (time.time() - ttl,)
+        )
+        self._connection.commit()
+
+    def get(self, level: str, key: Any) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM entries "
+                "WHERE level = ? AND hash = ? AND created >= ?",
+                (level, hash_key(key), now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._connection.execute(
+                "UPDATE entries SET last_used = ? WHERE level = ? AND hash = ?",
+                (now, level, hash_key(key)),
+            )
+            self._connection.commit()
+        return json.loads(row[0])
+
+    def put(self, level: str, key: Any, value: Any):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(level, hash, value, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (level, hash_key(key), json.dumps(value), now, now),
+            )
+            self._connection.execute(
+                "DELETE FROM entries WHERE rowid IN ("
+                "SELECT rowid FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM entries"
+            ).fetchone()
+        return count
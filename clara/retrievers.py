@@ -0,0 +1,151 @@
+from typing import Callable, Dict, Hashable, List, Optional, Sequence
+
+from langchain.schema import BaseRetriever, Document
+
+from .query_cache import QueryCache
+from .lexical import LexicalIndex, get_symbols, tokenize, STOPWORDS
+from .utils import log
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]], k: int = 60
+) -> List[Hashable]:
+    """Merge rankings, scoring each item with the sum of `1 / (k + rank)`."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+def document_key(document: Document) -> Hashable:
+    return document.metadata["source"], document.page_content
+
+
+def fuse(
+    vector_documents: List[Document],
+    lexical_documents: List[Document],
+    k: int,
+    rrf_k: int = 60,
+) -> List[Document]:
+    """The best `k` documents of both rankings, by reciprocal rank fusion."""
+    documents = {}
+    for document in vector_documents + lexical_documents:
+        documents.setdefault(document_key(document), document)
+
+    keys = reciprocal_rank_fusion(
+        [
+            [document_key(document) for document in vector_documents],
+            [document_key(document) for document in lexical_documents],
+        ],
+        k=rrf_k,
+    )
+    return [documents[key] for key in keys[:k]]
+
+
+class CachedRetriever(BaseRetriever):
+    """Cache the chunks retrieved for each query."""
+
+    def __init__(self, retriever: BaseRetriever, cache: QueryCache):
+        self.retriever = retriever
+        self.cache = cache
+
+    def _get_cached(self, query: str) -> Optional[List[Document]]:
+        cached = self.cache.get("retrieval", query)
+        if cached is None:
+            return None
+        log("Cached retrieval:", query)
+        return [Document(**document) for document in cached]
+
+    def _put(self, query: str, documents: List[Document]):
+        self.cache.put(
+            "retrieval",
+            query,
+            [
+                {"page_content": document.page_content, "metadata": document.metadata}
+                for document in documents
+            ],
+        )
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        documents = self._get_cached(query)
+        if documents is None:
+            documents = self.retriever.get_relevant_documents(query)
+            self._put(query, documents)
+        return documents
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        documents = self._get_cached(query)
+        if documents is None:
+            documents = await self.retriever.aget_relevant_documents(query)
+            self._put(query, documents)
+        return documents
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuse the results of a vector store retriever and a lexical index.
+
+    Queries only about code symbols (e.g. "where is `get_persist_path`
+    used?") are answered by the lexical index alone, without computing the
+    embedding of the query.
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        lexical_index: LexicalIndex,
+        get_documents: Callable[[List[str]], List[Document]],
+        k: int,
+        fetch_k: int = 20,
+        rrf_k: int = 60,
+    ):
+        self.retriever = retriever
+        self.lexical_index = lexical_index
+        self.get_documents = get_documents
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+
+    @staticmethod
+    def is_symbol_query(query: str) -> bool:
+        symbols = get_symbols(query)
+        if not symbols:
+            return False
+        words = {term for term in tokenize(query) if term not in STOPWORDS}
+        symbol_terms = {term for symbol in symbols for term in tokenize(symbol)}
+        return words <= symbol_terms
+
+    def _lookup_symbols(self, query: str) -> Optional[List[Document]]:
+        if not self.is_symbol_query(query):
+            return None
+        hits = self.lexical_index.search_symbols(query, self.k)
+        if not hits:
+            return None
+        log("Symbol lookup:", query)
+        return self.get_documents([chunk_id for chunk_id, _ in hits])
+
+    def _search_lexical(self, query: str) -> List[Document]:
+        hits = self.lexical_index.search_query(query, self.fetch_k)
+        return self.get_documents([chunk_id for chunk_id, _ in hits])
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        documents = self._lookup_symbols(query)
+        if documents is not None:
+            return documents
+        return fuse(
+            self.retriever.get_relevant_documents(query),
+            self._search_lexical(query),
+            self.k,
+            self.rrf_k,
+        )
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        documents = self._lookup_symbols(query)
+        if documents is not None:
+            return documents
+        return fuse(
+            await self.retriever.aget_relevant_documents(query),
+            self._search_lexical(query),
+            self.k,
+            self.rrf_k,
+        )
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import socket
+import pathlib
+import threading
+import socketserver
+from typing import Any, Callable, Dict, Optional
+
+from .config import config
+from .consts import SERVER_SOCKET_PATH
+from .console import console
+
+
+# The server receives a JSON line with the path of the repository and the
+# question, and answers with JSON lines: a `token` per token of the answer,
+# and then the `result` or an `error`.
+
+
+class ServerError(Exception):
+    pass
+
+
+def _send(wfile, message: Dict[str, Any]):
+    wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+class Repository:
+    """Index and chat of a repository, kept loaded by the server.
+
+    The index is updated in the background, at most every `refresh_interval`
+    seconds, while the questions are answered from the loaded one.
+    """
+
+    def __init__(self, path: str, refresh_interval: Optional[float] = None):
+        from .index import RepositoryIndex
+
+        self.index = RepositoryIndex(path)
+        self.chat = None
+        self.fingerprint = None
+        self.refresh_interval = (
+            config["server"]["refresh_interval"]
+            if refresh_interval is None
+            else refresh_interval
+        )
+        self.refreshed_at = 0.0
+        self.lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+
+    def refresh(self):
+        with self._refresh_lock:
+            # Only the changed files are re-indexed, the vector DB stays open
+            if self.index.ingest():
+                self.index.persist()
+            self.refreshed_at = time.monotonic()
+
+            # Its query cache is of the indexed files
+            fingerprint = self.index.manifest.fingerprint()
+            if fingerprint != self.fingerprint or self.chat is None:
+                from .chat import Chat
+
+                self.chat = Chat(
+                    retriever=self.index.get_retriever(),
+                    cache=self.index.get_query_cache(),
+                )
+                self.fingerprint = fingerprint
+
+    def _refresh_in_background(self):
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(target=self._try_refresh, daemon=True)
+        self._refresh_thread.start()
+
+    def _try_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            console.log(f":warning: Error updating {self.index.path}: {e}")
+
+    def query(self, question: str, on_token: Callable[[str], None]):
+        with self.lock:
+            if self.chat is None:
+                self.refresh()
+            elif time.monotonic() - self.refreshed_at >= self.refresh_interval:
+                self._refresh_in_background()
+            chat = self.chat
+            # Each question is independent, like in `clara ask`
+            chat.chat_history.clear()
+            return chat.query(question, on_token=on_token)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            request = json.loads(line)
+            repository = self.server.get_repository(request["path"])
+            result = repository.query(
+                request["question"],
+                on_token=lambda token: _send(self.wfile, {"token": token}),
+            )
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        except Exception as e:
+            console.log(f":warning: Error answering request: {e}")
+            _send(self.wfile, {"error": str(e), "type": type(e).__name__})
+            return
+
+        _send(
+            self.wfile,
+            {
+                "result": {
+                    "question": result.question,
+                    "answer": result.answer,
+                    "sources": [
+                        {
+                            "page_content": source.page_content,
+                            "metadata": source.metadata,
+                        }
+                        for source in result.sources
+                    ],
+                    "timings": result.timings,
+                }
+            },
+        )
+
+
+class ClaraServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = SERVER_SOCKET_PATH):
+        self.repositories: Dict[str, Repository] = {}
+        self._lock = threading.Lock()
+        super().__init__(socket_path, RequestHandler)
+
+    def get_repository(self, path: str) -> Repository:
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self.repositories:
+                console.log(f"Loading [blue underline]{path}")
+                self.repositories[path] = Repository(path)
+            return self.repositories[path]
+
+
+def is_server_running(socket_path: str = SERVER_SOCKET_PATH) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def run_server(socket_path: str = SERVER_SOCKET_PATH):
+    if is_server_running(socket_path):
+        raise ServerError(f"A server is already running on {socket_path}")
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    pathlib.Path(os.path.dirname(socket_path)).mkdir(parents=True, exist_ok=True)
+
+    with ClaraServer(socket_path) as server:
+        console.log(f"Listening on [blue underline]{socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def query_server(
+    path: str,
+    question: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    socket_path: str = SERVER_SOCKET_PATH,
+):
+    """Ask a question to the server, with the same interface as `Chat.query`."""
+    from langchain.docstore.document import Document
+    from openai.error import InvalidRequestError
+
+    from .chat import QueryResult
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            _send(stream, {"path": os.path.abspath(path), "question": question})
+
+            for line in stream:
+                message = json.loads(line)
+                if "token" in message:
+                    if on_token is not None:
+                        on_token(message["token"])
+                elif "error" in message:
+                    if message["type"] == "InvalidRequestError":
+                        raise InvalidRequestError(message["error"], None)
+                    raise ServerError(message["error"])
+                else:
+                    result = message["result"]
+                    return QueryResult(
+                        question=result["question"],
+                        answer=result["answer"],
+                        sources=[Document(**source) for source in result["sources"]],
+                        timings=result["timings"],
+                    )
+
+    raise ServerError("Connection closed by the server")
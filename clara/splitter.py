@@ -0,0 +1,191 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+
+# Metadata set by the loaders with the lines where a document can be split,
+# and their nesting depth. Removed from the chunks.
+BOUNDARIES_KEY = "_boundaries"
+
+# Metadata with the number of tokens of each chunk
+TOKENS_KEY = "tokens"
+
+
+class CodeTextSplitter:
+    """Split documents in chunks of at most `chunk_size` tokens.
+
+    Each document is tokenized once, line by line, and chunks are measured
+    adding up the tokens of their lines. Documents are cut at the shallowest
+    syntactic boundaries that fit (top-level statements, then the statements
+    nested in them, and so on) and consecutive pieces are packed together, so
+    small definitions are kept whole. Without boundaries, blank lines are
+    used. Only when there is no boundary left, text is cut by lines, with
+    `chunk_overlap` tokens of overlap.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int,
+        encoding,
+        model_name: Optional[str] = None,
+    ):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding = encoding
+        # Of the tiktoken encoding, if it's one
+        self.model_name = model_name
+
+    @classmethod
+    def from_tiktoken_encoder(
+        cls, chunk_size: int, chunk_overlap: int, model_name: str
+    ) -> "CodeTextSplitter":
+        import tiktoken
+
+        return cls(
+            chunk_size,
+            chunk_overlap,
+            tiktoken.encoding_for_model(model_name),
+            model_name=model_name,
+        )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Sent to the processes loading files. Not every version of tiktoken
+        # can pickle its encodings, they're loaded again from its cache.
+        state = dict(self.__dict__)
+        if self.model_name is not None:
+            del state["encoding"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        if "encoding" not in state:
+            import tiktoken
+
+            self.encoding = tiktoken.encoding_for_model(self.model_name)
+
+    @staticmethod
+    def _get_paragraph_boundaries(lines: List[str]) -> Dict[int, int]:
+        return {
+            i: 0
+            for i in range(1, len(lines))
+            if not lines[i - 1].strip() and lines[i].strip()
+        }
+
+    def split_text(
+        self, text: str, boundaries: Optional[Dict[int, int]] = None
+    ) -> List[Tuple[str, int]]:
+        """Split a text, returning each chunk with its number of tokens."""
+        lines = text.splitlines(keepends=True)
+        if boundaries is None:
+            boundaries = self._get_paragraph_boundaries(lines)
+
+        tokens = [self.encoding.encode_ordinary(line) for line in lines]
+        prefix = [0]
+        for line_tokens in tokens:
+            prefix.append(prefix[-1] + len(line_tokens))
+
+        chunks = []
+        for start, end in self._split_range(0, len(lines), boundaries, prefix):
+            if end - start == 1 and prefix[end] - prefix[start] > self.chunk_size:
+                chunks.extend(self._split_tokens(tokens[start]))
+            else:
+                chunks.append(("".join(lines[start:end]), prefix[end] - prefix[start]))
+
+        return [
+            (chunk.strip("\n"), chunk_tokens)
+            for chunk, chunk_tokens in chunks
+            if chunk.strip()
+        ]
+
+    def _split_range(
+        self, start: int, end: int, boundaries: Dict[int, int], prefix: List[int]
+    ) -> List[Tuple[int, int]]:
+        if prefix[end] - prefix[start] <= self.chunk_size or end - start == 1:
+            return [(start, end)]
+
+        cuts = [line for line in boundaries if start < line < end]
+        if not cuts:
+            return self._split_lines(start, end, prefix)
+
+        depth = min(boundaries[line] for line in cuts)
+        cuts = sorted(line for line in cuts if boundaries[line] == depth)
+
+        ranges = []
+        chunk_start = start
+        chunk_end = start
+        for unit_start, unit_end in zip([start] + cuts, cuts + [end]):
+            if prefix[unit_end] - prefix[chunk_start] <= self.chunk_size:
+                chunk_end = unit_end
+                continue
+
+            if chunk_end > chunk_start:
+                ranges.append((chunk_start, chunk_end))
+            if prefix[unit_end] - prefix[unit_start] <= self.chunk_size:
+                chunk_start, chunk_end = unit_start, unit_end
+            else:
+                # Too big on its own, split by deeper boundaries
+                ranges.extend(
+                    self._split_range(unit_start, unit_end, boundaries, prefix)
+                )
+                chunk_start = chunk_end = unit_end
+
+        if chunk_end > chunk_start:
+            ranges.append((chunk_start, chunk_end))
+
+        return ranges
+
+    def _split_lines(
+        self, start: int, end: int, prefix: List[int]
+    ) -> List[Tuple[int, int]]:
+        ranges = []
+        chunk_start = start
+
+        while chunk_start < end:
+            chunk_end = chunk_start + 1
+            while (
+                chunk_end < end
+                and prefix[chunk_end + 1] - prefix[chunk_start] <= self.chunk_size
+            ):
+                chunk_end += 1
+            ranges.append((chunk_start, chunk_end))
+            if chunk_end == end:
+                break
+
+            # Start the next chunk with the last lines of this one, as overlap
+            next_start = chunk_end
+            while (
+                next_start - 1 > chunk_start
+                and prefix[chunk_end] - prefix[next_start - 1] <= self.chunk_overlap
+            ):
+                next_start -= 1
+            chunk_start = next_start
+
+        return ranges
+
+    def _split_tokens(self, tokens: List[int]) -> List[Tuple[str, int]]:
+        # A single line longer than a chunk (e.g. minified code)
+        chunks = []
+        step = max(1, self.chunk_size - self.chunk_overlap)
+        for i in range(0, len(tokens), step):
+            chunk_tokens = tokens[i : i + self.chunk_size]
+            chunks.append((self.encoding.decode(chunk_tokens), len(chunk_tokens)))
+            if i + self.chunk_size >= len(tokens):
+                break
+        return chunks
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        chunks = []
+
+        for document in documents:
+            metadata = dict(document.metadata)
+            boundaries = metadata.pop(BOUNDARIES_KEY, None)
+            for text, tokens in self.split_text(document.page_content, boundaries):
+                chunks.append(
+                    Document(
+                        page_content=text,
+                        metadata={**metadata, TOKENS_KEY: tokens},
+                    )
+                )
+
+        return chunks
@@ -0,0 +1,157 @@
+import os
+import time
+import json
+import importlib
+import threading
+import contextlib
+import collections
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import config
+from .console import console
+
+
+@dataclass
+class Span:
+    name: str
+    # `time.perf_counter()` when it started, in seconds
+    start: float
+    duration: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    process: int = field(default_factory=os.getpid)
+    thread: int = field(default_factory=threading.get_ident)
+
+
+class TracingHook:
+    """Receive every span and counter, e.g. to forward them to a telemetry
+    system. Configured in `tracing.hooks`."""
+
+    def on_span(self, span: Span):
+        pass
+
+    def on_count(self, name: str, value: float):
+        pass
+
+
+class Tracer:
+    """Spans of the stages of the ingestion and the queries, and counters of
+    their work (tokens, requests…).
+
+    They're only kept while recording (`clara --profile`), but always passed
+    to the hooks.
+    """
+
+    def __init__(
+        self, hooks: Optional[List[TracingHook]] = None, recording: bool = False
+    ):
+        self.hooks = hooks or []
+        self.recording = recording
+        self.spans: List[Span] = []
+        self.counters: Dict[str, float] = collections.Counter()
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.recording or bool(self.hooks)
+
+    def start(self):
+        with self._lock:
+            self.spans = []
+            self.counters = collections.Counter()
+            self.origin = time.perf_counter()
+            self.recording = True
+
+    def stop(self):
+        self.recording = False
+
+    def _call_hooks(self, method: str, *args):
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(*args)
+            except Exception as e:
+                console.log(
+                    f":warning: Tracing hook {type(hook).__name__} failed: "
+                    f"{type(e).__name__}: {e}"
+                )
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time the block, whose attributes can be added to the span."""
+        span = Span(name, time.perf_counter(), attributes=attributes)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self.record(span)
+
+    def record(self, span: Span):
+        """Add a finished span, e.g. one timed in a worker process."""
+        if self.recording:
+            with self._lock:
+                self.spans.append(span)
+        self._call_hooks("on_span", span)
+
+    def count(self, name: str, value: float = 1):
+        if self.recording:
+            with self._lock:
+                self.counters[name] += value
+        self._call_hooks("on_count", name, value)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Calls, total and greatest duration of each stage, in the order they
+        first started."""
+        stages = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            stage = stages.setdefault(
+                span.name, {"name": span.name, "calls": 0, "total": 0.0, "max": 0.0}
+            )
+            stage["calls"] += 1
+            stage["total"] += span.duration
+            stage["max"] = max(stage["max"], span.duration)
+        return list(stages.values())
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """The spans in the Trace Event Format, to open them in
+        `chrome://tracing` or https://ui.perfetto.dev."""
+        return {
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": span.name.split(".")[0],
+                    "ph": "X",
+                    "ts": (span.start - self.origin) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": span.process,
+                    "tid": span.thread,
+                    "args": span.attributes,
+                }
+                for span in self.spans
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "summary": self.summary(),
+                "counters": dict(self.counters),
+            },
+        }
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+
+
+def load_hook(path: str) -> TracingHook:
+    """Create the hook at `module:attribute`, a class or a function returning
+    it."""
+    module_name, _, attribute = path.partition(":")
+    try:
+        return getattr(importlib.import_module(module_name), attribute)()
+    except (ImportError, AttributeError) as e:
+        raise Exception(
+            f"Could not load the tracing hook {path} ({e}), "
+            "check `tracing.hooks` in the configuration."
+        )
+
+
+tracer = Tracer(hooks=[load_hook(path) for path in config["tracing"]["hooks"]])
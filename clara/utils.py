@@ -1,3 +1,7 @@
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
 from .console import console
 from .consts import DEBUG
 
@@ -12,3 +16,57 @@ def null_log(*args):
 
 
 log = console_log if DEBUG else null_log
+
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable[T], maxsize: int) -> Iterator[T]:
+    """Consume `iterable` in a background thread, through a bounded queue.
+
+    The producer runs ahead of the consumer by at most `maxsize` items, and
+    its exceptions are raised in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+        finally:
+            # Generators clean up their resources (e.g. process pools) now
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = items.get()
+            if isinstance(item, tuple) and len(item) == 2 and item[0] is _DONE:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
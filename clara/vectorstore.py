@@ -0,0 +1,791 @@
+import os
+import glob
+import json
+import uuid
+import pathlib
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import Chroma
+from langchain.vectorstores.base import VectorStore
+
+from .ann import IVFIndex, ANN_INDEX_FILE_NAME
+from .config import config
+from .console import console
+from .mmr import batch_maximal_marginal_relevance
+from .quantization import QUANTIZATIONS, dequantize, dot, quantize
+
+# Both stores implement, besides the langchain `VectorStore` interface, the
+# operations `RepositoryIndex` uses to update them: `add_vectors`,
+# `delete_sources`, `get_documents`, `get_all`, `get_sources`, `count`,
+# `get_metadata`, `set_metadata`, `update_ann_index`, `clear` and `persist`,
+# and `search_with_vectors` to merge the results of several stores.
+
+
+class ChromaVectorStore(Chroma):
+    """Chroma, with the operations used to update the index."""
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def max_marginal_relevance_search_batch_by_vector(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, str]] = None,
+    ) -> List[List[Document]]:
+        """MMR search for several queries at once."""
+        count = self._collection.count()
+        if not count:
+            return [[] for _ in embeddings]
+        results = self._collection.query(
+            query_embeddings=embeddings,
+            n_results=min(fetch_k, count),
+            where=filter,
+            include=["metadatas", "documents", "embeddings"],
+        )
+        selections = batch_maximal_marginal_relevance(
+            embeddings, results["embeddings"], lambda_mult=lambda_mult, k=k
+        )
+        return [
+            [
+                Document(page_content=texts[i], metadata=metadatas[i] or {})
+                for i in selected
+            ]
+            for texts, metadatas, selected in zip(
+                results["documents"], results["metadatas"], selections
+            )
+        ]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        # Unlike Chroma's, in order of selection
+        return self.max_marginal_relevance_search_batch_by_vector(
+            [embedding], k, fetch_k, lambda_mult, filter
+        )[0]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding_function.embed_query(query),
+            k,
+            fetch_k,
+            lambda_mult,
+            filter,
+        )
+
+    def search_with_vectors(
+        self, embedding: List[float], k: int = 4
+    ) -> Tuple[List[Document], np.ndarray, np.ndarray]:
+        """Chunks most similar to the embedding, with their cosine similarity
+        and their vectors."""
+        count = self._collection.count()
+        if not count:
+            return [], np.zeros(0), np.zeros((0, len(embedding)), dtype=np.float32)
+        results = self._collection.query(
+            query_embeddings=[embedding],
+            n_results=min(k, count),
+            include=["metadatas", "documents", "embeddings"],
+        )
+        vectors = np.asarray(results["embeddings"][0], dtype=np.float32)
+        query = np.asarray(embedding, dtype=np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarities = (vectors @ query) / (
+                np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            )
+        documents = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(results["documents"][0], results["metadatas"][0])
+        ]
+        return documents, np.nan_to_num(similarities, nan=-1.0), vectors
+
+    def add_vectors(
+        self,
+        ids: List[str],
+        vectors: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+    ):
+        self._collection.add(
+            ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas
+        )
+
+    def delete_sources(self, sources: Iterable[str]):
+        for source in sources:
+            self._collection.delete(where={"source": source})
+
+    def get_documents(self, ids: List[str]) -> List[Document]:
+        """Fetch chunks by id, in the order of `ids`."""
+        if not ids:
+            return []
+        result = self._collection.get(ids=ids, include=["documents", "metadatas"])
+        documents = {
+            chunk_id: Document(page_content=text, metadata=metadata)
+            for chunk_id, text, metadata in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        }
+        return [documents[chunk_id] for chunk_id in ids if chunk_id in documents]
+
+    def get_all(self) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        result = self._collection.get(include=["documents", "metadatas"])
+        return result["ids"], result["documents"], result["metadatas"]
+
+    def get_sources(self) -> Set[str]:
+        metadatas = self._collection.get(include=["metadatas"])["metadatas"]
+        return {metadata["source"] for metadata in metadatas}
+
+    def get_metadata(self) -> Dict[str, Any]:
+        return dict(self._collection.metadata or {})
+
+    def set_metadata(self, metadata: Dict[str, Any]):
+        self._collection.modify(metadata=metadata)
+
+    def update_ann_index(self):
+        # Chroma keeps its own HNSW index up to date
+        pass
+
+    def clear(self):
+        name = self._collection.name
+        self.delete_collection()
+        self._collection = self._client.get_or_create_collection(
+            name=name,
+            embedding_function=self._embedding_function.embed_documents,
+        )
+
+
+CHUNKS_FILE_NAME = "chunks.sqlite"
+
+
+class _Vectors:
+    """Vectors of a `NumpyVectorStore` in float32, for the ANN index."""
+
+    def __init__(self, vectorstore: "NumpyVectorStore"):
+        self.vectorstore = vectorstore
+
+    def __len__(self) -> int:
+        return self.vectorstore.rows
+
+    def __getitem__(self, rows) -> np.ndarray:
+        return self.vectorstore._get_vectors(rows)
+
+
+class NumpyVectorStore(VectorStore):
+    """Vector store keeping the embeddings in memory-mapped matrices.
+
+    Vectors and their norms are appended to raw files in `persist_directory`,
+    which are mapped in memory when opened, and chunks are stored by row in a
+    SQLite side file. Deleted rows get a norm of 0 until the files are
+    compacted. Without `persist_directory` everything is kept in memory.
+
+    Vectors can be stored as float16, or int8 with a scale per vector, and
+    searched in that form. With `rescore`, the float32 vectors are kept too,
+    to compute again the similarity of the best candidates.
+
+    With an `ann_index`, once trained by `update_ann_index`, searches are
+    approximate and only compare the query with a part of the rows.
+    """
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        persist_directory: Optional[str] = None,
+        ann_index: Optional[IVFIndex] = None,
+        quantization: str = "float32",
+        rescore: bool = False,
+        rescore_factor: int = 4,
+    ):
+        self._embedding_function = embedding_function
+        self._persist_directory = persist_directory
+        self._ann_index = ann_index
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+
+        path = ":memory:"
+        if persist_directory is not None:
+            pathlib.Path(persist_directory).mkdir(parents=True, exist_ok=True)
+            path = os.path.join(persist_directory, CHUNKS_FILE_NAME)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, "
+            "id TEXT NOT NULL UNIQUE, "
+            "source TEXT NOT NULL, "
+            "text TEXT NOT NULL, "
+            "metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);"
+        )
+        self._connection.commit()
+
+        # Rows in the files, including the deleted ones
+        self.rows = self._get_meta("rows", 0)
+        self.dimension = self._get_meta("dimension", None)
+        self.generation = self._get_meta("generation", 0)
+        storage = {"quantization": quantization, "rescore": rescore}
+        stored = self._get_meta(
+            "storage", {"quantization": "float32", "rescore": False}
+        )
+        if self.rows and stored != storage:
+            raise Exception(
+                f"The index was built with {stored}, but {storage} is "
+                "configured. Run `clara clean` to remove it."
+            )
+        self.quantization = quantization
+        # Not needed if the vectors are already in float32
+        self.rescore = rescore and quantization != "float32"
+        self._storage = storage
+
+        self._arrays = self._empty_arrays()
+        if persist_directory is not None:
+            self._remove_stale_files()
+            self._map()
+            if ann_index is not None:
+                self._load_ann_index()
+
+    def _get_meta(self, key: str, default: Any) -> Any:
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def _set_meta(self, key: str, value: Any):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+
+    def _array_types(self) -> Dict[str, Tuple[Any, str, bool]]:
+        """Type, file suffix and whether it has a row per vector or a value
+        per row, of each stored array."""
+        dtype, suffix = QUANTIZATIONS[self.quantization]
+        types = {"vectors": (dtype, suffix, True), "norms": (np.float32, "f32", False)}
+        if self.quantization == "int8":
+            types["scales"] = (np.float32, "f32", False)
+        if self.rescore:
+            types["full"] = (np.float32, "f32", True)
+        return types
+
+    def _empty_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            name: np.zeros((0, self.dimension or 0) if matrix else 0, dtype=dtype)
+            for name, (dtype, _, matrix) in self._array_types().items()
+        }
+
+    def _file_path(self, name: str, generation: Optional[int] = None) -> str:
+        if generation is None:
+            generation = self.generation
+        suffix = self._array_types()[name][1]
+        return os.path.join(self._persist_directory, f"{name}.{generation}.{suffix}")
+
+    def _remove_stale_files(self):
+        # Left by a compaction that was interrupted, or already replaced
+        current = {self._file_path(name) for name in self._array_types()}
+        for name in ("vectors", "norms", "scales", "full"):
+            pattern = os.path.join(self._persist_directory, f"{name}.*.*")
+            for file_path in glob.glob(pattern):
+                if file_path not in current:
+                    os.remove(file_path)
+
+    def _map(self):
+        if self.rows == 0:
+            return
+        for name, (dtype, _, matrix) in self._array_types().items():
+            self._arrays[name] = np.memmap(
+                self._file_path(name),
+                dtype=dtype,
+                # Norms are set to 0 when deleting
+                mode="r+" if name == "norms" else "r",
+                shape=(self.rows, self.dimension) if matrix else (self.rows,),
+            )
+
+    def _get_vectors(self, rows) -> np.ndarray:
+        """Vectors of the rows (a slice or indexes) in float32, at full
+        precision if they're kept."""
+        if self.rescore:
+            return np.asarray(self._arrays["full"][rows])
+        scales = self._arrays.get("scales")
+        return dequantize(
+            self._arrays["vectors"][rows], None if scales is None else scales[rows]
+        )
+
+    def _load_ann_index(self):
+        ann_index = self._ann_index
+        path = os.path.join(self._persist_directory, ANN_INDEX_FILE_NAME)
+        if not ann_index.load(path, self.generation):
+            return
+        # Saved before the rows it doesn't have were committed, or with rows
+        # that weren't
+        assigned = len(ann_index.assignments)
+        if assigned > self.rows:
+            ann_index.assignments = ann_index.assignments[: self.rows]
+        elif assigned < self.rows:
+            ann_index.add(self._get_vectors(slice(assigned, self.rows)))
+
+    @staticmethod
+    def _write(file_path: str, array: np.ndarray, offset: int):
+        # Bytes past `offset` are from rows that were never committed
+        with open(file_path, "r+b" if os.path.exists(file_path) else "w+b") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(array.tobytes())
+
+    def count(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM chunks"
+            ).fetchone()
+        return count
+
+    def add_vectors(
+        self,
+        ids: List[str],
+        vectors: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+    ):
+        if not ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes, scales = quantize(vectors, self.quantization)
+        arrays = {
+            "vectors": codes,
+            "norms": np.linalg.norm(vectors, axis=1).astype(np.float32),
+            "scales": scales,
+            "full": vectors,
+        }
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                self._arrays = self._empty_arrays()
+            self._connection.executemany(
+                "INSERT INTO chunks (row, id, source, text, metadata) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        self.rows + i,
+                        chunk_id,
+                        metadata["source"],
+                        text,
+                        json.dumps(metadata),
+                    )
+                    for i, (chunk_id, text, metadata) in enumerate(
+                        zip(ids, texts, metadatas)
+                    )
+                ],
+            )
+
+            if self._ann_index is not None:
+                self._ann_index.add(vectors)
+
+            if self._persist_directory is None:
+                for name in self._arrays:
+                    self._arrays[name] = np.concatenate(
+                        [self._arrays[name], arrays[name]]
+                    )
+                self.rows += len(ids)
+                return
+
+            self._flush()
+            for name in self._arrays:
+                array = arrays[name]
+                self._write(self._file_path(name), array, self.rows * array[:1].nbytes)
+            self.rows += len(ids)
+            self._map()
+
+    def delete_sources(self, sources: Iterable[str]):
+        with self._lock:
+            for source in sources:
+                rows = [
+                    row
+                    for (row,) in self._connection.execute(
+                        "SELECT row FROM chunks WHERE source = ?", (source,)
+                    )
+                ]
+                if not rows:
+                    continue
+                self._arrays["norms"][rows] = 0
+                self._connection.execute(
+                    "DELETE FROM chunks WHERE source = ?", (source,)
+                )
+
+    def _flush(self):
+        if isinstance(self._arrays["norms"], np.memmap):
+            self._arrays["norms"].flush()
+
+    def _compact(self):
+        """Rewrite the files without the deleted rows."""
+        rows = [
+            row
+            for (row,) in self._connection.execute(
+                "SELECT row FROM chunks ORDER BY row"
+            )
+        ]
+        generation = self.generation + 1
+        for name, array in self._arrays.items():
+            self._write(
+                self._file_path(name, generation),
+                np.ascontiguousarray(array[rows]),
+                0,
+            )
+        if self._ann_index is not None:
+            self._ann_index.compact(np.array(rows, dtype=int))
+
+        # Rows only move down, so in order there are no collisions
+        self._connection.executemany(
+            "UPDATE chunks SET row = ? WHERE row = ?",
+            [(new, old) for new, old in enumerate(rows) if new != old],
+        )
+        self._set_meta("generation", generation)
+        self._set_meta("rows", len(rows))
+        self._connection.commit()
+
+        old_files = [self._file_path(name) for name in self._arrays]
+        self.generation = generation
+        self.rows = len(rows)
+        self._arrays = self._empty_arrays()
+        self._map()
+        for file_path in old_files:
+            os.remove(file_path)
+
+    def persist(self):
+        with self._lock:
+            if self._persist_directory is not None:
+                self._flush()
+                if self.rows - self.count() > self.rows / 2:
+                    self._compact()
+                if self._ann_index is not None:
+                    self._save_ann_index()
+            self._set_meta("rows", self.rows)
+            self._set_meta("dimension", self.dimension)
+            self._set_meta("generation", self.generation)
+            self._set_meta("storage", self._storage)
+            self._connection.commit()
+
+    def _save_ann_index(self):
+        path = os.path.join(self._persist_directory, ANN_INDEX_FILE_NAME)
+        if self._ann_index.is_trained:
+            self._ann_index.save(path, self.generation)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def update_ann_index(self):
+        """Train the ANN index once there are enough rows, and again when
+        they've grown enough. Rows added later are indexed as they're added."""
+        if self._ann_index is None:
+            return
+        with self._lock:
+            live = np.asarray(self._arrays["norms"]) > 0
+            if not self._ann_index.needs_training(int(live.sum())):
+                return
+            console.log(f"Training ANN index of {live.sum()} vectors")
+            self._ann_index.train(_Vectors(self), live)
+
+    def clear(self):
+        with self._lock:
+            if self._ann_index is not None:
+                self._ann_index.reset()
+            self._connection.execute("DELETE FROM chunks")
+            self._connection.execute("DELETE FROM meta")
+            if self._persist_directory is not None:
+                for file_path in [self._file_path(name) for name in self._arrays]:
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+            self.rows = 0
+            self.dimension = None
+            self.generation = 0
+            self._arrays = self._empty_arrays()
+
+    def get_metadata(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._get_meta("metadata", {})
+
+    def set_metadata(self, metadata: Dict[str, Any]):
+        with self._lock:
+            self._set_meta("metadata", metadata)
+
+    def _to_documents(self, rows: Iterable[Tuple[str, str]]) -> List[Document]:
+        return [
+            Document(page_content=text, metadata=json.loads(metadata))
+            for text, metadata in rows
+        ]
+
+    def get_documents(self, ids: List[str]) -> List[Document]:
+        """Fetch chunks by id, in the order of `ids`."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, text, metadata FROM chunks "
+                f"WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+        documents = {
+            chunk_id: document
+            for (chunk_id, _, _), document in zip(
+                rows, self._to_documents(row[1:] for row in rows)
+            )
+        }
+        return [documents[chunk_id] for chunk_id in ids if chunk_id in documents]
+
+    def _get_rows(self, rows: List[int]) -> List[Document]:
+        with self._lock:
+            found = {
+                row: (text, metadata)
+                for row, text, metadata in self._connection.execute(
+                    "SELECT row, text, metadata FROM chunks "
+                    f"WHERE row IN ({','.join('?' * len(rows))})",
+                    rows,
+                )
+            }
+        return self._to_documents(found[row] for row in rows if row in found)
+
+    def get_all(self) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, text, metadata FROM chunks ORDER BY row"
+            ).fetchall()
+        return (
+            [chunk_id for chunk_id, _, _ in rows],
+            [text for _, text, _ in rows],
+            [json.loads(metadata) for _, _, metadata in rows],
+        )
+
+    def get_sources(self) -> Set[str]:
+        with self._lock:
+            return {
+                source
+                for (source,) in self._connection.execute(
+                    "SELECT DISTINCT source FROM chunks"
+                )
+            }
+
+    def _similarities(
+        self,
+        arrays: Dict[str, np.ndarray],
+        queries: np.ndarray,
+        rows: Optional[np.ndarray] = None,
+        name: str = "vectors",
+    ) -> np.ndarray:
+        """Cosine similarity of the rows (all by default) with each query,
+        `-inf` for the deleted ones."""
+        select = slice(None) if rows is None else rows
+        scales = arrays.get("scales") if name == "vectors" else None
+        products = dot(
+            queries, arrays[name][select], None if scales is None else scales[select]
+        )
+        norms = np.asarray(arrays["norms"][select])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarities = products / (np.linalg.norm(queries, axis=1)[:, None] * norms)
+        similarities[:, norms == 0] = -np.inf
+        return similarities
+
+    def _search(
+        self, embeddings: List[List[float]], k: int
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Rows most similar to each embedding, and their similarities."""
+        queries = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            arrays = dict(self._arrays)
+            ann_index = self._ann_index
+            if ann_index is not None and ann_index.is_trained:
+                candidates = [ann_index.candidates(query) for query in queries]
+            else:
+                candidates = None
+        if not len(arrays["norms"]):
+            return [(np.zeros(0, dtype=int), np.zeros(0)) for _ in queries]
+
+        fetch_k = k * self.rescore_factor if self.rescore else k
+        results = []
+        if candidates is None:
+            for similarities in self._similarities(arrays, queries):
+                rows = self._top_k(similarities, fetch_k)
+                results.append((rows, similarities[rows]))
+        else:
+            for query, rows in zip(queries, candidates):
+                similarities = self._similarities(arrays, query[None], rows)[0]
+                top = self._top_k(similarities, fetch_k)
+                results.append((rows[top], similarities[top]))
+        if not self.rescore:
+            return results
+
+        rescored = []
+        for query, (rows, _) in zip(queries, results):
+            similarities = self._similarities(arrays, query[None], rows, "full")[0]
+            top = self._top_k(similarities, k)
+            rescored.append((rows[top], similarities[top]))
+        return rescored
+
+    @staticmethod
+    def _top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+        if k < len(similarities):
+            rows = np.argpartition(-similarities, k)[:k]
+        else:
+            rows = np.arange(len(similarities))
+        rows = rows[np.argsort(-similarities[rows], kind="stable")]
+        return rows[np.isfinite(similarities[rows])]
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        ((rows, similarities),) = self._search([embedding], k)
+        documents = self._get_rows(rows.tolist())
+        return list(zip(documents, similarities.tolist()))
+
+    def search_with_vectors(
+        self, embedding: List[float], k: int = 4
+    ) -> Tuple[List[Document], np.ndarray, np.ndarray]:
+        """Chunks most similar to the embedding, with their cosine similarity
+        and their vectors."""
+        ((rows, similarities),) = self._search([embedding], k)
+        with self._lock:
+            vectors = self._get_vectors(rows)
+        return self._get_rows(rows.tolist()), similarities, vectors
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self._embedding_function.embed_query(query), k
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score_by_vector(embedding, k)
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return self.similarity_search_by_vector(
+            self._embedding_function.embed_query(query), k
+        )
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score(query, k)
+
+    def max_marginal_relevance_search_batch_by_vector(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+    ) -> List[List[Document]]:
+        """MMR search for several queries at once."""
+        candidates = [rows for rows, _ in self._search(embeddings, fetch_k)]
+        with self._lock:
+            vectors = [self._get_vectors(rows) for rows in candidates]
+        selections = batch_maximal_marginal_relevance(
+            embeddings, vectors, lambda_mult=lambda_mult, k=k
+        )
+        return [
+            self._get_rows([int(rows[i]) for i in selected])
+            for rows, selected in zip(candidates, selections)
+        ]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_batch_by_vector(
+            [embedding], k, fetch_k, lambda_mult
+        )[0]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding_function.embed_query(query), k, fetch_k, lambda_mult
+        )
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [str(uuid.uuid1()) for _ in texts]
+        self.add_vectors(
+            ids, self._embedding_function.embed_documents(texts), texts, metadatas
+        )
+        return ids
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        persist_directory: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        vectorstore = cls(embedding, persist_directory=persist_directory)
+        vectorstore.add_texts(texts, metadatas)
+        return vectorstore
+
+
+def get_vectorstore(
+    embeddings: Embeddings, persist_directory: Optional[str] = None
+) -> VectorStore:
+    name = config["index"]["vectorstore"]
+    if name == "chroma":
+        return ChromaVectorStore(
+            persist_directory=persist_directory, embedding_function=embeddings
+        )
+    elif name == "numpy":
+        ann_config = config["index"]["ann"]
+        quantization_config = config["index"]["quantization"]
+        return NumpyVectorStore(
+            embeddings,
+            persist_directory=persist_directory,
+            ann_index=(
+                IVFIndex(
+                    lists=ann_config["lists"],
+                    probes=ann_config["probes"],
+                    min_rows=ann_config["min_rows"],
+                    iterations=ann_config["iterations"],
+                    retrain_growth=ann_config["retrain_growth"],
+                )
+                if ann_config["enabled"]
+                else None
+            ),
+            quantization=quantization_config["type"],
+            rescore=quantization_config["rescore"],
+            rescore_factor=quantization_config["rescore_factor"],
+        )
+    raise ValueError(f"Unknown vector store: {name}")
@@ -0,0 +1,299 @@
+import os
+import re
+import fnmatch
+from typing import Iterable, Iterator, List, Optional, Pattern, Tuple
+
+from .consts import WILDCARDS, IGNORED_DIRECTORIES, IGNORE_FILES
+
+
+def _translate_pattern(pattern: str) -> str:
+    """Translate a gitignore glob (without anchors or flags) into a regex."""
+    i, n = 0, len(pattern)
+    regex = []
+
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern[i : i + 3] == "**/":
+                regex.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern[i : i + 2] == "**":
+                regex.append(".*")
+                i += 2
+                continue
+            regex.append("[^/]*")
+        elif c == "?":
+            regex.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 1)
+            if j == -1:
+                regex.append(re.escape(c))
+            else:
+                chars = pattern[i + 1 : j]
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+                regex.append(f"[{chars}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(c))
+        i += 1
+
+    return "".join(regex)
+
+
+class IgnorePattern:
+    """A single line of a `.gitignore`-style file."""
+
+    def __init__(self, base_path: str, line: str):
+        self.base_path = base_path
+        self.negated = False
+        self.dir_only = False
+
+        if line.startswith("!"):
+            self.negated = True
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+
+        if line.endswith("/"):
+            self.dir_only = True
+            line = line.rstrip("/")
+
+        # Patterns with a slash at the beginning or in the middle are relative
+        # to the directory holding the ignore file, the rest match at any depth
+        self.name_only = "/" not in line
+        if self.name_only:
+            # Only matched against the name of each entry
+            self.name_regex = _translate_pattern(line) + r"\Z"
+            line = "**/" + line
+        else:
+            line = line.lstrip("/")
+
+        self.regex = re.compile(_translate_pattern(line) + r"\Z", re.DOTALL)
+
+    def match(self, relative_path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.match(relative_path) is not None
+
+
+class IgnoreFile:
+    """The patterns of an ignore file, matched with two regexes: one for the
+    patterns of names and one for those of paths."""
+
+    def __init__(self, base: str, patterns: List[IgnorePattern]):
+        # Directory of the file relative to the root of the walk, "" for the
+        # root itself
+        self.prefix_length = len(base) + 1 if base else 0
+        self.negated = [pattern.negated for pattern in patterns]
+        self._regexes = {
+            is_dir: (
+                self._compile(patterns, is_dir, name_only=True),
+                self._compile(patterns, is_dir, name_only=False),
+            )
+            for is_dir in (True, False)
+        }
+
+    @staticmethod
+    def _compile(
+        patterns: List[IgnorePattern], is_dir: bool, name_only: bool
+    ) -> Tuple[Optional[Pattern], List[int]]:
+        """A regex of the patterns, with the line of each of its groups."""
+        lines = [
+            line
+            for line in reversed(range(len(patterns)))
+            if patterns[line].name_only == name_only
+            and (is_dir or not patterns[line].dir_only)
+        ]
+        if not lines:
+            return None, []
+        # Alternatives are tried in order, so the last line goes first
+        regexes = [
+            patterns[line].name_regex if name_only else patterns[line].regex.pattern
+            for line in lines
+        ]
+        regex = re.compile("|".join(f"({regex})" for regex in regexes), re.DOTALL)
+        return regex, lines
+
+    @staticmethod
+    def _last_line(regex: Optional[Pattern], lines: List[int], *args) -> int:
+        if regex is None:
+            return -1
+        match = regex.match(*args)
+        return -1 if match is None else lines[match.lastindex - 1]
+
+    def match(self, relative_path: str, name: str, is_dir: bool) -> Optional[bool]:
+        """Whether a path (relative to the root of the walk) is ignored, or
+        `None` if no pattern matches it."""
+        (name_regex, name_lines), (path_regex, path_lines) = self._regexes[is_dir]
+        line = max(
+            self._last_line(name_regex, name_lines, name),
+            self._last_line(path_regex, path_lines, relative_path, self.prefix_length),
+        )
+        if line == -1:
+            return None
+        return not self.negated[line]
+
+
+class IgnoreRules:
+    """Ignore files found from the root of the walk down to a directory.
+
+    Patterns from deeper ignore files, and later lines in the same file, take
+    precedence, as in git.
+    """
+
+    def __init__(self, files: Optional[List[IgnoreFile]] = None):
+        self.files = files or []
+
+    @staticmethod
+    def read_patterns(directory: str, file_names: Iterable[str]) -> List[IgnorePattern]:
+        patterns = []
+
+        for file_name in file_names:
+            file_path = os.path.join(directory, file_name)
+            try:
+                with open(file_path, encoding="utf-8", errors="replace") as f:
+                    lines = f.read().splitlines()
+            except OSError:
+                continue
+
+            for line in lines:
+                line = line.rstrip()
+                if not line or line.startswith("#"):
+                    continue
+                patterns.append(IgnorePattern(directory, line))
+
+        return patterns
+
+    def extend(self, base: str, patterns: List[IgnorePattern]) -> "IgnoreRules":
+        if not patterns:
+            return self
+        return IgnoreRules(self.files + [IgnoreFile(base, patterns)])
+
+    def is_ignored(self, relative_path: str, is_dir: bool) -> bool:
+        """Whether a path, relative to the root of the walk and with `/`
+        separators, is ignored."""
+        name = relative_path.rsplit("/", 1)[-1]
+        for ignore_file in reversed(self.files):
+            ignored = ignore_file.match(relative_path, name, is_dir)
+            if ignored is not None:
+                return ignored
+        return False
+
+
+class WildcardMatcher:
+    """Match file names against every wildcard in a single lookup.
+
+    `*.ext` and literal names are resolved with set lookups; any other pattern
+    falls back to `fnmatch`.
+    """
+
+    def __init__(self, wildcards: Iterable[str]):
+        self.extensions = set()
+        self.names = set()
+        self.patterns = []
+
+        for wildcard in wildcards:
+            suffix = wildcard[2:]
+            if wildcard.startswith("*.") and not re.search(r"[*?\[]", suffix):
+                self.extensions.add(suffix)
+            elif not re.search(r"[*?\[]", wildcard):
+                self.names.add(wildcard)
+            else:
+                self.patterns.append(wildcard)
+
+    def match(self, file_name: str) -> bool:
+        if file_name in self.names:
+            return True
+        # Compound extensions (e.g. `*.d.ts`) need every candidate suffix
+        parts = file_name.split(".")
+        for i in range(1, len(parts)):
+            if ".".join(parts[i:]) in self.extensions:
+                return True
+        return any(fnmatch.fnmatchcase(file_name, pattern) for pattern in self.patterns)
+
+
+def is_virtualenv(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, "pyvenv.cfg"))
+
+
+def walk_repository(
+    path: str,
+    wildcards: Iterable[str] = WILDCARDS,
+    ignored_directories: Iterable[str] = IGNORED_DIRECTORIES,
+    ignore_files: Iterable[str] = IGNORE_FILES,
+) -> Iterator[str]:
+    """Lazily yield the files under `path` matching any of `wildcards`.
+
+    The tree is walked once with `os.scandir`, in sorted order. Hidden entries,
+    `ignored_directories`, virtualenvs and anything matched by the ignore files
+    found along the way are pruned before descending.
+    """
+    matcher = WildcardMatcher(wildcards)
+    ignored_directories = set(ignored_directories)
+    ignore_files = tuple(ignore_files)
+    visited = set()
+
+    # Each directory with its path relative to the root, to match the ignore
+    # patterns without computing it for every entry and pattern
+    stack: List[Tuple[str, str, IgnoreRules]] = [
+        (os.path.abspath(path), "", IgnoreRules())
+    ]
+
+    while stack:
+        directory, relative_directory, rules = stack.pop()
+
+        real_path = os.path.realpath(directory)
+        if real_path in visited:
+            continue
+        visited.add(real_path)
+
+        rules = rules.extend(
+            relative_directory, IgnoreRules.read_patterns(directory, ignore_files)
+        )
+
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            # Same as glob, hidden files and directories are never matched
+            if entry.name.startswith("."):
+                continue
+
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+
+            relative_path = (
+                f"{relative_directory}/{entry.name}"
+                if relative_directory
+                else entry.name
+            )
+            if is_dir:
+                if entry.name in ignored_directories or is_virtualenv(entry.path):
+                    continue
+                if rules.is_ignored(relative_path, is_dir=True):
+                    continue
+                subdirectories.append((entry.path, relative_path))
+            elif matcher.match(entry.name):
+                if rules.is_ignored(relative_path, is_dir=False):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                yield entry.path
+
+        # Reversed so the stack pops subdirectories in sorted order
+        for subdirectory, relative_subdirectory in reversed(subdirectories):
+            stack.append((subdirectory, relative_subdirectory, rules))
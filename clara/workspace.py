@@ -0,0 +1,325 @@
+import os
+import threading
+import contextlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.schema import BaseRetriever
+
+from .config import config
+from .embeddings import get_embeddings
+from .index import RepositoryIndex
+from .mmr import maximal_marginal_relevance
+from .paths import get_persist_path
+from .retrievers import HybridRetriever, fuse
+from .tracing import tracer
+
+REPOSITORY_KEY = "repository"
+
+
+def read_workspace(file_path: str) -> List[str]:
+    """Paths of the repositories listed in a workspace file, one per line and
+    relative to it (lines starting with `#` are comments)."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    with open(file_path) as f:
+        lines = [line.strip() for line in f]
+    return [
+        os.path.normpath(os.path.join(directory, os.path.expanduser(line)))
+        for line in lines
+        if line and not line.startswith("#")
+    ]
+
+
+def get_storage_size(persist_path: str) -> int:
+    """Bytes of the vector DB files of a repository, to estimate the memory
+    it takes when opened (SQLite files are read on demand)."""
+    size = 0
+    for directory, _, file_names in os.walk(persist_path):
+        for file_name in file_names:
+            if not file_name.endswith(".sqlite"):
+                size += os.path.getsize(os.path.join(directory, file_name))
+    return size
+
+
+# A chunk found in a repository, with its score and its vector (if it was
+# found by the vector store)
+Hit = Tuple[Document, float, Optional[np.ndarray]]
+
+
+class Workspace:
+    """Indexes of several repositories, searched together.
+
+    Each index is opened the first time it's searched, and stays open while
+    the open ones fit in `memory_budget` (in bytes, estimated by the size of
+    their files); beyond it the least recently used are closed.
+    """
+
+    def __init__(
+        self,
+        paths: List[str],
+        memory_budget: int,
+        concurrency: int = 8,
+        persist_path: Optional[str] = None,
+        jobs: Optional[int] = None,
+    ):
+        self.embeddings = get_embeddings()
+        self.indexes = {
+            os.path.abspath(path): RepositoryIndex(
+                path, jobs=jobs, embeddings=self.embeddings
+            )
+            for path in paths
+        }
+        self.names = self._get_names(list(self.indexes))
+        self.memory_budget = memory_budget
+        # For the chat history
+        self.persist_path = persist_path
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # Size of the open indexes, least recently used first
+        self._open: Dict[str, int] = collections.OrderedDict()
+        self._in_use = collections.Counter()
+        self._lock = threading.Lock()
+        self._loading = {path: threading.Lock() for path in self.indexes}
+
+    @staticmethod
+    def _get_names(paths: List[str]) -> Dict[str, str]:
+        """Name of each repository, its directory unless it's repeated."""
+        names = collections.Counter(os.path.basename(path) for path in paths)
+        return {
+            path: os.path.basename(path) if names[os.path.basename(path)] == 1 else path
+            for path in paths
+        }
+
+    def _evict(self):
+        """Close the least recently used indexes over the memory budget (with
+        the lock held)."""
+        for path in list(self._open):
+            if sum(self._open.values()) <= self.memory_budget:
+                return
+            if not self._in_use[path]:
+                self.indexes[path].close()
+                del self._open[path]
+
+    def _opened(self, path: str):
+        with self._lock:
+            self._open[path] = get_storage_size(self.indexes[path].persist_path)
+            self._evict()
+
+    @contextlib.contextmanager
+    def _use(self, path: str) -> Iterator[RepositoryIndex]:
+        """The index of a repository, opened if needed and not closed while
+        it's used."""
+        index = self.indexes[path]
+        with self._lock:
+            self._in_use[path] += 1
+            if path in self._open:
+                self._open.move_to_end(path)
+        try:
+            with self._loading[path]:
+                if index.index is None:
+                    with tracer.span("workspace.open", repository=self.names[path]):
+                        index.load()
+                    self._opened(path)
+            yield index
+        finally:
+            with self._lock:
+                self._in_use[path] -= 1
+                self._evict()
+
+    def ingest(self, on_repository: Optional[Callable[[str], None]] = None):
+        """Update the index of every repository, one at a time.
+
+        Those without changes aren't opened, until they're searched.
+        """
+        for path, index in self.indexes.items():
+            if on_repository is not None:
+                on_repository(path)
+            with self._lock:
+                self._in_use[path] += 1
+            try:
+                with self._loading[path]:
+                    if index.is_up_to_date():
+                        continue
+                    if index.ingest():
+                        index.persist()
+                    self._opened(path)
+            finally:
+                with self._lock:
+                    self._in_use[path] -= 1
+                    self._evict()
+
+    def map(self, function: Callable[[str], Any]) -> List[Any]:
+        """Call `function` with each repository, in parallel."""
+        return list(self._executor.map(function, self.indexes))
+
+    def _tag(self, path: str, documents: List[Document]) -> List[Document]:
+        return [
+            Document(
+                page_content=document.page_content,
+                metadata={**document.metadata, REPOSITORY_KEY: self.names[path]},
+            )
+            for document in documents
+        ]
+
+    def search_vectors(self, path: str, embedding: List[float], k: int) -> List[Hit]:
+        with self._use(path) as index:
+            documents, similarities, vectors = (
+                index.index.vectorstore.search_with_vectors(embedding, k)
+            )
+        return list(zip(self._tag(path, documents), similarities.tolist(), vectors))
+
+    def search_lexical(
+        self, path: str, query: str, k: int, symbols: bool = False
+    ) -> List[Hit]:
+        with self._use(path) as index:
+            search = (
+                index.lexical_index.search_symbols
+                if symbols
+                else index.lexical_index.search_query
+            )
+            hits = search(query, k)
+            documents = index.index.vectorstore.get_documents(
+                [chunk_id for chunk_id, _ in hits]
+            )
+        return [
+            (document, score, None)
+            for document, (_, score) in zip(self._tag(path, documents), hits)
+        ]
+
+    def get_query_cache(self) -> None:
+        # Cached results couldn't be dropped when a single repository changes
+        return None
+
+    def get_retriever(self) -> "WorkspaceRetriever":
+        search_type = config["index"]["search_type"]
+        hybrid_config = config["index"]["hybrid"]
+        return WorkspaceRetriever(
+            self,
+            k=config["index"]["k"],
+            fetch_k=(
+                config["index"]["mmr"]["fetch_k"]
+                if search_type == "mmr"
+                else config["index"]["k"]
+            ),
+            lambda_mult=(
+                config["index"]["mmr"]["lambda_mult"] if search_type == "mmr" else None
+            ),
+            lexical_fetch_k=(
+                hybrid_config["fetch_k"] if hybrid_config["enabled"] else None
+            ),
+            rrf_k=hybrid_config["rrf_k"],
+        )
+
+
+def merge_hits(results: List[List[Hit]], k: int) -> List[Hit]:
+    """The `k` best hits of all the repositories."""
+    hits = [hit for result in results for hit in result]
+    return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+
+class WorkspaceRetriever(BaseRetriever):
+    """Search every repository of a workspace at the same time, merging their
+    results as if they were in a single index.
+
+    The query is embedded once, the best `fetch_k` chunks of each vector
+    store are merged by similarity (and diversified with MMR if
+    `lambda_mult` is given), and fused with the best chunks of the lexical
+    indexes, whose BM25 scores are only roughly comparable between
+    repositories. Each chunk has the name of its repository in its metadata.
+    """
+
+    def __init__(
+        self,
+        workspace: Workspace,
+        k: int,
+        fetch_k: int,
+        lambda_mult: Optional[float] = None,
+        lexical_fetch_k: Optional[int] = None,
+        rrf_k: int = 60,
+    ):
+        self.workspace = workspace
+        self.k = k
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        # `None` without the lexical indexes
+        self.lexical_fetch_k = lexical_fetch_k
+        self.rrf_k = rrf_k
+
+    def _lookup_symbols(self, query: str) -> Optional[List[Document]]:
+        if self.lexical_fetch_k is None or not HybridRetriever.is_symbol_query(query):
+            return None
+        hits = merge_hits(
+            self.workspace.map(
+                lambda path: self.workspace.search_lexical(
+                    path, query, self.k, symbols=True
+                )
+            ),
+            self.k,
+        )
+        return [document for document, _, _ in hits] or None
+
+    def _search_vectors(self, query: str) -> List[Document]:
+        embedding = self.workspace.embeddings.embed_query(query)
+        hits = merge_hits(
+            self.workspace.map(
+                lambda path: self.workspace.search_vectors(
+                    path, embedding, self.fetch_k
+                )
+            ),
+            self.fetch_k,
+        )
+        if self.lambda_mult is None:
+            return [document for document, _, _ in hits[: self.k]]
+
+        selected = maximal_marginal_relevance(
+            embedding,
+            [vector for _, _, vector in hits],
+            lambda_mult=self.lambda_mult,
+            k=self.k,
+        )
+        return [hits[i][0] for i in selected]
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        with tracer.span("workspace.search", repositories=len(self.workspace.indexes)):
+            documents = self._lookup_symbols(query)
+            if documents is not None:
+                return documents
+
+            vector_documents = self._search_vectors(query)
+            if self.lexical_fetch_k is None:
+                return vector_documents
+
+            lexical_documents = [
+                document
+                for document, _, _ in merge_hits(
+                    self.workspace.map(
+                        lambda path: self.workspace.search_lexical(
+                            path, query, self.lexical_fetch_k
+                        )
+                    ),
+                    self.lexical_fetch_k,
+                )
+            ]
+            return fuse(vector_documents, lexical_documents, self.k, self.rrf_k)
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        return self.get_relevant_documents(query)
+
+
+def get_workspace(file_path: str, jobs: Optional[int] = None) -> Workspace:
+    workspace_config = config["workspace"]
+    paths = read_workspace(file_path)
+    if not paths:
+        raise Exception(f"No repositories in the workspace {file_path}")
+    for path in paths:
+        if not os.path.isdir(path):
+            raise Exception(f"Path does not exists: {path}")
+    return Workspace(
+        paths,
+        memory_budget=workspace_config["memory_budget"] * 1024 * 1024,
+        concurrency=workspace_config["concurrency"],
+        persist_path=get_persist_path(file_path),
+        jobs=jobs,
+    )
@@ -0,0 +1,91 @@
+"""Recall@k and latency of the approximate (IVF) search of the numpy vector
+store, against exact search.
+
+Random embeddings are clustered around topics, like the chunks of a code
+base. Run from the root of the repository with:
+
+    python -m tests.benchmarks.ann --rows 1000000
+"""
+
+import time
+import tempfile
+import argparse
+
+import numpy as np
+
+from clara.ann import IVFIndex
+from clara.vectorstore import NumpyVectorStore
+
+
+def generate(random, centers: np.ndarray, rows: int, noise: float) -> np.ndarray:
+    vectors = centers[random.integers(0, len(centers), rows)]
+    vectors += random.normal(scale=noise, size=vectors.shape).astype(np.float32)
+    return vectors
+
+
+def search(vectorstore, queries, k: int):
+    start = time.perf_counter()
+    results = [
+        {document.page_content for document in documents}
+        for documents in (
+            vectorstore.similarity_search_by_vector(query, k=k) for query in queries
+        )
+    ]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=1000)
+    # Spread of the chunks of a topic, relative to the distance between topics
+    parser.add_argument("--noise", type=float, default=1.5)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=6)
+    args = parser.parse_args()
+
+    random = np.random.default_rng(0)
+    centers = random.normal(size=(args.topics, args.dimension)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        ann_index = IVFIndex(lists=args.lists, min_rows=0)
+        vectorstore = NumpyVectorStore(None, tmp, ann_index=ann_index)
+        for start in range(0, args.rows, 50000):
+            vectors = generate(
+                random, centers, min(50000, args.rows - start), args.noise
+            )
+            ids = [str(i) for i in range(start, start + len(vectors))]
+            vectorstore.add_vectors(
+                ids, vectors, ids, [{"source": "benchmark"} for _ in ids]
+            )
+        vectorstore.persist()
+
+        start = time.perf_counter()
+        vectorstore.update_ann_index()
+        print(
+            f"{len(ann_index.centroids)} lists trained in "
+            f"{time.perf_counter() - start:.1f} s"
+        )
+
+        queries = generate(random, centers, args.queries, args.noise)
+        vectorstore._ann_index = None
+        exact, exact_time = search(vectorstore, queries, args.k)
+        vectorstore._ann_index = ann_index
+
+        print(
+            f"{'probes':>8}{'recall@' + str(args.k):>12}{'ms/query':>12}{'speedup':>10}"
+        )
+        print(f"{'exact':>8}{1:>12.3f}{1000 * exact_time:>12.2f}{1:>9.1f}x")
+        for probes in (1, 2, 4, 8, 16, 32, 64):
+            ann_index.probes = probes
+            results, ann_time = search(vectorstore, queries, args.k)
+            recall = np.mean([len(a & b) / args.k for a, b in zip(results, exact)])
+            print(
+                f"{probes:>8}{recall:>12.3f}{1000 * ann_time:>12.2f}"
+                f"{exact_time / ann_time:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Latency and results of MMR selection.
+
+Compares the selection of langchain, used by Chroma, with `clara.mmr` for
+single queries and for a batch of queries, on random embeddings clustered
+around a few topics (so that there are near duplicates to diversify).
+
+Run from the root of the repository with:
+
+    python -m tests.benchmarks.mmr
+"""
+
+import time
+import argparse
+
+import numpy as np
+from langchain.vectorstores import utils
+
+from clara.mmr import batch_maximal_marginal_relevance, maximal_marginal_relevance
+
+
+def generate(random, queries: int, fetch_k: int, dimension: int):
+    topics = random.normal(size=(queries, 8, dimension))
+    assigned = random.integers(0, 8, size=(queries, fetch_k))
+    candidates = topics[np.arange(queries)[:, None], assigned]
+    candidates += 0.3 * random.normal(size=candidates.shape)
+    query_embeddings = topics[:, 0] + random.normal(size=(queries, dimension))
+    return query_embeddings.astype(np.float32), candidates.astype(np.float32)
+
+
+def redundancy(candidates: np.ndarray, selected) -> float:
+    """Greatest cosine similarity between two selected candidates."""
+    vectors = candidates[selected]
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -1)
+    return float(similarity.max())
+
+
+def measure(select, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = select()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random = np.random.default_rng(0)
+    print(
+        f"{'k':>4}{'fetch_k':>9}{'langchain (ms)':>16}{'clara (ms)':>12}"
+        f"{'batch (ms)':>12}{'speedup':>10}{'same':>7}{'redundancy':>12}"
+    )
+    for k, fetch_k in ((6, 20), (6, 100), (20, 100), (50, 200)):
+        queries, candidates = generate(random, args.queries, fetch_k, args.dimension)
+
+        time_before, before = measure(
+            lambda: [
+                utils.maximal_marginal_relevance(
+                    query, list(embeddings), lambda_mult=args.lambda_mult, k=k
+                )
+                for query, embeddings in zip(queries, candidates)
+            ],
+            args.repeat,
+        )
+        time_after, after = measure(
+            lambda: [
+                maximal_marginal_relevance(
+                    query, embeddings, lambda_mult=args.lambda_mult, k=k
+                )
+                for query, embeddings in zip(queries, candidates)
+            ],
+            args.repeat,
+        )
+        time_batch, batch = measure(
+            lambda: batch_maximal_marginal_relevance(
+                queries, candidates, lambda_mult=args.lambda_mult, k=k
+            ),
+            args.repeat,
+        )
+
+        # Only differ on ties, from rounding
+        same = np.mean([a == b == c for a, b, c in zip(before, after, batch)])
+        top_k = np.argsort(-np.einsum("qnd,qd->qn", candidates, queries), axis=1)
+        print(
+            f"{k:>4}{fetch_k:>9}"
+            f"{1000 * time_before / args.queries:>16.2f}"
+            f"{1000 * time_after / args.queries:>12.2f}"
+            f"{1000 * time_batch / args.queries:>12.2f}"
+            f"{time_before / time_batch:>9.0f}x"
+            f"{same:>7.0%}"
+            # Of the selected chunks, and of the k most similar ones
+            f"{np.mean([redundancy(c, s) for c, s in zip(candidates, after)]):>6.2f}"
+            f"{np.mean([redundancy(c, s[:k]) for c, s in zip(candidates, top_k)]):>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
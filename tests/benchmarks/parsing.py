@@ -0,0 +1,148 @@
+"""Parse time per MB of Python and JavaScript code.
+
+Compares the parsers, which parse each file once, with the previous approach
+of parsing it again to validate it, extract the functions and classes and
+simplify the code.
+
+Run from the root of the repository with:
+
+    python -m tests.benchmarks.parsing
+"""
+
+import ast
+import time
+import argparse
+
+import esprima
+
+from clara.index import PythonParsing, JavascriptParsing
+
+PYTHON_BLOCK = '''
+import os
+
+
+def function_{i}(a, b):
+    """Add two numbers."""
+    result = a + b
+    for value in range(10):
+        result += value * {i}
+    return result
+
+
+class Class{i}:
+    def __init__(self):
+        self.value = {i}
+
+    def method(self, other):
+        return [self.value + item for item in other]
+
+
+VALUE_{i} = function_{i}(1, 2)
+'''
+
+JAVASCRIPT_BLOCK = """
+const os{i} = require('os');
+
+function function{i}(a, b) {{
+    let result = a + b;
+    for (let value = 0; value < 10; value++) {{
+        result += value * {i};
+    }}
+    return result;
+}}
+
+class Class{i} {{
+    constructor() {{
+        this.value = {i};
+    }}
+
+    method(other) {{
+        return other.map((item) => this.value + item);
+    }}
+}}
+
+const value{i} = function{i}(1, 2);
+"""
+
+
+def generate_code(block: str, size: int) -> str:
+    blocks = []
+    total = 0
+    i = 0
+    while total < size:
+        code = block.format(i=i)
+        blocks.append(code)
+        total += len(code)
+        i += 1
+    return "".join(blocks)
+
+
+def legacy_python(code: str):
+    lines = code.splitlines()
+    ast.parse(code)
+    for tree in (ast.parse(code), ast.parse(code)):
+        for node in ast.iter_child_nodes(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                "\n".join(lines[node.lineno - 1 : node.end_lineno])
+
+
+def legacy_javascript(code: str):
+    lines = code.splitlines()
+    esprima.parseScript(code)
+    for tree in (
+        esprima.parseScript(code, loc=True),
+        esprima.parseScript(code, loc=True),
+    ):
+        for node in tree.body:
+            if isinstance(
+                node,
+                (esprima.nodes.FunctionDeclaration, esprima.nodes.ClassDeclaration),
+            ):
+                "\n".join(lines[node.loc.start.line - 1 : node.loc.end.line])
+
+
+def current(Parser):
+    def parse(code: str):
+        parser = Parser(code)
+        parser.is_valid()
+        parser.extract_functions_classes()
+        parser.simplify_code()
+
+    return parse
+
+
+def measure(parse, code: str, repeat: int) -> float:
+    """Best time, in seconds per MB."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(code)
+        best = min(best, time.perf_counter() - start)
+    return best / (len(code.encode("utf-8")) / 1024 / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=float, default=1.0, help="Code size in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    size = int(args.size * 1024 * 1024)
+    benchmarks = (
+        ("python", PYTHON_BLOCK, legacy_python, current(PythonParsing)),
+        ("javascript", JAVASCRIPT_BLOCK, legacy_javascript, current(JavascriptParsing)),
+    )
+
+    print(f"{'language':<12}{'before (s/MB)':>16}{'after (s/MB)':>16}{'speedup':>10}")
+    for language, block, before, after in benchmarks:
+        code = generate_code(block, size)
+        time_before = measure(before, code, args.repeat)
+        time_after = measure(after, code, args.repeat)
+        print(
+            f"{language:<12}{time_before:>16.3f}{time_after:>16.3f}"
+            f"{time_before / time_after:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Time of each stage of indexing a repository and answering questions.
+
+Runs offline: the repository is synthetic (see `tests.benchmarks.synthetic`)
+unless `--repository` is given, embeddings are hashed words (optionally with
+a simulated API latency) and the LLM is a stub. Results are written as JSON
+with `--output`, and `--compare` prints the change from a previous result.
+
+Run from the root of the repository with:
+
+    python -m tests.benchmarks.pipeline --files 500 --output after.json
+    python -m tests.benchmarks.pipeline --files 500 --compare before.json
+"""
+
+import os
+import json
+import time
+import random
+import platform
+import tempfile
+import argparse
+import subprocess
+import statistics
+from typing import Any, Callable, Dict, List
+
+from langchain.chains import LLMChain
+from langchain.document_loaders import TextLoader
+from langchain.indexes.vectorstore import VectorStoreIndexWrapper
+from langchain.schema import AIMessage, HumanMessage
+
+from clara.chat import ChatChain
+from clara.config import config
+from clara.consts import WILDCARDS
+from clara.index import CodeLoader, RepositoryIndex, get_text_splitter
+from clara.lexical import LexicalIndex, LEXICAL_INDEX_FILE_NAME
+from clara.prompts import CONDENSE_QUESTION_PROMPT, ANSWER_QUESTION_PROMPT
+from clara.splitter import CodeTextSplitter
+from clara.vectorstore import get_vectorstore
+from clara.walker import walk_repository
+from tests.benchmarks.synthetic import WORDS, generate_repository, parse_languages
+from tests.fakes import ByteEncoding, FakeEmbeddings, StubLLM
+
+
+QUESTIONS = (
+    "How is the {noun} of the {other} computed?",
+    "Where is add_{noun} defined?",
+    "What does the {noun} {other} code do?",
+)
+
+
+def timed(stages: Dict[str, Dict], stage: str, function: Callable, items=None):
+    start = time.perf_counter()
+    value = function()
+    seconds = time.perf_counter() - start
+    stages[stage] = {"seconds": seconds}
+    if items is not None:
+        count = items(value)
+        stages[stage].update(items=count, per_second=count / seconds)
+    return value
+
+
+def latencies(stages: Dict[str, Dict], stage: str, function: Callable, inputs):
+    """Time `function` for each input, with the percentiles of the latency."""
+    times = []
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        function(item)
+        times.append(time.perf_counter() - call_start)
+    times.sort()
+    stages[stage] = {
+        "seconds": time.perf_counter() - start,
+        "items": len(times),
+        "mean_ms": 1000 * statistics.mean(times),
+        "p50_ms": 1000 * times[len(times) // 2],
+        "p95_ms": 1000 * times[min(len(times) - 1, int(len(times) * 0.95))],
+    }
+
+
+def get_splitter():
+    try:
+        return get_text_splitter(), "tiktoken"
+    except Exception:
+        # The encoding can't be downloaded, the chunks will be smaller
+        return (
+            CodeTextSplitter(
+                config["index"]["chunk_size"],
+                config["index"]["chunk_overlap"],
+                ByteEncoding(),
+            ),
+            "bytes",
+        )
+
+
+def load(file_path: str):
+    if CodeLoader.has_loader(file_path):
+        return CodeLoader(file_path).load()
+    return TextLoader(file_path).load()
+
+
+def get_questions(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUESTIONS).format(noun=noun, other=other)
+        for noun, other in (rng.sample(WORDS, 2) for _ in range(count))
+    ]
+
+
+def run(root: str, args: argparse.Namespace) -> Dict[str, Any]:
+    config["index"]["vectorstore"] = args.vectorstore
+    stages = {}
+
+    file_paths = timed(
+        stages, "discovery", lambda: list(walk_repository(root, WILDCARDS)), len
+    )
+    loaded = timed(
+        stages,
+        "parsing",
+        lambda: [document for path in file_paths for document in load(path)],
+        lambda _: len(file_paths),
+    )
+    splitter, tokenizer = get_splitter()
+    documents = timed(
+        stages, "splitting", lambda: splitter.split_documents(loaded), len
+    )
+
+    embeddings = FakeEmbeddings(
+        dimension=args.dimension,
+        latency=args.embedding_latency,
+        batch_size=config["index"]["embeddings"]["batch_size"],
+        concurrency=config["index"]["embeddings"]["concurrency"],
+    )
+    texts = [document.page_content for document in documents]
+    vectors = timed(stages, "embedding", lambda: embeddings.embed_documents(texts), len)
+    stages["embedding"]["requests"] = embeddings.requests
+
+    with tempfile.TemporaryDirectory() as persist_path:
+        vectorstore = get_vectorstore(embeddings, persist_path)
+        lexical_index = LexicalIndex(
+            os.path.join(persist_path, LEXICAL_INDEX_FILE_NAME)
+        )
+
+        def upsert():
+            batch_size = config["index"]["upsert_batch_size"]
+            ids = [str(i) for i in range(len(documents))]
+            metadatas = [document.metadata for document in documents]
+            sources = [metadata["source"] for metadata in metadatas]
+            for i in range(0, len(documents), batch_size):
+                batch = slice(i, i + batch_size)
+                vectorstore.add_vectors(
+                    ids[batch], vectors[batch], texts[batch], metadatas[batch]
+                )
+                lexical_index.add(ids[batch], sources[batch], texts[batch])
+            vectorstore.update_ann_index()
+            vectorstore.persist()
+            lexical_index.commit()
+            return ids
+
+        timed(stages, "upsert", upsert, len)
+
+        index = RepositoryIndex(root, in_memory=True)
+        index.index = VectorStoreIndexWrapper(vectorstore=vectorstore)
+        index.lexical_index = lexical_index
+        retriever = index.get_retriever()
+        questions = get_questions(args.questions, args.seed)
+        latencies(stages, "retrieval", retriever.get_relevant_documents, questions)
+
+        chain = ChatChain(
+            condense_chain=LLMChain(
+                llm=StubLLM(latency=args.llm_latency),
+                prompt=CONDENSE_QUESTION_PROMPT,
+            ),
+            answer_chain=LLMChain(
+                llm=StubLLM(latency=args.llm_latency),
+                prompt=ANSWER_QUESTION_PROMPT,
+            ),
+            retriever=retriever,
+        )
+        chat_stages = []
+
+        def ask(question: str):
+            # Every other question follows up the previous one, so it's
+            # condensed
+            chat_history = []
+            if len(chat_stages) % 2:
+                chat_history = [
+                    HumanMessage(content=questions[0]),
+                    AIMessage(content="The answer."),
+                ]
+            outputs = chain._call({"question": question, "chat_history": chat_history})
+            chat_stages.append(outputs["timings"])
+
+        latencies(stages, "chat", ask, questions)
+        stages["chat"]["stages_ms"] = {
+            stage: 1000
+            * statistics.mean(timings.get(stage, 0) for timings in chat_stages)
+            for stage in sorted({stage for timings in chat_stages for stage in timings})
+        }
+
+    return {
+        "commit": get_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": {**vars(args), "tokenizer": tokenizer},
+        "repository": {"files": len(file_paths), "chunks": len(documents)},
+        "stages": stages,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, Any], baseline: Dict[str, Any] = None):
+    repository = results["repository"]
+    print(f"{repository['files']} files, {repository['chunks']} chunks")
+    header = f"{'stage':<12}{'seconds':>10}{'items':>8}{'items/s':>12}{'p50 ms':>10}"
+    if baseline is not None:
+        header += f"{'before':>10}{'change':>9}"
+    print(header)
+    for stage, result in results["stages"].items():
+        per_second = result.get("per_second")
+        p50 = result.get("p50_ms")
+        line = (
+            f"{stage:<12}{result['seconds']:>10.3f}{result.get('items', ''):>8}"
+            f"{'' if per_second is None else f'{per_second:.0f}':>12}"
+            f"{'' if p50 is None else f'{p50:.2f}':>10}"
+        )
+        before = (baseline or {}).get("stages", {}).get(stage)
+        if before is not None:
+            change = result["seconds"] / before["seconds"] - 1
+            line += f"{before['seconds']:>10.3f}{change:>+9.0%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repository", help="Instead of a synthetic one")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--languages", default="python=0.6,javascript=0.3,markdown=0.1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vectorstore", default="numpy")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument(
+        "--embedding-latency", type=float, default=0, help="Seconds per request"
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0, help="Seconds per completion"
+    )
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON file of previous results")
+    args = parser.parse_args()
+
+    if args.repository:
+        results = run(os.path.abspath(args.repository), args)
+    else:
+        with tempfile.TemporaryDirectory() as root:
+            generate_repository(
+                root, args.files, parse_languages(args.languages), seed=args.seed
+            )
+            results = run(root, args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
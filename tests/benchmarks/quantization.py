@@ -0,0 +1,119 @@
+"""Size and recall@k of the quantized storage of the numpy vector store.
+
+Stores the same vectors as float32, float16 and int8, with and without
+re-scoring at full precision, and compares their search with the exact one.
+The vectors are random, clustered around topics, or those of the index of a
+repository (built with `index.vectorstore: numpy`, see `clara config`):
+
+    python -m tests.benchmarks.quantization
+    python -m tests.benchmarks.quantization --index ~/.cache/clara/<repository>
+"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import argparse
+
+import numpy as np
+
+from clara.vectorstore import CHUNKS_FILE_NAME, NumpyVectorStore
+
+
+STORAGES = (
+    ("float32", False),
+    ("float16", False),
+    ("float16", True),
+    ("int8", False),
+    ("int8", True),
+)
+
+
+def generate(random, rows: int, dimension: int, topics: int) -> np.ndarray:
+    centers = random.normal(size=(topics, dimension)).astype(np.float32)
+    vectors = centers[random.integers(0, topics, rows)]
+    vectors += random.normal(scale=1.5, size=vectors.shape).astype(np.float32)
+    return vectors
+
+
+def load(path: str) -> np.ndarray:
+    with sqlite3.connect(os.path.join(path, CHUNKS_FILE_NAME)) as connection:
+        row = connection.execute(
+            "SELECT value FROM meta WHERE key = 'storage'"
+        ).fetchone()
+    storage = json.loads(row[0]) if row else {}
+    vectorstore = NumpyVectorStore(None, path, **storage)
+    live = np.asarray(vectorstore._arrays["norms"]) > 0
+    return vectorstore._get_vectors(slice(None))[live]
+
+
+def size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if name != CHUNKS_FILE_NAME
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", help="Persisted numpy vector store to use")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=6)
+    args = parser.parse_args()
+
+    random = np.random.default_rng(0)
+    if args.index:
+        vectors = load(os.path.expanduser(args.index))
+    else:
+        vectors = generate(random, args.rows, args.dimension, args.topics)
+    queries = vectors[random.choice(len(vectors), args.queries, replace=False)]
+    queries = (
+        queries
+        + random.normal(scale=0.1, size=queries.shape).astype(np.float32)
+        * np.abs(queries).mean()
+    )
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions")
+
+    print(
+        f"{'storage':<18}{'size (MB)':>10}{'B/vector':>10}"
+        f"{'recall@' + str(args.k):>10}{'ms/query':>10}"
+    )
+    exact = None
+    for quantization, rescore in STORAGES:
+        with tempfile.TemporaryDirectory() as tmp:
+            vectorstore = NumpyVectorStore(
+                None, tmp, quantization=quantization, rescore=rescore
+            )
+            ids = [str(i) for i in range(len(vectors))]
+            vectorstore.add_vectors(ids, vectors, ids, [{"source": ""} for _ in ids])
+            vectorstore.persist()
+
+            start = time.perf_counter()
+            results = [
+                {
+                    document.page_content
+                    for document in vectorstore.similarity_search_by_vector(
+                        query, k=args.k
+                    )
+                }
+                for query in queries
+            ]
+            elapsed = (time.perf_counter() - start) / len(queries)
+            if exact is None:
+                exact = results
+            recall = np.mean([len(a & b) / args.k for a, b in zip(results, exact)])
+            name = quantization + (" + rescore" if rescore else "")
+            print(
+                f"{name:<18}{size(tmp) / 1024 / 1024:>10.1f}"
+                f"{size(tmp) / len(vectors):>10.0f}"
+                f"{recall:>10.3f}{1000 * elapsed:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
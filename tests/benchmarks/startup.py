@@ -0,0 +1,75 @@
+"""Start up time of the CLI.
+
+Measures the import time of `clara.cli` with `python -X importtime`, listing
+the slowest modules, and the wall time of `clara config`, which fails if it's
+above the target.
+
+Run from the root of the repository with:
+
+    python -m tests.benchmarks.startup
+"""
+
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# Wall time of `clara config`, in seconds
+TARGET = 0.3
+
+
+def import_times(module: str):
+    """Return the self and cumulative import time (in microseconds) of each
+    module imported by `module`."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    times = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        times.append((name.strip(), int(self_time), int(cumulative)))
+    return times
+
+
+def command_time(*args: str) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "from clara.cli import main; main()", *args],
+        capture_output=True,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--target", type=float, default=TARGET)
+    args = parser.parse_args()
+
+    times = import_times("clara.cli")
+    total = next(cumulative for name, _, cumulative in times if name == "clara.cli")
+    print(f"import clara.cli: {total / 1000:.1f} ms")
+    for name, self_time, _ in sorted(times, key=lambda t: t[1], reverse=True)[
+        : args.top
+    ]:
+        print(f"  {name:<40} {self_time / 1000:6.1f} ms")
+
+    # Discard the first run, with cold caches
+    command_time("config")
+    seconds = statistics.median(command_time("config") for _ in range(args.repeat))
+    print(f"clara config: {seconds * 1000:.0f} ms (target {args.target * 1000:.0f} ms)")
+    if seconds > args.target:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Generate a synthetic code repository.
+
+Files of each language are made of functions and classes named after a small
+vocabulary, so that questions about them have relevant chunks. Files in
+`node_modules` and ignored by `.gitignore` are generated too, to be skipped.
+
+Run from the root of the repository with:
+
+    python -m tests.benchmarks.synthetic PATH --files 1000
+"""
+
+import os
+import random
+import argparse
+from typing import Dict, List
+
+
+WORDS = (
+    "user account order invoice payment cart product price stock shipment "
+    "address token session cache queue event report export import config "
+    "parser client server request response message email search index"
+).split()
+
+PYTHON_FUNCTION = '''
+def {name}({argument}, limit=10):
+    """Return the {noun} of the {argument} with the {other}."""
+    result = []
+    for item in {argument}[:limit]:
+        if item.{other} is not None:
+            result.append(get_{noun}(item))
+    return result
+'''
+
+PYTHON_CLASS = '''
+class {Name}:
+    """Keep the {noun} of each {other}."""
+
+    def __init__(self, {other}):
+        self.{other} = {other}
+        self.{noun}s = {{}}
+
+    def add_{noun}(self, key, {noun}):
+        self.{noun}s[key] = {noun}
+        return len(self.{noun}s)
+'''
+
+JAVASCRIPT_FUNCTION = """
+function {camelName}({argument}, limit = 10) {{
+    // Return the {noun} of the {argument} with the {other}
+    const result = [];
+    for (const item of {argument}.slice(0, limit)) {{
+        if (item.{other} !== undefined) {{
+            result.push(get{Noun}(item));
+        }}
+    }}
+    return result;
+}}
+"""
+
+JAVASCRIPT_CLASS = """
+class {Name} {{
+    constructor({other}) {{
+        this.{other} = {other};
+        this.{noun}s = new Map();
+    }}
+
+    add{Noun}(key, {noun}) {{
+        this.{noun}s.set(key, {noun});
+        return this.{noun}s.size;
+    }}
+}}
+"""
+
+MARKDOWN_SECTION = """
+## The {noun} {other}
+
+Each {other} has a {noun}, computed by `{name}` from the {argument}. Use
+`{Name}` to keep the {noun} of several {other}s, and `add_{noun}` to add one.
+"""
+
+TEMPLATES = {
+    "python": (".py", (PYTHON_FUNCTION, PYTHON_CLASS)),
+    "javascript": (".js", (JAVASCRIPT_FUNCTION, JAVASCRIPT_CLASS)),
+    "markdown": (".md", (MARKDOWN_SECTION,)),
+}
+
+
+def parse_languages(languages: str) -> Dict[str, float]:
+    """Parse a mix like `python=0.6,javascript=0.3,markdown=0.1`."""
+    mix = {}
+    for item in languages.split(","):
+        language, _, weight = item.partition("=")
+        if language not in TEMPLATES:
+            raise ValueError(f"Unknown language: {language}")
+        mix[language] = float(weight or 1)
+    return mix
+
+
+def generate_block(rng: random.Random, template: str) -> str:
+    noun, other, argument = rng.sample(WORDS, 3)
+    name = f"{noun}_{other}_{rng.randrange(1000)}"
+    return template.format(
+        name=name,
+        camelName=noun + other.capitalize() + str(rng.randrange(1000)),
+        Name=noun.capitalize() + other.capitalize() + str(rng.randrange(1000)),
+        noun=noun,
+        Noun=noun.capitalize(),
+        other=other,
+        argument=argument + "s",
+    )
+
+
+def generate_repository(
+    root: str,
+    files: int = 200,
+    languages: Dict[str, float] = None,
+    blocks: int = 20,
+    seed: int = 0,
+) -> List[str]:
+    """Write `files` files in `root`, with around `blocks` functions, classes
+    or sections each, returning their paths."""
+    rng = random.Random(seed)
+    languages = languages or {"python": 0.6, "javascript": 0.3, "markdown": 0.1}
+    names = list(languages)
+    weights = [languages[name] for name in names]
+
+    file_paths = []
+    for i in range(files):
+        language = rng.choices(names, weights)[0]
+        extension, templates = TEMPLATES[language]
+        directory = os.path.join(root, *rng.sample(WORDS, rng.randrange(1, 4)))
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, f"{rng.choice(WORDS)}_{i}{extension}")
+
+        count = max(1, int(rng.gauss(blocks, blocks / 4)))
+        with open(file_path, "w") as f:
+            if language == "markdown":
+                f.write(f"# {rng.choice(WORDS).capitalize()}\n")
+            f.write(
+                "".join(
+                    generate_block(rng, rng.choice(templates)) for _ in range(count)
+                )
+            )
+        file_paths.append(file_path)
+
+    # Never indexed
+    for directory in ("node_modules/package", "build"):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        with open(os.path.join(root, directory, "index.js"), "w") as f:
+            f.write(generate_block(rng, JAVASCRIPT_FUNCTION))
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("build/\n")
+
+    return file_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--languages", default="python=0.6,javascript=0.3,markdown=0.1")
+    parser.add_argument("--blocks", type=int, default=20, help="Per file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    file_paths = generate_repository(
+        args.path,
+        args.files,
+        parse_languages(args.languages),
+        args.blocks,
+        args.seed,
+    )
+    print(f"{len(file_paths)} files written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
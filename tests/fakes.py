@@ -0,0 +1,130 @@
+import re
+import time
+import zlib
+from typing import Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.llms.base import LLM
+from langchain.schema import BaseRetriever
+
+
+class ByteEncoding:
+    """Stand-in for a tiktoken encoding, with a token per byte."""
+
+    def encode_ordinary(self, text: str) -> List[int]:
+        return list(text.encode("utf-8"))
+
+    def decode(self, tokens: List[int]) -> str:
+        return bytes(tokens).decode("utf-8", errors="replace")
+
+
+class LetterEmbeddings(Embeddings):
+    """Counts of the letters a, b and c."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(text.count(letter)) for letter in "abc"]
+
+
+class LengthEmbeddings(Embeddings):
+    """Lengths of the texts, recording the texts of each call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls.append([text])
+        return [float(len(text)), 0.0]
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings, hashing the words of the text.
+
+    Texts sharing words are similar, so retrieval still makes sense. Each
+    request of `batch_size` texts can be delayed by `latency` seconds, with
+    `concurrency` requests in flight, to simulate an API.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 256,
+        latency: float = 0.0,
+        batch_size: int = 1000,
+        concurrency: int = 4,
+    ):
+        self.dimension = dimension
+        self.latency = latency
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.requests = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for word in re.findall(r"\w+", text.lower()):
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return [
+                vector
+                for vectors in executor.map(self._request, batches)
+                for vector in vectors
+            ]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request([text])[0]
+
+
+class StubLLM(LLM):
+    """LLM answering always the same, after `latency` seconds."""
+
+    response: str = "The answer."
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.response
+
+
+class FakeRetriever(BaseRetriever):
+    """Retriever of the given documents, or of the query in `a.py`, recording
+    the queries."""
+
+    def __init__(self, documents: Optional[List[Document]] = None):
+        self.documents = documents
+        self.queries = []
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        self.queries.append(query)
+        if self.documents is not None:
+            return self.documents
+        return [Document(page_content=query, metadata={"source": "a.py"})]
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        return self.get_relevant_documents(query)
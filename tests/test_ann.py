@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from clara.ann import IVFIndex
+
+
+def clustered(random, rows, dimension=16, clusters=10):
+    centers = random.normal(size=(clusters, dimension))
+    return (
+        centers[random.integers(0, clusters, rows)]
+        + 0.1 * random.normal(size=(rows, dimension))
+    ).astype(np.float32)
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        self.random = np.random.default_rng(0)
+        self.vectors = clustered(self.random, 1000)
+
+    def test_train(self):
+        index = IVFIndex(probes=2, min_rows=100)
+        self.assertTrue(index.needs_training(1000))
+        self.assertFalse(index.needs_training(99))
+        index.train(self.vectors, np.ones(1000, dtype=bool))
+
+        self.assertEqual(len(index.centroids), 31)
+        self.assertEqual(len(index.assignments), 1000)
+        self.assertFalse(index.needs_training(1999))
+        self.assertTrue(index.needs_training(2000))
+
+        # The nearest neighbour of a row is in the clusters probed for it
+        recall = np.mean(
+            [i in index.candidates(self.vectors[i]) for i in range(0, 1000, 10)]
+        )
+        self.assertEqual(recall, 1.0)
+        candidates = index.candidates(self.vectors[0])
+        self.assertLess(len(candidates), 1000)
+        self.assertTrue(np.all(np.diff(candidates) > 0))
+
+    def test_probing_every_list_is_exhaustive(self):
+        index = IVFIndex(lists=8, probes=8, min_rows=100)
+        index.train(self.vectors, np.ones(1000, dtype=bool))
+        np.testing.assert_array_equal(
+            index.candidates(self.vectors[0]), np.arange(1000)
+        )
+
+    def test_add_and_compact(self):
+        index = IVFIndex(lists=8, min_rows=100)
+        index.add(self.vectors[:10])
+        self.assertEqual(len(index.assignments), 0)
+
+        index.train(self.vectors[:500], np.ones(500, dtype=bool))
+        index.add(self.vectors[500:])
+        np.testing.assert_array_equal(
+            index.assignments[500:], index._assign(self.vectors[500:])
+        )
+        index.compact(np.arange(0, 1000, 2))
+        self.assertEqual(len(index.assignments), 500)
+        self.assertLess(index.candidates(self.vectors[0]).max(), 500)
+
+    def test_save_load(self):
+        index = IVFIndex(lists=8, min_rows=100)
+        index.train(self.vectors, np.ones(1000, dtype=bool))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ivf.npz")
+            index.save(path, generation=1)
+
+            loaded = IVFIndex()
+            self.assertFalse(loaded.load(path, generation=2))
+            self.assertFalse(loaded.is_trained)
+            self.assertTrue(loaded.load(path, generation=1))
+            np.testing.assert_array_equal(loaded.assignments, index.assignments)
+            np.testing.assert_array_equal(loaded.centroids, index.centroids)
+            self.assertEqual(loaded.trained_rows, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
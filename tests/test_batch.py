@@ -0,0 +1,133 @@
+import time
+import unittest
+
+from langchain.callbacks.base import CallbackManager
+from langchain.chains import LLMChain
+from langchain.docstore.document import Document
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts.prompt import PromptTemplate
+from langchain.schema import BaseRetriever, Generation, LLMResult
+
+from clara.batch import BatchChat, RateLimitHandler, read_questions
+from clara.chat import ChatChain, UsageHandler
+from clara.embeddings import RateLimiter
+
+
+class SlowRetriever(BaseRetriever):
+    def get_relevant_documents(self, query):
+        if query == "Fail":
+            raise ValueError("Retrieval failed")
+        time.sleep(0.05)
+        return [Document(page_content=query, metadata={"source": "a.py"})]
+
+    async def aget_relevant_documents(self, query):
+        return self.get_relevant_documents(query)
+
+
+class TestReadQuestions(unittest.TestCase):
+    def test_read_questions(self):
+        lines = ['{"id": 1, "question": "What is main?"}\n', "\n", '"Where?"\n']
+        self.assertEqual(
+            read_questions(lines),
+            [{"id": 1, "question": "What is main?"}, {"question": "Where?"}],
+        )
+
+    def test_invalid_questions(self):
+        with self.assertRaisesRegex(Exception, "line 2"):
+            read_questions(['"Where?"', "{"])
+        with self.assertRaisesRegex(Exception, "Line 1"):
+            read_questions(['{"id": 1}'])
+
+
+class TestBatchChat(unittest.TestCase):
+    def _create_batch_chat(self, questions, concurrency):
+        usage_handler = UsageHandler(lambda text: len(text.split()))
+        llm = FakeListLLM(
+            responses=["Answer"] * len(questions),
+            callback_manager=CallbackManager([usage_handler]),
+        )
+        chain = ChatChain(
+            condense_chain=LLMChain(
+                llm=llm, prompt=PromptTemplate.from_template("{question}")
+            ),
+            answer_chain=LLMChain(
+                llm=llm, prompt=PromptTemplate.from_template("{context} {question}")
+            ),
+            retriever=SlowRetriever(),
+        )
+        return BatchChat(chain, usage_handler, concurrency=concurrency)
+
+    def test_answer_all(self):
+        questions = [{"id": i, "question": f"Question {i}"} for i in range(8)]
+        batch_chat = self._create_batch_chat(questions, concurrency=8)
+
+        start = time.perf_counter()
+        results = list(batch_chat.answer_all(questions))
+
+        # Retrieved at the same time
+        self.assertLess(time.perf_counter() - start, 0.05 * 4)
+        self.assertEqual(sorted(result["id"] for result in results), list(range(8)))
+        for result in results:
+            self.assertEqual(result["answer"], "Answer")
+            self.assertEqual(result["sources"], ["a.py"])
+            self.assertGreater(result["latency"], 0)
+            # Words of "Question i\nSOURCE: a.py\n Question i"
+            self.assertEqual(
+                result["usage"],
+                {"requests": 1, "prompt_tokens": 6, "completion_tokens": 0},
+            )
+
+    def test_errors(self):
+        questions = [{"question": "Fail"}, {"question": "What is main?"}]
+        batch_chat = self._create_batch_chat(questions, concurrency=1)
+        batch_chat.full_sources = True
+
+        results = {
+            result["question"]: result for result in batch_chat.answer_all(questions)
+        }
+
+        self.assertEqual(results["Fail"]["error"], "Retrieval failed")
+        self.assertEqual(results["Fail"]["type"], "ValueError")
+        self.assertEqual(
+            results["What is main?"]["sources"],
+            [{"page_content": "What is main?", "metadata": {"source": "a.py"}}],
+        )
+
+
+class TestRateLimitHandler(unittest.TestCase):
+    def test_waits(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+        limiter.requests = 0
+        callback_manager = CallbackManager([RateLimitHandler(limiter)])
+
+        start = time.monotonic()
+        callback_manager.on_llm_start({}, ["Prompt"])
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_debits_completion_tokens(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600)
+        handler = RateLimitHandler(limiter, lambda text: len(text.split()))
+        callback_manager = CallbackManager([handler])
+
+        callback_manager.on_llm_start({}, ["Prompt"])
+        callback_manager.on_llm_end(
+            LLMResult(
+                generations=[[Generation(text="Answer")]],
+                llm_output={"token_usage": {"completion_tokens": 599}},
+            )
+        )
+        self.assertLess(limiter.tokens, 1)
+
+        # Without the usage, the completion is counted
+        limiter.tokens = 600
+        callback_manager.on_llm_end(
+            LLMResult(generations=[[Generation(text="An answer")]])
+        )
+        self.assertAlmostEqual(limiter.tokens, 598, delta=1)
+
+        # The next prompt waits for the completion tokens
+        limiter.tokens = 0
+        limiter.debit(6)
+        start = time.monotonic()
+        callback_manager.on_llm_start({}, ["Prompt"])
+        self.assertGreaterEqual(time.monotonic() - start, 0.6)
@@ -0,0 +1,146 @@
+import unittest
+from unittest import mock
+
+from langchain.callbacks.base import CallbackManager
+from langchain.chains import LLMChain
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts.prompt import PromptTemplate
+from langchain.schema import AIMessage, HumanMessage
+
+from clara.chat import (
+    ChatChain,
+    TokenStreamHandler,
+    UsageHandler,
+    question_similarity,
+)
+from clara.tracing import Tracer
+from fakes import FakeRetriever
+
+
+class TestChatChain(unittest.TestCase):
+    def _create_chain(self, condensed_question):
+        self.retriever = FakeRetriever()
+        self.condense_llm = FakeListLLM(responses=[condensed_question])
+        return ChatChain(
+            condense_chain=LLMChain(
+                llm=self.condense_llm,
+                prompt=PromptTemplate.from_template("{chat_history} {question}"),
+            ),
+            answer_chain=LLMChain(
+                llm=FakeListLLM(responses=["Answer"]),
+                prompt=PromptTemplate.from_template("{context} {question}"),
+            ),
+            retriever=self.retriever,
+        )
+
+    def test_question_similarity(self):
+        self.assertEqual(question_similarity("What is main?", "what is MAIN"), 1)
+        self.assertEqual(question_similarity("What is main?", "Is it?"), 0.25)
+        self.assertEqual(question_similarity("", "main"), 0)
+
+    def test_first_question_is_not_condensed(self):
+        chain = self._create_chain("Unused")
+
+        output = chain({"question": "What is main?", "chat_history": []})
+
+        self.assertEqual(self.condense_llm.i, 0)
+        self.assertEqual(self.retriever.queries, ["What is main?"])
+        self.assertEqual(set(output["timings"]), {"retrieval", "answer", "total"})
+
+    def test_speculative_retrieval_kept(self):
+        chain = self._create_chain("What does the main function do?")
+        chat_history = [HumanMessage(content="Hi"), AIMessage(content="Hello")]
+
+        output = chain(
+            {"question": "What does the main function do", "chat_history": chat_history}
+        )
+
+        self.assertEqual(self.condense_llm.i, 1)
+        self.assertEqual(self.retriever.queries, ["What does the main function do"])
+        self.assertEqual(
+            output["source_documents"][0].page_content, "What does the main function do"
+        )
+        self.assertIn("saved", output["timings"])
+
+    def test_speculative_retrieval_discarded(self):
+        chain = self._create_chain("How is the index persisted?")
+        chat_history = [
+            HumanMessage(content="What is the index?"),
+            AIMessage(content="A vector DB"),
+        ]
+
+        output = chain({"question": "How is it stored?", "chat_history": chat_history})
+
+        self.assertEqual(
+            sorted(self.retriever.queries),
+            ["How is it stored?", "How is the index persisted?"],
+        )
+        self.assertEqual(
+            output["source_documents"][0].page_content, "How is the index persisted?"
+        )
+        self.assertNotIn("saved", output["timings"])
+
+    def test_formatted_chat_history(self):
+        chain = self._create_chain("How is the index persisted?")
+
+        with mock.patch.object(
+            LLMChain, "run", autospec=True, return_value="Answer"
+        ) as run:
+            chain({"question": "How is it stored?", "chat_history": "Human: Hi"})
+
+        self.assertEqual(
+            run.call_args_list[0].args[1],
+            {"chat_history": "Human: Hi", "question": "How is it stored?"},
+        )
+
+    def test_traced(self):
+        chain = self._create_chain("How is the index persisted?")
+        chain.condense_chain.llm.callback_manager = CallbackManager(
+            [UsageHandler(lambda text: len(text.split()))]
+        )
+        chat_history = [
+            HumanMessage(content="What is the index?"),
+            AIMessage(content="A vector DB"),
+        ]
+        tracer = Tracer(recording=True)
+
+        with mock.patch("clara.chat.tracer", tracer):
+            chain({"question": "How is it stored?", "chat_history": chat_history})
+
+        self.assertEqual(
+            {span.name for span in tracer.spans},
+            {
+                "chat",
+                "chat.condense",
+                "chat.speculative_retrieval",
+                "chat.retrieval",
+                "chat.context",
+                "chat.answer",
+            },
+        )
+        self.assertEqual(tracer.spans[-1].name, "chat")
+        # Words of "Human: What is the index?\nAssistant: A vector DB How is it
+        # stored?"
+        self.assertEqual(
+            tracer.counters,
+            {"llm.requests": 1, "llm.prompt_tokens": 13, "llm.completion_tokens": 0},
+        )
+
+
+class TestTokenStreamHandler(unittest.TestCase):
+    def test_streams_to_callback(self):
+        handler = TokenStreamHandler()
+        callback_manager = CallbackManager([handler])
+        tokens = []
+
+        handler.reset(tokens.append)
+        for token in ["Hello", " world"]:
+            callback_manager.on_llm_new_token(token)
+
+        self.assertEqual(tokens, ["Hello", " world"])
+        self.assertIsNotNone(handler.first_token_time)
+
+        handler.reset()
+        self.assertIsNone(handler.first_token_time)
+        callback_manager.on_llm_new_token("!")
+        self.assertEqual(tokens, ["Hello", " world"])
@@ -0,0 +1,21 @@
+import sys
+import subprocess
+import unittest
+
+
+class TestStartup(unittest.TestCase):
+    def test_heavy_modules_are_not_imported(self):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, clara.cli; print(' '.join(sys.modules))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+        modules = {module.split(".")[0] for module in output.split()}
+        for module in ("langchain", "chromadb", "openai", "esprima", "nbformat"):
+            self.assertNotIn(module, modules)
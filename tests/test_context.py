@@ -0,0 +1,107 @@
+import unittest
+
+from langchain.docstore.document import Document
+
+from clara.config import defaults
+from clara.context import format_context, merge_documents, pack_context
+from clara.splitter import TOKENS_KEY
+
+
+LINES = [f"line_{i} = compute_value({i})" for i in range(10)]
+
+
+def document(text, source="a.py", tokens=None):
+    metadata = {"source": source}
+    if tokens is not None:
+        metadata[TOKENS_KEY] = tokens
+    return Document(page_content=text, metadata=metadata)
+
+
+class TestMergeDocuments(unittest.TestCase):
+    def test_drops_contained(self):
+        function = "\n".join(LINES[2:4])
+        documents = merge_documents(
+            [document(function), document("\n".join(LINES)), document(function)]
+        )
+
+        self.assertEqual([doc.page_content for doc in documents], ["\n".join(LINES)])
+
+    def test_joins_overlapping(self):
+        documents = merge_documents(
+            [
+                document("\n".join(LINES[4:]), tokens=60),
+                document("\n".join(LINES[:6]), tokens=60),
+            ]
+        )
+
+        self.assertEqual([doc.page_content for doc in documents], ["\n".join(LINES)])
+        # The tokens of the 4 lines added
+        self.assertEqual(documents[0].metadata[TOKENS_KEY], 60 + 40)
+
+    def test_joins_through_another(self):
+        documents = merge_documents(
+            [
+                document("\n".join(LINES[:3])),
+                document("other", source="b.py"),
+                document("\n".join(LINES[6:])),
+                document("\n".join(LINES[2:7])),
+            ]
+        )
+
+        self.assertEqual(
+            [doc.page_content for doc in documents], ["\n".join(LINES), "other"]
+        )
+
+    def test_keeps_short_overlaps_and_other_sources(self):
+        documents = [
+            document("def a():\n    pass\n}"),
+            document("}\ndef b():\n    pass"),
+            document("\n".join(LINES[:6]), source="b.py"),
+            document("\n".join(LINES[4:])),
+        ]
+
+        self.assertEqual(merge_documents(documents), documents)
+
+
+class TestPackContext(unittest.TestCase):
+    def test_fills_budget(self):
+        documents = [
+            document("first", tokens=50),
+            document("too big", source="b.py", tokens=100),
+            document("fits", source="c.py", tokens=30),
+        ]
+
+        packed = pack_context(documents, token_budget=100)
+
+        self.assertEqual([doc.page_content for doc in packed], ["first", "fits"])
+        self.assertEqual(
+            format_context(packed), "first\nSOURCE: a.py\n---\nfits\nSOURCE: c.py\n"
+        )
+
+    def test_cuts_first_document(self):
+        text = "\n".join(LINES)
+
+        packed = pack_context([document(text, tokens=100)], token_budget=50)
+
+        self.assertEqual(len(packed), 1)
+        self.assertTrue(text.startswith(packed[0].page_content + "\n"))
+        self.assertLess(len(packed[0].page_content), len(text) / 2)
+
+    def test_estimates_tokens(self):
+        documents = [document("x" * 300), document("y" * 30, source="b.py")]
+
+        packed = pack_context(documents, token_budget=50)
+
+        self.assertEqual([doc.page_content for doc in packed], ["y" * 30])
+
+    def test_default_budget_fits_k_chunks(self):
+        k = defaults["index"]["k"]
+        chunk_size = defaults["index"]["chunk_size"]
+        documents = [
+            document(f"chunk_{i}", source=f"module_{i}.py", tokens=chunk_size)
+            for i in range(k)
+        ]
+
+        packed = pack_context(documents, defaults["llm"]["context_tokens"])
+
+        self.assertEqual(packed, documents)
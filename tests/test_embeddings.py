@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import types
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from clara.embeddings import (
+    EmbeddingCache,
+    CachedEmbeddings,
+    BatchedOpenAIEmbeddings,
+    SentenceTransformerEmbeddings,
+    RateLimiter,
+    batch_by_tokens,
+    get_embeddings,
+)
+from fakes import LengthEmbeddings
+from openai_stub import OpenAIStub
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_embed_documents(self):
+        fake = LengthEmbeddings()
+        embeddings = CachedEmbeddings(
+            fake, model="fake", cache=EmbeddingCache(self.path, max_size=1 << 20)
+        )
+
+        self.assertEqual(
+            embeddings.embed_documents(["a", "bb", "a"]),
+            [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]],
+        )
+        self.assertEqual(fake.calls, [["a", "bb"]])
+
+        # A new cache on the same file, like a later run or another repository
+        cache = EmbeddingCache(self.path, max_size=1 << 20)
+        embeddings = CachedEmbeddings(fake, model="fake", cache=cache)
+        self.assertEqual(
+            embeddings.embed_documents(["bb", "ccc"]), [[2.0, 1.0], [3.0, 1.0]]
+        )
+        self.assertEqual(fake.calls, [["a", "bb"], ["ccc"]])
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+        # Same text with another model isn't a hit
+        other = CachedEmbeddings(fake, model="other", cache=cache)
+        other.embed_documents(["a"])
+        self.assertEqual(fake.calls[-1], ["a"])
+
+    def test_embed_query(self):
+        fake = LengthEmbeddings()
+        embeddings = CachedEmbeddings(
+            fake, model="fake", cache=EmbeddingCache(self.path, max_size=1 << 20)
+        )
+        embeddings.embed_documents(["a"])
+        self.assertEqual(embeddings.embed_query("a"), [1.0, 0.0])
+        self.assertEqual(embeddings.embed_query("a"), [1.0, 0.0])
+        self.assertEqual(len(fake.calls), 2)
+
+    def test_lru_eviction(self):
+        # Each vector of two float32 takes 8 bytes
+        cache = EmbeddingCache(self.path, max_size=16)
+        cache.put_many("fake", [("a", [1.0, 1.0])])
+        cache.put_many("fake", [("b", [2.0, 2.0])])
+        cache.get_many("fake", ["a"])
+        cache.put_many("fake", [("c", [3.0, 3.0])])
+
+        self.assertEqual(set(cache.get_many("fake", ["a", "b", "c"])), {"a", "c"})
+        self.assertEqual(cache.size(), 16)
+
+
+class TestBatchByTokens(unittest.TestCase):
+    def test_batch_by_tokens(self):
+        self.assertEqual(
+            batch_by_tokens([5, 5, 5, 20, 1, 1, 1], max_tokens=10, max_size=2),
+            [[0, 1], [2], [3], [4, 5], [6]],
+        )
+
+
+class TestBatchedOpenAIEmbeddings(unittest.TestCase):
+    def _embeddings(self, stub, **kwargs):
+        return BatchedOpenAIEmbeddings(
+            api_base=stub.api_base,
+            api_key="test",
+            count_tokens=len,
+            **kwargs,
+        )
+
+    def test_embed_documents(self):
+        texts = [f"text {i}" * (i + 1) for i in range(20)]
+
+        with OpenAIStub(latency=0.05, fail_every=3) as stub:
+            embeddings = self._embeddings(
+                stub, batch_tokens=50, batch_size=4, concurrency=4
+            )
+            vectors = embeddings.embed_documents(texts)
+
+        self.assertEqual(vectors, [[float(len(text)), 1.0] for text in texts])
+        self.assertGreater(stub.rate_limited, 0)
+        self.assertEqual(embeddings.stats["retries"], stub.rate_limited)
+        self.assertGreater(stub.max_in_flight, 1)
+        for batch in stub.batches:
+            self.assertLessEqual(len(batch), 4)
+            self.assertTrue(len(batch) == 1 or sum(map(len, batch)) <= 50)
+
+    def test_token_counts(self):
+        with OpenAIStub() as stub:
+            embeddings = self._embeddings(stub, batch_tokens=2)
+            embeddings.embed_documents(["a", "b", "c"], token_counts=[1, 1, 2])
+        self.assertEqual(sorted(stub.batches), [["a", "b"], ["c"]])
+
+    def test_rate_limit_across_calls(self):
+        with OpenAIStub() as stub:
+            # A request every 0.1 seconds, and only one left
+            embeddings = self._embeddings(stub, requests_per_minute=600)
+            embeddings.limiter.requests = 1
+
+            start = time.monotonic()
+            embeddings.embed_documents(["a"])
+            embeddings.embed_documents(["b"])
+            self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertEqual(stub.requests, 2)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_acquire(self):
+        # 600 requests per minute, one every 0.1 seconds once the bucket is empty
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+        limiter.requests = 0
+
+        start = time.monotonic()
+        asyncio.run(limiter.acquire(1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+        # And 100 tokens every second
+        limiter.tokens = 0
+        start = time.monotonic()
+        asyncio.run(limiter.acquire(20))
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_wait(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+        limiter.requests = 0
+
+        start = time.monotonic()
+        limiter.wait(1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertLess(limiter.requests, 1)
+
+    def test_pause(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+        limiter.pause(0.1)
+
+        start = time.monotonic()
+        asyncio.run(limiter.acquire(1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model, **kwargs):
+        self.model = model
+        self.kwargs = kwargs
+
+    def encode(self, texts, batch_size, **kwargs):
+        return np.array([[len(text), batch_size] for text in texts], dtype=np.float32)
+
+
+class TestSentenceTransformerEmbeddings(unittest.TestCase):
+    def setUp(self):
+        module = types.ModuleType("sentence_transformers")
+        module.SentenceTransformer = FakeSentenceTransformer
+        patcher = mock.patch.dict(sys.modules, {"sentence_transformers": module})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_embed_in_batches(self):
+        embeddings = SentenceTransformerEmbeddings(
+            "/models/minilm", batch_size=2, threads=3, backend="onnx"
+        )
+        self.assertEqual(embeddings.client.kwargs, {"device": "cpu", "backend": "onnx"})
+
+        texts = ["a", "bb", "ccc", "dddd", "e"]
+        self.assertEqual(
+            embeddings.embed_documents(texts),
+            [[1.0, 2.0], [2.0, 2.0], [3.0, 2.0], [4.0, 2.0], [1.0, 1.0]],
+        )
+        self.assertEqual(embeddings.embed_query("abc"), [3.0, 1.0])
+
+    def test_lazy_loading(self):
+        with mock.patch.object(
+            sys.modules["sentence_transformers"],
+            "SentenceTransformer",
+            side_effect=FakeSentenceTransformer,
+        ) as model_class:
+            embeddings = SentenceTransformerEmbeddings("/models/minilm", threads=1)
+            model_class.assert_not_called()
+
+            embeddings.embed_documents(["a", "b"])
+            embeddings.embed_query("c")
+            model_class.assert_called_once_with("/models/minilm", device="cpu")
+
+    def test_get_embeddings(self):
+        embeddings_config = {
+            "provider": "sentence-transformers",
+            "model": "/models/minilm",
+            "local": {"batch_size": 8, "threads": 2, "device": "cpu", "backend": None},
+        }
+        with mock.patch.dict(
+            "clara.embeddings.config",
+            {
+                "index": {
+                    "embeddings": embeddings_config,
+                    "embeddings_cache": {"enabled": False},
+                }
+            },
+        ):
+            embeddings = get_embeddings()
+            self.assertIsInstance(embeddings, SentenceTransformerEmbeddings)
+            self.assertEqual(embeddings.client.model, "/models/minilm")
+
+            embeddings_config["provider"] = "unknown"
+            with self.assertRaises(ValueError):
+                get_embeddings()
@@ -1,6 +1,24 @@
+import os
+import ast
+import tempfile
 import unittest
+from unittest import mock
+
+import esprima
 
-from clara.index import PythonParsing, NotebookParsing, JavascriptParsing
+from clara.config import config
+from clara.index import (
+    PythonParsing,
+    NotebookParsing,
+    JavascriptParsing,
+    CodeLoader,
+    RepositoryIndex,
+)
+from clara.manifest import Manifest
+from clara.splitter import CodeTextSplitter
+from clara.tracing import Tracer
+from clara.vectorstore import NumpyVectorStore
+from fakes import ByteEncoding, FakeEmbeddings
 
 
 class TestPythonParsing(unittest.TestCase):
@@ -39,6 +57,18 @@ hello("Hello!")"""
         simplified_code = parser.simplify_code()
         self.assertEqual(simplified_code, self.expected_simplified_code)
 
+    def test_parses_once(self):
+        with mock.patch("ast.parse", wraps=ast.parse) as parse:
+            parser = PythonParsing(self.example_code)
+            self.assertTrue(parser.is_valid())
+            parser.extract_functions_classes()
+            parser.simplify_code()
+        parse.assert_called_once()
+
+    def test_invalid_code(self):
+        parser = PythonParsing("def hello(:\n")
+        self.assertFalse(parser.is_valid())
+
 
 class TestNotebookParsing(unittest.TestCase):
     def setUp(self):
@@ -170,3 +200,335 @@ hello("Hello!");"""
         parser = JavascriptParsing(self.example_code)
         simplified_code = parser.simplify_code()
         self.assertEqual(simplified_code, self.expected_simplified_code)
+
+    def test_parses_once(self):
+        with mock.patch("esprima.parseScript", wraps=esprima.parseScript) as parse:
+            parser = JavascriptParsing(self.example_code)
+            self.assertTrue(parser.is_valid())
+            parser.extract_functions_classes()
+            parser.simplify_code()
+        parse.assert_called_once()
+
+    def test_invalid_code(self):
+        parser = JavascriptParsing("function hello( {")
+        self.assertFalse(parser.is_valid())
+
+
+class TestCodeLoader(unittest.TestCase):
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "example.py")
+            with open(path, "wb") as f:
+                f.write(
+                    b"# -*- coding: latin-1 -*-\r\n"
+                    b"def hello():\r\n"
+                    b"    print('\xf1')\r\n"
+                )
+
+            documents = CodeLoader(path).load()
+
+        self.assertEqual(
+            [document.page_content for document in documents],
+            [
+                "def hello():\n    print('\u00f1')",
+                "# -*- coding: latin-1 -*-\n# Code for: def hello():",
+            ],
+        )
+        self.assertEqual(
+            [document.metadata["content_type"] for document in documents],
+            ["functions_classes", "simplified_code"],
+        )
+
+
+class TestRepositoryIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.file_paths = []
+        for i in range(8):
+            self.file_paths.append(self._write(f"module_{i}.py", f"a = {i}\n"))
+        self.bad_file_path = self._write("bad.md", b"\xff\xfe\xfa")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, "wb" if isinstance(content, bytes) else "w") as f:
+            f.write(content)
+        return path
+
+    # The tiktoken encoder would need to be downloaded
+    @mock.patch(
+        "clara.index.get_text_splitter",
+        lambda: CodeTextSplitter(3000, 200, ByteEncoding()),
+    )
+    def test_get_texts_in_parallel(self):
+        file_paths = self.file_paths[:4] + [self.bad_file_path] + self.file_paths[4:]
+        sequential = RepositoryIndex(self.root, in_memory=True, jobs=1)
+        parallel = RepositoryIndex(self.root, in_memory=True, jobs=4)
+
+        documents = parallel._get_texts(file_paths)
+
+        self.assertEqual(documents, sequential._get_texts(file_paths))
+        self.assertEqual(
+            [document.metadata["source"] for document in documents],
+            self.file_paths,
+        )
+        self.assertEqual(
+            [document.page_content for document in documents],
+            [f"a = {i}" for i in range(8)],
+        )
+
+    @mock.patch(
+        "clara.index.get_text_splitter",
+        lambda: CodeTextSplitter(3000, 200, ByteEncoding()),
+    )
+    @mock.patch.dict("clara.index.config", {"index": {"upsert_batch_size": 3}})
+    def test_get_batches(self):
+        index = RepositoryIndex(self.root, in_memory=True, jobs=2)
+        batches = list(index._get_batches(self.file_paths + [self.bad_file_path]))
+
+        self.assertEqual(
+            [batch_files for batch_files, _, _ in batches],
+            [self.file_paths[0:3], self.file_paths[3:6], self.file_paths[6:8]],
+        )
+        self.assertEqual(
+            [failed_files for _, failed_files, _ in batches],
+            [[], [], [self.bad_file_path]],
+        )
+        for batch_files, _, documents in batches:
+            self.assertEqual(
+                [document.metadata["source"] for document in documents], batch_files
+            )
+
+    @mock.patch(
+        "clara.index.get_text_splitter",
+        lambda: CodeTextSplitter(3000, 200, ByteEncoding()),
+    )
+    def test_load_spans(self):
+        index = RepositoryIndex(self.root, in_memory=True, jobs=2)
+        tracer = Tracer(recording=True)
+
+        with mock.patch("clara.index.tracer", tracer):
+            index._get_texts(self.file_paths + [self.bad_file_path])
+
+        load_spans = [span for span in tracer.spans if span.name == "ingest.load"]
+        self.assertEqual(
+            [span.attributes["file"] for span in load_spans],
+            self.file_paths + [self.bad_file_path],
+        )
+        # Loaded by the workers
+        self.assertNotIn(os.getpid(), {span.process for span in load_spans})
+        self.assertEqual(sum(span.name == "ingest.split" for span in tracer.spans), 8)
+        self.assertEqual(tracer.counters, {"ingest.files": 8, "ingest.errors": 1})
+
+
+@mock.patch(
+    "clara.index.get_text_splitter",
+    lambda: CodeTextSplitter(3000, 200, ByteEncoding()),
+)
+@mock.patch("clara.index.get_embeddings", FakeEmbeddings)
+@mock.patch("clara.index.get_embeddings_model", lambda: "fake")
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "repository")
+        os.mkdir(self.root)
+        for i in range(4):
+            self._write(f"module_{i}.py", f"a = {i}\n")
+        persist_path = os.path.join(self.tmp.name, "index")
+        patches = [
+            mock.patch("clara.index.get_persist_path", lambda path: persist_path),
+            mock.patch.dict("clara.index.config", {"index": dict(config["index"])}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        config["index"].update(vectorstore="numpy", checkpoint_interval=1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content):
+        with open(os.path.join(self.root, name), "w") as f:
+            f.write(content)
+
+    def _ingest(self):
+        index = RepositoryIndex(self.root, jobs=1)
+        changed = index.ingest()
+        index.persist()
+        return index, changed
+
+    def _stored(self, index):
+        """Sources of the chunks in the vector store and the lexical index."""
+        _, _, metadatas = index.index.vectorstore.get_all()
+        lexical_sources = index.lexical_index._connection.execute(
+            "SELECT source FROM chunks"
+        ).fetchall()
+        return (
+            sorted(os.path.basename(metadata["source"]) for metadata in metadatas),
+            sorted(os.path.basename(source) for (source,) in lexical_sources),
+        )
+
+    def test_incremental(self):
+        index, changed = self._ingest()
+        self.assertTrue(changed)
+        files = [f"module_{i}.py" for i in range(4)]
+        self.assertEqual(self._stored(index), (files, files))
+
+        index, changed = self._ingest()
+        self.assertFalse(changed)
+
+        self._write("module_0.py", "b = 0\n")
+        os.remove(os.path.join(self.root, "module_1.py"))
+        self._write("module_4.py", "a = 4\n")
+        index, changed = self._ingest()
+
+        self.assertTrue(changed)
+        files = ["module_0.py", "module_2.py", "module_3.py", "module_4.py"]
+        self.assertEqual(self._stored(index), (files, files))
+        vectorstore = index.index.vectorstore
+        _, texts, _ = vectorstore.get_all()
+        self.assertEqual(sorted(texts), ["a = 2", "a = 3", "a = 4", "b = 0"])
+        # The lexical index has the new text of the changed file
+        ids = [chunk_id for chunk_id, _ in index.lexical_index.search(["b"], k=4)]
+        self.assertEqual(
+            [doc.page_content for doc in vectorstore.get_documents(ids)], ["b = 0"]
+        )
+
+        # Touched, but not changed
+        os.utime(os.path.join(self.root, "module_2.py"), (1, 1))
+        index, changed = self._ingest()
+        self.assertFalse(changed)
+
+    def test_touched_files(self):
+        self._ingest()
+        module_2 = os.path.join(self.root, "module_2.py")
+        os.utime(module_2, (1, 1))
+
+        # Like the server, which only persists the index when it changed
+        index = RepositoryIndex(self.root, jobs=1)
+        self.assertFalse(index.ingest())
+        self.assertEqual(Manifest.load(index.persist_path).files[module_2].mtime, 1)
+
+        with mock.patch("clara.manifest.hash_file") as hash_file:
+            self.assertFalse(RepositoryIndex(self.root, jobs=1).ingest())
+        hash_file.assert_not_called()
+
+    def test_failed_files(self):
+        bad_file_path = os.path.join(self.root, "bad.md")
+        with open(bad_file_path, "wb") as f:
+            f.write(b"\xff\xfe\xfa")
+        index, changed = self._ingest()
+        self.assertTrue(changed)
+        self.assertTrue(Manifest.load(index.persist_path).files[bad_file_path].failed)
+
+        # Not retried until it changes
+        index, changed = self._ingest()
+        self.assertFalse(changed)
+
+        self._write("bad.md", "Fixed\n")
+        index, changed = self._ingest()
+        self.assertTrue(changed)
+        files = ["bad.md"] + [f"module_{i}.py" for i in range(4)]
+        self.assertEqual(self._stored(index), (files, files))
+        self.assertFalse(Manifest.load(index.persist_path).files[bad_file_path].failed)
+
+    def test_is_up_to_date(self):
+        index = RepositoryIndex(self.root, jobs=1)
+        self.assertFalse(index.is_up_to_date())
+        self._ingest()
+        self.assertTrue(index.is_up_to_date())
+
+        # Touched, but not changed
+        module_0 = os.path.join(self.root, "module_0.py")
+        os.utime(module_0, (1, 1))
+        self.assertTrue(index.is_up_to_date())
+        self.assertEqual(Manifest.load(index.persist_path).files[module_0].mtime, 1)
+
+        self._write("module_0.py", "b = 0\n")
+        self.assertFalse(index.is_up_to_date())
+        # Not opened
+        self.assertIsNone(index.index)
+
+    def test_embeddings_reused(self):
+        with mock.patch(
+            "clara.index.get_embeddings", side_effect=FakeEmbeddings
+        ) as get_embeddings:
+            index = RepositoryIndex(self.root, jobs=1)
+            for _ in range(2):
+                index.ingest()
+                index.persist()
+            index.close()
+            index.load()
+        get_embeddings.assert_called_once()
+
+    def test_resume_interrupted(self):
+        config["index"]["upsert_batch_size"] = 1
+        upsert = RepositoryIndex._upsert
+        calls = []
+
+        def interrupted_upsert(index, vectorstore, embeddings, documents):
+            upsert(index, vectorstore, embeddings, documents)
+            calls.append(documents)
+            if len(calls) == 3:
+                # Stored, but killed before the manifest was updated
+                vectorstore.persist()
+                index.lexical_index.commit()
+                raise KeyboardInterrupt
+
+        index = RepositoryIndex(self.root, jobs=1)
+        with mock.patch.object(RepositoryIndex, "_upsert", interrupted_upsert):
+            with self.assertRaises(KeyboardInterrupt):
+                index.ingest()
+        index.index.vectorstore._connection.close()
+        index.lexical_index.close()
+        manifest = Manifest.load(index.persist_path)
+        self.assertFalse(manifest.complete)
+        self.assertEqual(len(manifest.files), 2)
+
+        index, changed = self._ingest()
+
+        self.assertTrue(changed)
+        files = [f"module_{i}.py" for i in range(4)]
+        self.assertEqual(self._stored(index), (files, files))
+        self.assertTrue(Manifest.load(index.persist_path).complete)
+
+    def test_vectorstore_changed(self):
+        index, _ = self._ingest()
+        # As if the index was updated in another vector DB since
+        manifest = Manifest.load(index.persist_path)
+        manifest.vectorstore = "chroma"
+        manifest.save()
+        self._write("module_0.py", "a = 10\n")
+
+        index, changed = self._ingest()
+
+        self.assertTrue(changed)
+        files = [f"module_{i}.py" for i in range(4)]
+        self.assertEqual(self._stored(index), (files, files))
+        self.assertEqual(
+            index.index.vectorstore.similarity_search("a = 10", k=1)[0].page_content,
+            "a = 10",
+        )
+        self.assertEqual(Manifest.load(index.persist_path).vectorstore, "numpy")
+
+
+class TestEmbeddingsCheck(unittest.TestCase):
+    def test_check_embeddings(self):
+        index = RepositoryIndex(".", in_memory=True)
+        vectorstore = NumpyVectorStore(mock.Mock())
+
+        index._check_embeddings(vectorstore, embeddings_model="a")
+        index._check_embeddings(vectorstore, embeddings_dimension=2)
+        index._check_embeddings(vectorstore, embeddings_model="a")
+        self.assertEqual(
+            vectorstore.get_metadata(),
+            {"embeddings_model": "a", "embeddings_dimension": 2},
+        )
+
+        with self.assertRaisesRegex(Exception, "clara clean"):
+            index._check_embeddings(vectorstore, embeddings_model="b")
+        with self.assertRaisesRegex(Exception, "clara clean"):
+            index._check_embeddings(vectorstore, embeddings_dimension=3)
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+from langchain.docstore.document import Document
+
+from clara.lexical import LexicalIndex, get_symbols, tokenize
+from clara.retrievers import HybridRetriever, reciprocal_rank_fusion
+from fakes import FakeRetriever
+
+
+class TestTokenize(unittest.TestCase):
+    def test_identifiers_and_parts(self):
+        self.assertEqual(
+            tokenize("def get_persist_path(self): HTTPServer"),
+            [
+                "def",
+                "get_persist_path",
+                "get",
+                "persist",
+                "path",
+                "self",
+                "httpserver",
+                "http",
+                "server",
+            ],
+        )
+
+    def test_symbols(self):
+        self.assertEqual(
+            get_symbols("Where is get_persist_path used by `Clara` or loadFile?"),
+            {"get_persist_path", "clara", "loadfile"},
+        )
+        self.assertEqual(get_symbols("How does the index work?"), set())
+
+
+class TestLexicalIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = LexicalIndex()
+        self.index.add(
+            ["1", "2", "3"],
+            ["a.py", "a.py", "b.py"],
+            [
+                "def get_persist_path(self):\n    return BASE_PERSIST_PATH",
+                "def ingest(self):\n    path = self.get_persist_path()",
+                "def load_config():\n    config = {}",
+            ],
+        )
+
+    def test_search(self):
+        self.assertEqual(
+            [chunk_id for chunk_id, _ in self.index.search_query("persist path", 3)],
+            ["1", "2"],
+        )
+        self.assertEqual(
+            [chunk_id for chunk_id, _ in self.index.search_query("the config", 3)],
+            ["3"],
+        )
+        self.assertEqual(self.index.search_query("how is it", 3), [])
+
+    def test_delete(self):
+        self.index.delete(["a.py"])
+        self.assertEqual(self.index.size(), 1)
+        self.assertEqual(self.index.search_symbols("get_persist_path", 3), [])
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "lexical.sqlite")
+            index = LexicalIndex(path)
+            index.add(["1"], ["a.py"], ["load_config()"])
+            index.commit()
+
+            self.assertEqual(LexicalIndex(path).size(), 1)
+
+
+class TestHybridRetriever(unittest.TestCase):
+    def setUp(self):
+        self.documents = {
+            "1": Document(
+                page_content="def load_config(): ...", metadata={"source": "config.py"}
+            ),
+            "2": Document(
+                page_content="Configuration docs", metadata={"source": "README.md"}
+            ),
+            "3": Document(
+                page_content="def chat(): ...", metadata={"source": "chat.py"}
+            ),
+        }
+        self.lexical_index = LexicalIndex()
+        self.lexical_index.add(
+            list(self.documents),
+            [document.metadata["source"] for document in self.documents.values()],
+            [document.page_content for document in self.documents.values()],
+        )
+        self.vector_retriever = FakeRetriever(
+            [self.documents["2"], self.documents["1"]]
+        )
+        self.retriever = HybridRetriever(
+            self.vector_retriever,
+            self.lexical_index,
+            lambda ids: [self.documents[chunk_id] for chunk_id in ids],
+            k=2,
+        )
+
+    def test_reciprocal_rank_fusion(self):
+        self.assertEqual(
+            reciprocal_rank_fusion([["a", "b", "c"], ["c", "b"]], k=1), ["c", "b", "a"]
+        )
+
+    def test_fuses_results(self):
+        documents = self.retriever.get_relevant_documents("How is the config read?")
+        self.assertEqual(documents, [self.documents["1"], self.documents["2"]])
+        self.assertEqual(self.vector_retriever.queries, ["How is the config read?"])
+
+    def test_symbol_lookup(self):
+        documents = self.retriever.get_relevant_documents("where is load_config used?")
+        self.assertEqual(documents, [self.documents["1"]])
+        # Without computing the embedding of the query
+        self.assertEqual(self.vector_retriever.queries, [])
+
+        self.retriever.get_relevant_documents("how does load_config parse YAML?")
+        self.assertEqual(len(self.vector_retriever.queries), 1)
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from clara.manifest import Manifest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.persist_path = os.path.join(self.root, "persist")
+        os.makedirs(self.persist_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content, mtime=None):
+        path = os.path.join(self.root, name)
+        with open(path, "w") as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_diff(self):
+        a = self._write("a.py", "a = 1")
+        b = self._write("b.py", "b = 1")
+        c = self._write("c.py", "c = 1")
+
+        manifest = Manifest.load(self.persist_path)
+        self.assertFalse(manifest.exists())
+        diff = manifest.update([a, b, c])
+        self.assertEqual(diff.added, [a, b, c])
+        manifest.commit(diff.to_index)
+        manifest.save()
+
+        # Changed content, touched file without changes, removed and new file
+        self._write("a.py", "a = 2")
+        self._write("b.py", "b = 1", mtime=1)
+        d = self._write("d.py", "d = 1")
+
+        manifest = Manifest.load(self.persist_path)
+        self.assertTrue(manifest.exists())
+        diff = manifest.update([a, b, d])
+        self.assertEqual(diff.added, [d])
+        self.assertEqual(diff.changed, [a])
+        self.assertEqual(diff.removed, [c])
+        self.assertEqual(diff.unchanged, [b])
+        self.assertEqual(diff.refreshed, [b])
+        self.assertEqual(diff.to_index, [d, a])
+        self.assertEqual(diff.to_delete, [a, c])
+        manifest.commit(diff.to_index)
+        manifest.save()
+
+        diff = Manifest.load(self.persist_path).update([a, b, d])
+        self.assertTrue(diff.is_empty())
+
+    def test_uncommitted_files(self):
+        a = self._write("a.py", "a = 1")
+        b = self._write("b.py", "b = 1")
+
+        manifest = Manifest.load(self.persist_path)
+        manifest.update([a, b])
+        manifest.commit([a])
+        manifest.complete = False
+        manifest.save()
+
+        manifest = Manifest.load(self.persist_path)
+        self.assertFalse(manifest.complete)
+        diff = manifest.update([a, b])
+        self.assertEqual(diff.added, [b])
+        self.assertEqual(diff.unchanged, [a])
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+from langchain.chains import LLMChain
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts.prompt import PromptTemplate
+
+from clara.memory import SummaryMemory
+
+
+def count_words(text):
+    return len(text.split())
+
+
+class CountingWords:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, text):
+        self.texts.append(text)
+        return count_words(text)
+
+
+class TestSummaryMemory(unittest.TestCase):
+    def _create_memory(self, summaries=(), count_tokens=count_words, **kwargs):
+        self.llm = FakeListLLM(responses=list(summaries))
+        return SummaryMemory(
+            summary_chain=LLMChain(
+                llm=self.llm,
+                prompt=PromptTemplate.from_template("{summary} {new_lines}"),
+            ),
+            count_tokens=count_tokens,
+            **{"token_limit": 12, "summarize_to": 6, **kwargs},
+        )
+
+    def test_history(self):
+        memory = self._create_memory()
+
+        memory.save_context("What is main?", "A function.")
+
+        self.assertEqual(memory.history, "Human: What is main?\nAssistant: A function.")
+        # Words of "Human: What is main?" and "Assistant: A function."
+        self.assertEqual(memory.tokens, 7)
+        self.assertEqual(self.llm.i, 0)
+
+    def test_counts_each_message_once(self):
+        count_tokens = CountingWords()
+        memory = self._create_memory(count_tokens=count_tokens, token_limit=100)
+
+        memory.save_context("What is main?", "A function.")
+        memory.save_context("Where?", "In main.py")
+
+        self.assertEqual(
+            count_tokens.texts,
+            [
+                "Human: What is main?",
+                "Assistant: A function.",
+                "Human: Where?",
+                "Assistant: In main.py",
+            ],
+        )
+
+    def test_summarizes_oldest_messages(self):
+        memory = self._create_memory(["Main is a function.", "In main.py"])
+
+        memory.save_context("What is main?", "A function.")
+        memory.save_context("Where is it?", "In main.py")
+
+        self.assertEqual(self.llm.i, 1)
+        self.assertEqual(memory.summary, "Main is a function.")
+        self.assertEqual(
+            memory.history,
+            "Summary of the earlier conversation: Main is a function.\n"
+            "Assistant: In main.py",
+        )
+        # Words of the summary and "Assistant: In main.py"
+        self.assertEqual(memory.tokens, 7)
+
+        # Under the limit again, so not summarized
+        memory.save_context("Ok", "Yes")
+        self.assertEqual(self.llm.i, 1)
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "memory.json")
+            memory = self._create_memory(["Main is a function."], path=path)
+            memory.save_context("What is main?", "A function.")
+            memory.save_context("Where is it?", "In main.py")
+
+            count_tokens = CountingWords()
+            resumed = self._create_memory(count_tokens=count_tokens, path=path)
+            self.assertEqual(resumed.history, memory.history)
+            self.assertEqual(resumed.tokens, memory.tokens)
+            self.assertEqual(count_tokens.texts, [])
+
+            # Counted again with the tokenizer of another model
+            resumed = self._create_memory(path=path, model="other")
+            self.assertEqual(resumed.tokens, memory.tokens)
+
+            resumed.clear()
+            self.assertTrue(self._create_memory(path=path).is_empty())
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+from langchain.vectorstores import utils
+
+from clara.mmr import batch_maximal_marginal_relevance, maximal_marginal_relevance
+
+
+class TestMaximalMarginalRelevance(unittest.TestCase):
+    def setUp(self):
+        self.random = np.random.default_rng(0)
+
+    def test_same_as_langchain(self):
+        for lambda_mult in (0, 0.25, 0.5, 1):
+            query = self.random.normal(size=8)
+            candidates = self.random.normal(size=(20, 8))
+            self.assertEqual(
+                maximal_marginal_relevance(
+                    query, candidates, lambda_mult=lambda_mult, k=6
+                ),
+                utils.maximal_marginal_relevance(
+                    query, list(candidates), lambda_mult=lambda_mult, k=6
+                ),
+            )
+
+    def test_batch(self):
+        queries = self.random.normal(size=(3, 8))
+        candidate_lists = [
+            self.random.normal(size=(20, 8)),
+            self.random.normal(size=(4, 8)),
+            np.zeros((0, 8)),
+        ]
+        selections = batch_maximal_marginal_relevance(queries, candidate_lists, k=6)
+        self.assertEqual(
+            selections,
+            [
+                maximal_marginal_relevance(query, candidates, k=6)
+                for query, candidates in zip(queries, candidate_lists)
+            ],
+        )
+        self.assertEqual([len(selected) for selected in selections], [6, 4, 0])
+        self.assertEqual(sorted(selections[1]), [0, 1, 2, 3])
+
+    def test_diversity(self):
+        query = [1, 0]
+        candidates = [[1, 0.1], [1, 0.11], [1, -0.5]]
+        self.assertEqual(maximal_marginal_relevance(query, candidates, k=2), [0, 2])
+        self.assertEqual(
+            maximal_marginal_relevance(query, candidates, lambda_mult=1, k=2), [0, 1]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from clara.quantization import dequantize, dot, quantize
+
+
+class TestQuantization(unittest.TestCase):
+    def setUp(self):
+        self.vectors = np.random.default_rng(0).normal(size=(100, 16))
+        self.vectors = self.vectors.astype(np.float32)
+
+    def test_int8(self):
+        codes, scales = quantize(self.vectors, "int8")
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertEqual(np.abs(codes).max(axis=1).tolist(), [127] * 100)
+        error = np.abs(dequantize(codes, scales) - self.vectors)
+        self.assertTrue(np.all(error <= scales[:, None] / 2 + 1e-6))
+
+        codes, scales = quantize(np.zeros((1, 4), dtype=np.float32), "int8")
+        self.assertEqual(dequantize(codes, scales).tolist(), [[0] * 4])
+
+    def test_float16(self):
+        codes, scales = quantize(self.vectors, "float16")
+        self.assertEqual(codes.dtype, np.float16)
+        self.assertIsNone(scales)
+        np.testing.assert_allclose(
+            dequantize(codes, scales), self.vectors, rtol=1e-3, atol=1e-3
+        )
+
+    def test_dot(self):
+        queries = self.vectors[:3]
+        for quantization in ("float32", "float16", "int8"):
+            codes, scales = quantize(self.vectors, quantization)
+            np.testing.assert_allclose(
+                dot(queries, codes, scales, block_size=7),
+                queries @ dequantize(codes, scales).T,
+                rtol=1e-5,
+                atol=1e-4,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
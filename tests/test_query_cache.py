@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from langchain.chains import LLMChain
+from langchain.docstore.document import Document
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts.prompt import PromptTemplate
+
+from clara.chat import ChatChain
+from clara.query_cache import QueryCache
+from clara.retrievers import CachedRetriever
+from fakes import FakeRetriever
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "query_cache.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_put(self):
+        cache = QueryCache(self.path, "v1", ttl=60, max_entries=10)
+        self.assertIsNone(cache.get("answer", ["q", 1]))
+        cache.put("answer", ["q", 1], "a")
+        self.assertEqual(cache.get("answer", ["q", 1]), "a")
+        self.assertIsNone(cache.get("retrieval", ["q", 1]))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        self.assertEqual(
+            QueryCache(self.path, "v1", ttl=60, max_entries=10).get("answer", ["q", 1]),
+            "a",
+        )
+
+    def test_invalidated_by_version(self):
+        QueryCache(self.path, "v1", ttl=60, max_entries=10).put("answer", "q", "a")
+        cache = QueryCache(self.path, "v2", ttl=60, max_entries=10)
+        self.assertIsNone(cache.get("answer", "q"))
+        self.assertEqual(cache.size(), 0)
+
+    def test_ttl(self):
+        cache = QueryCache(self.path, "v1", ttl=60, max_entries=10)
+        with mock.patch("time.time", return_value=1000):
+            cache.put("answer", "q", "a")
+        with mock.patch("time.time", return_value=1061):
+            self.assertIsNone(cache.get("answer", "q"))
+
+    def test_lru(self):
+        cache = QueryCache(self.path, "v1", ttl=float("inf"), max_entries=2)
+        for now, key in enumerate(["a", "b"]):
+            with mock.patch("time.time", return_value=now):
+                cache.put("answer", key, key)
+        with mock.patch("time.time", return_value=2):
+            cache.get("answer", "a")
+        with mock.patch("time.time", return_value=3):
+            cache.put("answer", "c", "c")
+
+        self.assertEqual(cache.get("answer", "a"), "a")
+        self.assertIsNone(cache.get("answer", "b"))
+        self.assertEqual(cache.get("answer", "c"), "c")
+
+
+class TestCachedChatChain(unittest.TestCase):
+    def test_repeated_question(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = QueryCache(
+                os.path.join(tmp, "query_cache.sqlite"), "v1", ttl=60, max_entries=10
+            )
+            retriever = FakeRetriever(
+                [Document(page_content="def main(): ...", metadata={"source": "a.py"})]
+            )
+            condense_llm = FakeListLLM(responses=["What does main do?"])
+            answer_llm = FakeListLLM(responses=["It does nothing."])
+            chain = ChatChain(
+                condense_chain=LLMChain(
+                    llm=condense_llm,
+                    prompt=PromptTemplate.from_template("{chat_history} {question}"),
+                ),
+                answer_chain=LLMChain(
+                    llm=answer_llm,
+                    prompt=PromptTemplate.from_template("{context} {question}"),
+                ),
+                retriever=CachedRetriever(retriever, cache),
+                cache=cache,
+            )
+
+            for _ in range(2):
+                output = chain({"question": "main?", "chat_history": []})
+                self.assertEqual(output["answer"], "It does nothing.")
+                self.assertEqual(
+                    output["source_documents"][0].metadata, {"source": "a.py"}
+                )
+
+            self.assertEqual(retriever.queries, ["main?"])
+            self.assertEqual((condense_llm.i, answer_llm.i), (0, 1))
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from langchain.docstore.document import Document
+from openai.error import InvalidRequestError
+
+from clara.chat import QueryResult
+from clara.server import (
+    ClaraServer,
+    Repository,
+    ServerError,
+    is_server_running,
+    query_server,
+)
+
+
+class FakeRepository:
+    def __init__(self, path):
+        self.path = path
+
+    def query(self, question, on_token):
+        if question == "invalid":
+            raise InvalidRequestError("Too long", None)
+        if question == "error":
+            raise Exception("Broken")
+        for token in ["It's ", self.path]:
+            on_token(token)
+        return QueryResult(
+            question=question,
+            answer=f"It's {self.path}",
+            sources=[Document(page_content="a = 1", metadata={"source": "a.py"})],
+            timings={"total": 1.0},
+        )
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp.name, "clara.sock")
+        patcher = mock.patch("clara.server.Repository", FakeRepository)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.assertFalse(is_server_running(self.socket_path))
+        self.server = ClaraServer(self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def test_query(self):
+        self.assertTrue(is_server_running(self.socket_path))
+        tokens = []
+
+        result = query_server(
+            "/repo", "Where?", on_token=tokens.append, socket_path=self.socket_path
+        )
+
+        self.assertEqual(tokens, ["It's ", "/repo"])
+        self.assertEqual(result.answer, "It's /repo")
+        self.assertEqual(result.sources[0].metadata, {"source": "a.py"})
+        self.assertEqual(result.timings, {"total": 1.0})
+        # Repositories are kept loaded
+        query_server("/repo", "Where?", socket_path=self.socket_path)
+        self.assertEqual(list(self.server.repositories), ["/repo"])
+
+    def test_errors(self):
+        with self.assertRaises(InvalidRequestError):
+            query_server("/repo", "invalid", socket_path=self.socket_path)
+        with self.assertRaisesRegex(ServerError, "Broken"):
+            query_server("/repo", "error", socket_path=self.socket_path)
+
+
+class TestRepository(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch("clara.index.RepositoryIndex"),
+            mock.patch("clara.chat.Chat"),
+        ]
+        self.index_class, self.chat_class = [patch.start() for patch in patches]
+        for patch in patches:
+            self.addCleanup(patch.stop)
+        self.index = self.index_class.return_value
+        self.index.ingest.return_value = False
+        self.index.manifest.fingerprint.return_value = "a"
+        self.chat = self.chat_class.return_value
+
+    def _query(self, repository):
+        repository.query("Where?", on_token=None)
+        if repository._refresh_thread is not None:
+            repository._refresh_thread.join()
+
+    def test_refresh_in_background(self):
+        repository = Repository("/repo", refresh_interval=60)
+
+        # Indexed before the first question
+        self._query(repository)
+        self.assertEqual(self.index.ingest.call_count, 1)
+        self.assertEqual(self.chat_class.call_count, 1)
+
+        # Not again until the interval passes
+        self._query(repository)
+        self.assertEqual(self.index.ingest.call_count, 1)
+
+        repository.refreshed_at -= 60
+        self._query(repository)
+        self.assertEqual(self.index.ingest.call_count, 2)
+        self.assertEqual(self.chat.query.call_count, 3)
+        # The same files, so the same chat
+        self.assertEqual(self.chat_class.call_count, 1)
+
+        self.index.ingest.return_value = True
+        self.index.manifest.fingerprint.return_value = "b"
+        repository.refreshed_at -= 60
+        self._query(repository)
+        self.index.persist.assert_called_once()
+        self.assertEqual(self.chat_class.call_count, 2)
+
+    def test_refresh_errors(self):
+        repository = Repository("/repo", refresh_interval=0)
+        self._query(repository)
+        self.index.ingest.side_effect = OSError("Gone")
+
+        # Answered from the loaded index
+        self._query(repository)
+        self.assertEqual(self.chat.query.call_count, 2)
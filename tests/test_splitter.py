@@ -0,0 +1,140 @@
+import pickle
+import unittest
+from unittest import mock
+
+from langchain.docstore.document import Document
+
+from clara.index import PythonParsing, JavascriptParsing
+from clara.splitter import CodeTextSplitter, BOUNDARIES_KEY, TOKENS_KEY
+from fakes import ByteEncoding
+
+
+class TestBoundaries(unittest.TestCase):
+    def test_python(self):
+        parser = PythonParsing(
+            "import os\n"
+            "\n"
+            "class Simple:\n"
+            "    a = 1\n"
+            "\n"
+            "    @property\n"
+            "    def b(self):\n"
+            "        if self.a:\n"
+            "            return 1\n"
+            "        return 2\n"
+            "\n"
+            "print(Simple().b)\n"
+        )
+        parsed_code = parser.parse()
+
+        self.assertEqual(
+            parsed_code.functions_classes_boundaries,
+            [{1: 1, 3: 1, 5: 2, 6: 3, 7: 2}],
+        )
+        self.assertEqual(
+            parsed_code.simplified_code.splitlines(),
+            ["import os", "", "# Code for: class Simple:", "", "print(Simple().b)"],
+        )
+        self.assertEqual(parsed_code.simplified_code_boundaries, {1: 0, 3: 0})
+
+    def test_javascript(self):
+        parser = JavascriptParsing(
+            "class Simple {\n"
+            "    constructor() {\n"
+            "        this.a = 1;\n"
+            "    }\n"
+            "}\n"
+        )
+        self.assertEqual(parser.parse().functions_classes_boundaries, [{1: 1, 2: 2}])
+
+
+class TestCodeTextSplitter(unittest.TestCase):
+    def setUp(self):
+        self.encoding = ByteEncoding()
+
+    def test_small_documents_are_not_split(self):
+        splitter = CodeTextSplitter(100, 10, self.encoding)
+        document = Document(
+            page_content="def a():\n    return 1\n",
+            metadata={"source": "a.py", BOUNDARIES_KEY: {1: 1}},
+        )
+
+        chunks = splitter.split_documents([document])
+
+        self.assertEqual(
+            chunks,
+            [
+                Document(
+                    page_content="def a():\n    return 1",
+                    metadata={"source": "a.py", TOKENS_KEY: 22},
+                )
+            ],
+        )
+
+    def test_split_at_shallowest_boundaries(self):
+        code = (
+            "class A:\n"  # 9 tokens
+            "    def a(self):\n"  # 17
+            "        return 1\n"  # 17
+            "\n"  # 1
+            "    def b(self):\n"  # 17
+            "        x = 1\n"  # 14
+            "        y = 2\n"  # 14
+            "        z = 3\n"  # 14
+            "        return x\n"  # 17
+        )
+        parser = PythonParsing(code)
+        boundaries = parser.parse().functions_classes_boundaries[0]
+        splitter = CodeTextSplitter(50, 10, self.encoding)
+
+        chunks = splitter.split_text(parser.extract_functions_classes()[0], boundaries)
+
+        # Methods first, then the statements in the too big method, without
+        # overlap
+        self.assertEqual(
+            chunks,
+            [
+                ("class A:\n    def a(self):\n        return 1", 44),
+                ("    def b(self):\n        x = 1\n        y = 2", 45),
+                ("        z = 3\n        return x", 30),
+            ],
+        )
+
+    def test_split_paragraphs(self):
+        text = "a" * 9 + "\n" + "b" * 9 + "\n\n" + "c" * 9 + "\n"
+        splitter = CodeTextSplitter(25, 0, self.encoding)
+        self.assertEqual(
+            splitter.split_text(text),
+            [("a" * 9 + "\n" + "b" * 9, 21), ("c" * 9, 10)],
+        )
+
+    def test_split_lines_with_overlap(self):
+        text = "".join(f"line {i}\n" for i in range(6))
+        splitter = CodeTextSplitter(21, 7, self.encoding)
+        self.assertEqual(
+            [chunk for chunk, _ in splitter.split_text(text)],
+            [
+                "line 0\nline 1\nline 2",
+                "line 2\nline 3\nline 4",
+                "line 4\nline 5",
+            ],
+        )
+
+    def test_split_long_line(self):
+        splitter = CodeTextSplitter(10, 2, self.encoding)
+        self.assertEqual(
+            splitter.split_text("a" * 10 + "b" * 10),
+            [("a" * 10, 10), ("aa" + "b" * 8, 10), ("bbbb", 4)],
+        )
+
+    def test_pickle(self):
+        splitter = pickle.loads(pickle.dumps(CodeTextSplitter(10, 2, self.encoding)))
+        self.assertEqual(splitter.split_text("a b"), [("a b", 3)])
+
+        # The tiktoken encoding is loaded again
+        splitter = CodeTextSplitter(10, 2, self.encoding, model_name="ada")
+        with mock.patch("tiktoken.encoding_for_model") as encoding_for_model:
+            encoding_for_model.return_value = self.encoding
+            copy = pickle.loads(pickle.dumps(splitter))
+        encoding_for_model.assert_called_once_with("ada")
+        self.assertIs(copy.encoding, self.encoding)
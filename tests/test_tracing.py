@@ -0,0 +1,110 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from clara.tracing import Tracer, TracingHook, load_hook
+
+
+class RecordingHook(TracingHook):
+    def __init__(self):
+        self.spans = []
+        self.counts = []
+
+    def on_span(self, span):
+        self.spans.append(span.name)
+
+    def on_count(self, name, value):
+        self.counts.append((name, value))
+
+
+class FailingHook(TracingHook):
+    def on_span(self, span):
+        raise ValueError("Unreachable")
+
+
+class TestTracer(unittest.TestCase):
+    def test_only_records_while_recording(self):
+        tracer = Tracer()
+        with tracer.span("ingest"):
+            tracer.count("ingest.files")
+        self.assertFalse(tracer.active)
+        self.assertEqual(tracer.spans, [])
+        self.assertEqual(tracer.counters, {})
+
+        tracer.start()
+        with tracer.span("ingest", path="/code") as span:
+            with tracer.span("ingest.walk"):
+                pass
+            tracer.count("ingest.files", 2)
+            span.attributes["files"] = 2
+        tracer.count("ingest.files")
+        tracer.stop()
+        with tracer.span("chat"):
+            pass
+
+        self.assertEqual(
+            [span.name for span in tracer.spans], ["ingest.walk", "ingest"]
+        )
+        self.assertEqual(tracer.spans[1].attributes, {"path": "/code", "files": 2})
+        self.assertGreaterEqual(tracer.spans[1].duration, tracer.spans[0].duration)
+        self.assertEqual(tracer.counters, {"ingest.files": 3})
+
+    def test_summary(self):
+        tracer = Tracer(recording=True)
+        for _ in range(3):
+            with tracer.span("ingest.embed"):
+                pass
+        with tracer.span("chat"):
+            pass
+
+        summary = tracer.summary()
+
+        self.assertEqual([stage["name"] for stage in summary], ["ingest.embed", "chat"])
+        self.assertEqual(summary[0]["calls"], 3)
+        self.assertGreaterEqual(summary[0]["total"], summary[0]["max"])
+
+    def test_chrome_trace(self):
+        tracer = Tracer()
+        tracer.start()
+        with tracer.span("chat.answer", documents=6):
+            tracer.count("llm.requests")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            tracer.save(path)
+            with open(path) as f:
+                trace = json.load(f)
+
+        (event,) = trace["traceEvents"]
+        self.assertEqual(event["name"], "chat.answer")
+        self.assertEqual(event["cat"], "chat")
+        self.assertEqual(event["ph"], "X")
+        self.assertEqual(event["pid"], os.getpid())
+        self.assertEqual(event["args"], {"documents": 6})
+        self.assertGreaterEqual(event["ts"], 0)
+        self.assertEqual(trace["otherData"]["counters"], {"llm.requests": 1})
+
+    def test_hooks(self):
+        hook = RecordingHook()
+        tracer = Tracer(hooks=[FailingHook(), hook])
+        self.assertTrue(tracer.active)
+
+        with mock.patch("clara.tracing.console") as console:
+            with tracer.span("chat"):
+                tracer.count("llm.tokens", 10)
+
+        console.log.assert_called_once()
+        self.assertEqual(hook.spans, ["chat"])
+        self.assertEqual(hook.counts, [("llm.tokens", 10)])
+        # Not recording
+        self.assertEqual(tracer.spans, [])
+
+    def test_load_hook(self):
+        hook = load_hook(f"{__name__}:RecordingHook")
+        self.assertIsInstance(hook, RecordingHook)
+
+        with self.assertRaises(Exception) as context:
+            load_hook(f"{__name__}:MissingHook")
+        self.assertIn("tracing.hooks", str(context.exception))
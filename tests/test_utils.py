@@ -0,0 +1,31 @@
+import unittest
+
+from clara.utils import prefetch
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_prefetch(self):
+        self.assertEqual(list(prefetch(range(100), maxsize=4)), list(range(100)))
+
+    def test_producer_runs_ahead_up_to_maxsize(self):
+        produced = []
+
+        def produce():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        items = prefetch(produce(), maxsize=4)
+        self.assertEqual(next(items), 0)
+        self.assertLessEqual(len(produced), 7)
+        items.close()
+
+    def test_producer_exception(self):
+        def produce():
+            yield 1
+            raise ValueError("Boom")
+
+        items = prefetch(produce(), maxsize=4)
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(ValueError):
+            next(items)
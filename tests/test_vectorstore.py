@@ -0,0 +1,294 @@
+import os
+import glob
+import tempfile
+import unittest
+
+import numpy as np
+
+from clara.ann import IVFIndex
+from clara.vectorstore import NumpyVectorStore
+from fakes import LetterEmbeddings
+
+
+def add(vectorstore, texts, source):
+    vectors = LetterEmbeddings().embed_documents(texts)
+    vectorstore.add_vectors(
+        [f"{source}:{text}" for text in texts],
+        vectors,
+        texts,
+        [{"source": source} for _ in texts],
+    )
+
+
+class TestNumpyVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_similarity_search(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings())
+        add(vectorstore, ["aaa", "bbb", "aab", "ccc"], "a.py")
+
+        results = vectorstore.similarity_search_with_score("a", k=2)
+        self.assertEqual([doc.page_content for doc, _ in results], ["aaa", "aab"])
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        self.assertEqual(results[0][0].metadata, {"source": "a.py"})
+        self.assertEqual(len(vectorstore.similarity_search("a", k=10)), 4)
+
+        retriever = vectorstore.as_retriever(search_kwargs={"k": 1})
+        self.assertEqual(retriever.get_relevant_documents("b")[0].page_content, "bbb")
+
+    def test_search_with_vectors(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings())
+        add(vectorstore, ["aaa", "bbb", "aab"], "a.py")
+
+        documents, similarities, vectors = vectorstore.search_with_vectors(
+            [1, 0, 0], k=2
+        )
+        self.assertEqual([doc.page_content for doc in documents], ["aaa", "aab"])
+        np.testing.assert_allclose(similarities, [1, 2 / np.sqrt(5)], rtol=1e-5)
+        np.testing.assert_array_equal(vectors, [[3, 0, 0], [2, 1, 0]])
+
+    def test_mmr(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings())
+        add(vectorstore, ["aaa", "aaaa", "aab", "ccc"], "a.py")
+
+        documents = vectorstore.max_marginal_relevance_search(
+            "aaab", k=2, fetch_k=4, lambda_mult=0.1
+        )
+        self.assertEqual(documents[0].page_content, "aab")
+        self.assertNotIn(documents[1].page_content, ("aaa", "aaaa"))
+
+        batch = vectorstore.max_marginal_relevance_search_batch_by_vector(
+            [[3, 1, 0], [0, 0, 1]], k=2, fetch_k=4, lambda_mult=0.1
+        )
+        self.assertEqual(batch[0], documents)
+        self.assertEqual(batch[1][0].page_content, "ccc")
+
+    def test_persist_and_delete(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        add(vectorstore, ["aaa", "bbb"], "a.py")
+        add(vectorstore, ["ccc"], "b.py")
+        vectorstore.set_metadata({"embeddings_dimension": 3})
+        vectorstore.persist()
+
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        self.assertEqual(vectorstore.count(), 3)
+        self.assertEqual(vectorstore.get_sources(), {"a.py", "b.py"})
+        self.assertEqual(vectorstore.get_metadata(), {"embeddings_dimension": 3})
+        self.assertEqual(
+            [
+                doc.page_content
+                for doc in vectorstore.get_documents(["b.py:ccc", "a.py:aaa"])
+            ],
+            ["ccc", "aaa"],
+        )
+
+        vectorstore.delete_sources(["b.py"])
+        self.assertEqual(vectorstore.similarity_search("c", k=1)[0].page_content, "aaa")
+        add(vectorstore, ["abc"], "b.py")
+        vectorstore.persist()
+
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        self.assertEqual(vectorstore.rows, 4)
+        self.assertEqual(vectorstore.similarity_search("c", k=1)[0].page_content, "abc")
+
+    def test_compaction(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        add(vectorstore, ["aaa", "bbb"], "a.py")
+        add(vectorstore, ["ccc"], "b.py")
+        vectorstore.persist()
+        vectorstore.delete_sources(["a.py"])
+        vectorstore.persist()
+
+        self.assertEqual(vectorstore.rows, 1)
+        self.assertEqual(len(glob.glob(os.path.join(self.tmp.name, "*.f32"))), 2)
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        self.assertEqual(vectorstore.rows, 1)
+        ids, texts, _ = vectorstore.get_all()
+        self.assertEqual((ids, texts), (["b.py:ccc"], ["ccc"]))
+        np.testing.assert_array_equal(vectorstore._arrays["vectors"], [[0, 0, 3]])
+
+    def test_uncommitted_rows_are_discarded(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        add(vectorstore, ["aaa"], "a.py")
+        vectorstore.persist()
+        add(vectorstore, ["bbb"], "b.py")
+        # As if the process was killed
+        vectorstore._connection.close()
+
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        self.assertEqual(vectorstore.count(), 1)
+        add(vectorstore, ["ccc"], "c.py")
+        self.assertEqual(vectorstore.similarity_search("c", k=1)[0].page_content, "ccc")
+
+    def test_clear(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        add(vectorstore, ["aaa"], "a.py")
+        vectorstore.clear()
+        vectorstore.persist()
+        self.assertEqual(vectorstore.similarity_search("a"), [])
+        add(vectorstore, ["bb"], "b.py")
+        self.assertEqual(vectorstore.similarity_search("a")[0].page_content, "bb")
+
+    def test_clear_after_compaction(self):
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        add(vectorstore, ["aaa", "bbb"], "a.py")
+        add(vectorstore, ["ccc"], "b.py")
+        vectorstore.persist()
+        vectorstore.delete_sources(["a.py"])
+        vectorstore.persist()
+        self.assertEqual(vectorstore.generation, 1)
+
+        vectorstore.clear()
+        add(vectorstore, ["abc"], "c.py")
+        vectorstore.persist()
+
+        vectorstore = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        self.assertEqual(vectorstore.count(), 1)
+        self.assertEqual(vectorstore.similarity_search("c")[0].page_content, "abc")
+        self.assertEqual(
+            sorted(os.listdir(self.tmp.name)),
+            ["chunks.sqlite", "norms.0.f32", "vectors.0.f32"],
+        )
+
+
+class TestQuantizedNumpyVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        random = np.random.default_rng(0)
+        self.vectors = random.normal(size=(200, 32)).astype(np.float32)
+        self.queries = self.vectors[:20] + random.normal(
+            scale=0.5, size=(20, 32)
+        ).astype(np.float32)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self, persist=True, **kwargs):
+        vectorstore = NumpyVectorStore(
+            LetterEmbeddings(), self.tmp.name if persist else None, **kwargs
+        )
+        if not vectorstore.rows:
+            ids = [str(i) for i in range(len(self.vectors))]
+            vectorstore.add_vectors(
+                ids, self.vectors, ids, [{"source": "a.py"} for _ in ids]
+            )
+            vectorstore.persist()
+        return vectorstore
+
+    def search(self, vectorstore):
+        return [
+            vectorstore.similarity_search_with_score_by_vector(query, k=5)
+            for query in self.queries
+        ]
+
+    def test_int8(self):
+        exact = self.search(self.open(persist=False))
+        self.open(quantization="int8")
+        vectorstore = self.open(quantization="int8")
+        self.assertEqual(vectorstore._arrays["vectors"].dtype, np.int8)
+        self.assertEqual(
+            sorted(os.listdir(self.tmp.name)),
+            ["chunks.sqlite", "norms.0.f32", "scales.0.f32", "vectors.0.i8"],
+        )
+
+        results = self.search(vectorstore)
+        for result, expected in zip(results, exact):
+            self.assertEqual(result[0][0], expected[0][0])
+            np.testing.assert_allclose(
+                [score for _, score in result],
+                [score for _, score in expected],
+                atol=0.02,
+            )
+
+    def test_rescore(self):
+        exact = self.search(self.open(persist=False))
+        vectorstore = self.open(quantization="float16", rescore=True)
+        self.assertIn("full.0.f32", os.listdir(self.tmp.name))
+        for result, expected in zip(self.search(vectorstore), exact):
+            self.assertEqual([doc for doc, _ in result], [doc for doc, _ in expected])
+            np.testing.assert_allclose(
+                [score for _, score in result],
+                [score for _, score in expected],
+                rtol=1e-5,
+            )
+
+    def test_storage_mismatch(self):
+        self.open(quantization="int8")
+        with self.assertRaisesRegex(Exception, "clara clean"):
+            self.open()
+
+
+class TestNumpyVectorStoreANN(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.random = np.random.default_rng(0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def add_random(self, vectorstore, rows, source):
+        vectors = self.random.normal(size=(rows, 8))
+        ids = [f"{source}:{i}" for i in range(rows)]
+        vectorstore.add_vectors(
+            ids, vectors, ids, [{"source": source} for _ in range(rows)]
+        )
+        return vectors
+
+    def open(self, probes=4):
+        return NumpyVectorStore(
+            LetterEmbeddings(),
+            self.tmp.name,
+            ann_index=IVFIndex(lists=4, probes=probes, min_rows=100),
+        )
+
+    def test_ann_search(self):
+        vectorstore = self.open()
+        vectors = self.add_random(vectorstore, 200, "a.py")
+        vectorstore.update_ann_index()
+        self.assertTrue(vectorstore._ann_index.is_trained)
+        self.add_random(vectorstore, 50, "b.py")
+        vectorstore.persist()
+
+        # Probing every cluster, the same as exact search
+        vectorstore = self.open()
+        self.assertEqual(len(vectorstore._ann_index.assignments), 250)
+        exact = NumpyVectorStore(LetterEmbeddings(), self.tmp.name)
+        for vector in vectors[:5]:
+            self.assertEqual(
+                vectorstore.similarity_search_by_vector(vector, k=5),
+                exact.similarity_search_by_vector(vector, k=5),
+            )
+
+        vectorstore._ann_index.probes = 1
+        self.assertEqual(
+            vectorstore.similarity_search_by_vector(vectors[0], k=1)[0].page_content,
+            "a.py:0",
+        )
+
+    def test_ann_compaction(self):
+        vectorstore = self.open()
+        self.add_random(vectorstore, 100, "a.py")
+        vectors = self.add_random(vectorstore, 150, "b.py")
+        vectorstore.update_ann_index()
+        vectorstore.persist()
+        vectorstore.delete_sources(["b.py"])
+        vectorstore.persist()
+        vectorstore.delete_sources(["a.py"])
+        vectors = self.add_random(vectorstore, 10, "c.py")
+        vectorstore.persist()
+
+        vectorstore = self.open()
+        self.assertEqual(vectorstore.rows, 10)
+        self.assertEqual(len(vectorstore._ann_index.assignments), 10)
+        self.assertEqual(
+            vectorstore.similarity_search_by_vector(vectors[3], k=1)[0].page_content,
+            "c.py:3",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+
+from clara.walker import (
+    IgnoreFile,
+    IgnorePattern,
+    IgnoreRules,
+    WildcardMatcher,
+    walk_repository,
+)
+
+
+class TestIgnorePattern(unittest.TestCase):
+    def test_basename_pattern_matches_at_any_depth(self):
+        pattern = IgnorePattern("/repo", "*.log")
+        self.assertTrue(pattern.match("debug.log", is_dir=False))
+        self.assertTrue(pattern.match("a/b/debug.log", is_dir=False))
+        self.assertFalse(pattern.match("debug.py", is_dir=False))
+
+    def test_anchored_pattern(self):
+        pattern = IgnorePattern("/repo", "/build")
+        self.assertTrue(pattern.match("build", is_dir=True))
+        self.assertFalse(pattern.match("src/build", is_dir=True))
+
+    def test_dir_only_pattern(self):
+        pattern = IgnorePattern("/repo", "out/")
+        self.assertTrue(pattern.match("out", is_dir=True))
+        self.assertFalse(pattern.match("out", is_dir=False))
+
+    def test_double_star(self):
+        pattern = IgnorePattern("/repo", "docs/**/generated")
+        self.assertTrue(pattern.match("docs/generated", is_dir=True))
+        self.assertTrue(pattern.match("docs/a/b/generated", is_dir=True))
+        self.assertFalse(pattern.match("src/generated", is_dir=True))
+
+
+class TestIgnoreRules(unittest.TestCase):
+    def _patterns(self, *lines):
+        return [IgnorePattern("/repo", line) for line in lines]
+
+    def test_last_line_wins(self):
+        ignore_file = IgnoreFile(
+            "", self._patterns("*.log", "!keep.log", "out/", "/a/*.log")
+        )
+        self.assertTrue(ignore_file.match("debug.log", "debug.log", is_dir=False))
+        self.assertFalse(ignore_file.match("b/keep.log", "keep.log", is_dir=False))
+        # A later path pattern over a name one
+        self.assertTrue(ignore_file.match("a/keep.log", "keep.log", is_dir=False))
+        self.assertTrue(ignore_file.match("out", "out", is_dir=True))
+        self.assertIsNone(ignore_file.match("out", "out", is_dir=False))
+        self.assertIsNone(ignore_file.match("main.py", "main.py", is_dir=False))
+
+    def test_deeper_file_wins(self):
+        rules = (
+            IgnoreRules()
+            .extend("", self._patterns("*.sql", "/build"))
+            .extend("src/db", self._patterns("!schema.sql", "/build"))
+        )
+        self.assertTrue(rules.is_ignored("query.sql", is_dir=False))
+        self.assertFalse(rules.is_ignored("src/db/schema.sql", is_dir=False))
+        self.assertTrue(rules.is_ignored("src/db/query.sql", is_dir=False))
+        self.assertTrue(rules.is_ignored("build", is_dir=True))
+        self.assertFalse(rules.is_ignored("src/build", is_dir=True))
+        self.assertTrue(rules.is_ignored("src/db/build", is_dir=True))
+
+
+class TestWildcardMatcher(unittest.TestCase):
+    def test_match(self):
+        matcher = WildcardMatcher(("*.py", "*.d.ts", "Dockerfile", "*.m[dk]"))
+        self.assertTrue(matcher.match("main.py"))
+        self.assertTrue(matcher.match("types.d.ts"))
+        self.assertTrue(matcher.match("Dockerfile"))
+        self.assertTrue(matcher.match("README.md"))
+        self.assertFalse(matcher.match("main.pyc"))
+        self.assertFalse(matcher.match("main.ts"))
+
+
+class TestWalkRepository(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        files = {
+            "main.py": "",
+            "README.md": "",
+            "image.png": "",
+            "src/app.js": "",
+            "src/app.min.js": "",
+            "src/generated/schema.py": "",
+            "src/nested/.gitignore": "*.sql\n",
+            "src/nested/query.sql": "",
+            "src/nested/keep.py": "",
+            "node_modules/lib/index.js": "",
+            ".git/hooks/pre-commit.sh": "",
+            ".venv/lib/site.py": "",
+            "env/pyvenv.cfg": "",
+            "env/lib/module.py": "",
+            "notes/todo.md": "",
+            ".gitignore": "*.min.js\ngenerated/\n",
+            ".claraignore": "notes/\n!notes/\n",
+        }
+        for name, content in files.items():
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _walk(self):
+        return [
+            os.path.relpath(path, self.root).replace(os.sep, "/")
+            for path in walk_repository(self.root, ("*.py", "*.js", "*.md", "*.sql"))
+        ]
+
+    def test_walk(self):
+        self.assertEqual(
+            self._walk(),
+            [
+                "README.md",
+                "main.py",
+                "notes/todo.md",
+                "src/app.js",
+                "src/nested/keep.py",
+            ],
+        )
+
+    def test_walk_is_lazy(self):
+        walk = walk_repository(self.root, ("*.py",))
+        self.assertEqual(os.path.basename(next(walk)), "main.py")
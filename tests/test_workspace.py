@@ -0,0 +1,145 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from langchain.indexes.vectorstore import VectorStoreIndexWrapper
+
+from clara.index import RepositoryIndex
+from clara.lexical import LexicalIndex
+from clara.vectorstore import NumpyVectorStore
+from clara.workspace import Workspace, WorkspaceRetriever, read_workspace
+from fakes import LetterEmbeddings
+
+
+REPOSITORIES = {
+    "/code/api": ["aaa", "abc", "load_config"],
+    "/code/web": ["aab", "bbb", "ccc"],
+}
+
+
+def load(index):
+    """Open an in-memory index with the texts of the repository."""
+    texts = REPOSITORIES[index.path]
+    ids = [f"{index.path}:{text}" for text in texts]
+    sources = [f"{index.path}/{text}.py" for text in texts]
+    vectorstore = NumpyVectorStore(LetterEmbeddings())
+    vectorstore.add_vectors(
+        ids,
+        LetterEmbeddings().embed_documents(texts),
+        texts,
+        [{"source": source} for source in sources],
+    )
+    index.index = VectorStoreIndexWrapper(vectorstore=vectorstore)
+    index.lexical_index = LexicalIndex()
+    index.lexical_index.add(ids, sources, texts)
+
+
+@mock.patch("clara.workspace.get_embeddings", LetterEmbeddings)
+@mock.patch.object(RepositoryIndex, "load", autospec=True, side_effect=load)
+class TestWorkspace(unittest.TestCase):
+    def _retriever(self, workspace, **kwargs):
+        return WorkspaceRetriever(workspace, **{"k": 2, "fetch_k": 2, **kwargs})
+
+    def test_merges_results(self, load):
+        workspace = Workspace(list(REPOSITORIES), memory_budget=1 << 30)
+
+        documents = self._retriever(workspace).get_relevant_documents("aaaa")
+
+        self.assertEqual([doc.page_content for doc in documents], ["aaa", "aab"])
+        self.assertEqual(
+            [doc.metadata for doc in documents],
+            [
+                {"source": "/code/api/aaa.py", "repository": "api"},
+                {"source": "/code/web/aab.py", "repository": "web"},
+            ],
+        )
+        self.assertEqual(load.call_count, 2)
+
+        # Already open
+        self._retriever(workspace).get_relevant_documents("bbbb")
+        self.assertEqual(load.call_count, 2)
+
+    def test_mmr(self, load):
+        workspace = Workspace(list(REPOSITORIES), memory_budget=1 << 30)
+        retriever = self._retriever(workspace, fetch_k=3, lambda_mult=0.1)
+
+        documents = retriever.get_relevant_documents("aaab")
+
+        # "aaa" is more similar, but too close to "aab"
+        self.assertEqual([doc.page_content for doc in documents], ["aab", "abc"])
+
+    def test_hybrid(self, load):
+        workspace = Workspace(list(REPOSITORIES), memory_budget=1 << 30)
+        retriever = self._retriever(workspace, k=1, lexical_fetch_k=2)
+
+        # Only about a symbol, found by the lexical index of one repository
+        documents = retriever.get_relevant_documents("`load_config`")
+        self.assertEqual(documents[0].page_content, "load_config")
+        self.assertEqual(documents[0].metadata["repository"], "api")
+
+        documents = retriever.get_relevant_documents("where is bbb?")
+        self.assertEqual(documents[0].page_content, "bbb")
+
+    @mock.patch("clara.workspace.get_storage_size", lambda path: 100)
+    def test_ingest_changed(self, load):
+        workspace = Workspace(list(REPOSITORIES), memory_budget=1 << 30)
+        up_to_date = {"/code/api": True, "/code/web": False}
+
+        with mock.patch.multiple(
+            RepositoryIndex,
+            is_up_to_date=mock.DEFAULT,
+            ingest=mock.DEFAULT,
+            persist=mock.DEFAULT,
+            autospec=True,
+        ) as methods:
+            methods["is_up_to_date"].side_effect = lambda index: up_to_date[index.path]
+            methods["ingest"].return_value = True
+            workspace.ingest()
+
+        self.assertEqual(
+            [index.path for (index,), _ in methods["ingest"].call_args_list],
+            ["/code/web"],
+        )
+        methods["persist"].assert_called_once()
+        self.assertEqual(list(workspace._open), ["/code/web"])
+        for index in workspace.indexes.values():
+            self.assertIs(index.embeddings, workspace.embeddings)
+
+    @mock.patch("clara.workspace.get_storage_size", lambda path: 100)
+    def test_memory_budget(self, load):
+        workspace = Workspace(list(REPOSITORIES), memory_budget=150, concurrency=1)
+        retriever = self._retriever(workspace)
+
+        retriever.get_relevant_documents("aaaa")
+
+        # Only the last one used is kept open
+        self.assertEqual(list(workspace._open), ["/code/web"])
+        self.assertIsNone(workspace.indexes["/code/api"].index)
+        self.assertEqual(load.call_count, 2)
+
+        retriever.get_relevant_documents("aaaa")
+        self.assertEqual(load.call_count, 4)
+
+
+class TestReadWorkspace(unittest.TestCase):
+    def test_read_workspace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            file_path = os.path.join(tmp, "services.txt")
+            with open(file_path, "w") as f:
+                f.write("# Services\napi\n\n../web\n/code/lib\n")
+
+            self.assertEqual(
+                read_workspace(file_path),
+                [
+                    os.path.join(tmp, "api"),
+                    os.path.join(os.path.dirname(tmp), "web"),
+                    "/code/lib",
+                ],
+            )
+
+    def test_names(self):
+        self.assertEqual(
+            Workspace._get_names(["/a/api", "/b/api", "/a/web"]),
+            {"/a/api": "/a/api", "/b/api": "/b/api", "/a/web": "web"},
+        )